@@ -0,0 +1,14 @@
+from lib.args_parser import parse_args_benchmark
+from lib.benchmark import run_benchmark
+
+
+def main():
+    args = parse_args_benchmark()
+    try:
+        run_benchmark(args)
+    except KeyboardInterrupt:
+        print("\nBenchmark stopped by user.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,41 @@
+import logging
+from lib.args_parser import parse_args_emulator
+from lib.emulator import LossyLink
+
+
+def main():
+    args = parse_args_emulator()
+    level = logging.INFO if not args.quiet else logging.WARNING
+    if args.verbose:
+        level = logging.DEBUG
+    logging.basicConfig(format="%(levelname)s: %(message)s", level=level)
+
+    link = LossyLink(
+        args.target,
+        loss=args.loss,
+        delay=args.delay / 1000,
+        jitter=args.jitter / 1000,
+        reorder=args.reorder,
+        duplicate=args.duplicate,
+        corrupt=args.corrupt,
+        rate=args.rate * 1e6 / 8 if args.rate else None,
+        queue_limit=args.queue,
+        seed=args.seed,
+        host=args.host,
+        front_port=args.port,
+    )
+    print(
+        "Emulating link {}:{} -> {}:{} (replies from {}:{})".format(
+            *link.front_addr, *args.target, *link.back_addr
+        )
+    )
+    try:
+        link.run()
+    except KeyboardInterrupt:
+        print(f"\nEmulator stopped: {link.stats()}")
+    finally:
+        link.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,4 +1,13 @@
 import argparse
+import os
+from protocols.selective_repeat import CHUNK_SIZE, WINDOW_SIZE
+from protocols.engines import ENGINES
+from protocols.congestion import CONGESTION_CONTROLLERS, DEFAULT_CONGESTION_CONTROL
+from protocols.checksum import CRC32, CRC32C, available_checksums, preferred_checksum
+from protocols.compression import LZ4, ZLIB, ZSTD, available_compressions
+from protocols.fec import ADAPTIVE, MAX_BLOCK_SIZE, MIN_BLOCK_SIZE
+from lib.pmtu import MAX_CHUNK_SIZE, MIN_CHUNK_SIZE
+from lib.emulator import QUEUE_LIMIT
 
 
 def parse_args_server():
@@ -12,8 +21,83 @@ def parse_args_server():
     parser.add_argument("-H", "--host", help="server IP address", required=True)
     parser.add_argument("-p", "--port", help="server port", type=int, required=True)
     parser.add_argument("-s", "--storage", help="storage dir path")
-    parser.add_argument("-r", "--protocol", help="error recovery protocol", type=str)
+    parser.add_argument(
+        "-r", "--protocol", help="error recovery protocol", choices=list(ENGINES), type=str
+    )
+    parser.add_argument(
+        "-w", "--window", help="window size of sr, gbn and adaptive", type=int, default=WINDOW_SIZE
+    )
+    parser.add_argument(
+        "--cc",
+        help="selective repeat congestion control",
+        choices=list(CONGESTION_CONTROLLERS),
+        default=DEFAULT_CONGESTION_CONTROL,
+    )
+    parser.add_argument(
+        "--mode",
+        help="threads: one thread and socket per transfer, async: single-socket asyncio server",
+        choices=["threads", "async"],
+        default="threads",
+    )
+    parser.add_argument(
+        "--workers",
+        help="number of server processes sharing the port (SO_REUSEPORT)",
+        type=int,
+        default=1,
+    )
+    parser.add_argument(
+        "--rate",
+        type=float,
+        help="cap the send rate of each selective repeat transfer in Mbit/s",
+    )
+    parser.add_argument(
+        "--total-rate",
+        type=float,
+        help="cap the send rate of the whole server in Mbit/s, shared fairly between "
+        + "downloads (per worker process)",
+    )
+    parser.add_argument(
+        "--client-rate",
+        type=float,
+        help="cap the send rate towards each client IP in Mbit/s (per worker process)",
+    )
+    parser.add_argument(
+        "--max-sessions",
+        type=int,
+        help="sessions served at once (per worker process); new ones wait or get BUSY",
+    )
+    parser.add_argument(
+        "--max-queued",
+        type=int,
+        default=0,
+        help="sessions that wait for a free slot once --max-sessions is reached "
+        + "(default 0: reject them right away)",
+    )
+    parser.add_argument(
+        "--file-cache",
+        metavar="MB",
+        type=int,
+        help="keep up to this many MB of shared file mappings for downloads once idle "
+        + "(default 1024, 0: only share them between concurrent downloads)",
+    )
+    parser.add_argument(
+        "--stats-file", metavar="FILEPATH", help="write Prometheus text metrics to this file"
+    )
+    parser.add_argument(
+        "--stats-port", type=int, help="serve Prometheus metrics on 127.0.0.1:PORT/metrics"
+    )
     args = parser.parse_args()
+    if args.workers < 1:
+        parser.error("--workers must be at least 1")
+    if args.file_cache is not None and args.file_cache < 0:
+        parser.error("--file-cache cannot be negative")
+    for option in ("total_rate", "client_rate"):
+        if getattr(args, option) is not None and getattr(args, option) <= 0:
+            parser.error(f"--{option.replace('_', '-')} must be positive")
+    if args.max_sessions is not None and args.max_sessions < 1:
+        parser.error("--max-sessions must be at least 1")
+    if args.max_queued < 0:
+        parser.error("--max-queued cannot be negative")
     return args
 
 
@@ -48,7 +132,259 @@ def parse_args_client(command_type):
             "-d", "--dst", metavar="FILEPATH", help="destination file path"
         )
 
-    parser.add_argument("-r", "--protocol", help="error recovery protocol")
+    parser.add_argument("-r", "--protocol", choices=list(ENGINES), help="error recovery protocol")
+    parser.add_argument(
+        "-w", "--window", type=int, default=WINDOW_SIZE, help="window size of sr, gbn and adaptive"
+    )
+    parser.add_argument(
+        "--cc",
+        choices=list(CONGESTION_CONTROLLERS),
+        default=DEFAULT_CONGESTION_CONTROL,
+        help="selective repeat congestion control",
+    )
+    parser.add_argument(
+        "--restart",
+        action="store_true",
+        help="ignore the progress of an interrupted transfer and start over",
+    )
+    parser.add_argument(
+        "--streams",
+        type=int,
+        default=1,
+        help="split the file in byte ranges and move them over this many sessions",
+    )
+    files_help = "transfer every file listed in FILEPATH (one per line) over a single session"
+    if command_type == "upload":
+        files_help += " (a directory as --src does the same with its files)"
+    parser.add_argument("--files", metavar="FILEPATH", help=files_help)
+    parser.add_argument(
+        "--delta",
+        action="store_true",
+        help="only move the chunks that differ from the copy on the other side",
+    )
+    parser.add_argument(
+        "--parallel",
+        choices=["threads", "processes"],
+        default="threads",
+        help="run the streams on threads or on processes",
+    )
+    parser.add_argument(
+        "--checksum",
+        choices=["auto", CRC32C, CRC32, "none"],
+        default="auto",
+        help="per-packet checksum (auto: crc32c if the crc32c module is installed, else crc32)",
+    )
+    add_compression_argument(parser)
+    add_fec_argument(parser)
+    parser.add_argument(
+        "--chunk-size",
+        metavar="auto|BYTES",
+        type=chunk_size_argument,
+        default="auto",
+        help="data bytes per packet (auto: fit the path MTU probed after the handshake)",
+    )
+    parser.add_argument(
+        "--jumbo",
+        action="store_true",
+        help="with --chunk-size auto, also probe jumbo frames and loopback-sized datagrams",
+    )
+    add_pacing_arguments(parser, "--rate")
+
+    args = parser.parse_args()
+    if args.streams < 1:
+        parser.error("--streams must be at least 1")
+    batch = args.files is not None or (command_type == "upload" and os.path.isdir(args.src or ""))
+    if batch and args.streams > 1:
+        parser.error("--streams cannot be combined with a batch of files")
+    if args.delta and (batch or args.streams > 1):
+        parser.error("--delta works on a single file over a single session")
+    if args.checksum == "auto":
+        args.checksum = preferred_checksum()
+    elif args.checksum == "none":
+        args.checksum = None
+    elif args.checksum not in available_checksums():
+        parser.error(f"--checksum {args.checksum} needs the {args.checksum} module")
+    validate_compression(parser, args)
+    return args
+
+
+def add_compression_argument(parser):
+    parser.add_argument(
+        "--compress",
+        nargs="?",
+        const=ZLIB,
+        choices=[ZLIB, ZSTD, LZ4],
+        help="compress each chunk that shrinks (default zlib; zstd/lz4 need their modules)",
+    )
+
+
+def add_fec_argument(parser):
+    parser.add_argument(
+        "--fec",
+        metavar="K|auto",
+        type=fec_block_size,
+        help="selective repeat: send an XOR parity packet every K data packets "
+        + "(auto: K follows the measured loss rate)",
+    )
+
+
+def fec_block_size(value):
+    if value == ADAPTIVE:
+        return value
+    try:
+        block_size = int(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"invalid FEC block size: {value}")
+    if not MIN_BLOCK_SIZE <= block_size <= MAX_BLOCK_SIZE:
+        raise argparse.ArgumentTypeError(
+            f"FEC block size must be between {MIN_BLOCK_SIZE} and {MAX_BLOCK_SIZE}"
+        )
+    return block_size
+
+
+def add_pacing_arguments(parser, rate_option):
+    parser.add_argument(
+        rate_option,
+        type=float,
+        help="cap the selective repeat send rate in Mbit/s (the server may lower it)",
+    )
+    parser.add_argument(
+        "--no-pacing",
+        action="store_true",
+        help="send each window as a burst instead of spreading it over the RTT",
+    )
+
+
+def chunk_size_argument(value):
+    if value == "auto":
+        return value
+    try:
+        chunk_size = int(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"invalid chunk size: {value}")
+    if not MIN_CHUNK_SIZE <= chunk_size <= MAX_CHUNK_SIZE:
+        raise argparse.ArgumentTypeError(
+            f"chunk size must be between {MIN_CHUNK_SIZE} and {MAX_CHUNK_SIZE}"
+        )
+    return chunk_size
+
+
+def validate_compression(parser, args):
+    if args.compress is not None and args.compress not in available_compressions():
+        module = "zstandard" if args.compress == ZSTD else args.compress
+        parser.error(f"--compress {args.compress} needs the {module} module")
+
+
+def add_link_arguments(parser):
+    parser.add_argument("--delay", type=float, default=0.0, help="one-way delay in ms")
+    parser.add_argument("--jitter", type=float, default=0.0, help="delay jitter in ms")
+    parser.add_argument(
+        "--reorder", type=float, default=0.0, help="probability of reordering a packet"
+    )
+    parser.add_argument(
+        "--duplicate", type=float, default=0.0, help="probability of duplicating a packet"
+    )
+    parser.add_argument(
+        "--corrupt", type=float, default=0.0, help="probability of flipping a byte in a packet"
+    )
+    parser.add_argument("--rate", type=float, help="bandwidth cap in Mbit/s")
+    parser.add_argument(
+        "--queue",
+        type=parse_size,
+        default=QUEUE_LIMIT,
+        help="bytes queued per direction behind --rate before dropping (K/M)",
+    )
+    parser.add_argument("--seed", type=int, default=1, help="random seed")
+
+
+def parse_size(value):
+    units = {"K": 1024, "M": 1024**2, "G": 1024**3}
+    value = value.strip().upper()
+    if value and value[-1] in units:
+        return int(float(value[:-1]) * units[value[-1]])
+    return int(value)
 
+
+def parse_args_emulator():
+    parser = argparse.ArgumentParser(
+        prog="emulator", description="Lossy UDP link emulator (proxy)"
+    )
+    parser.add_argument(
+        "-v", "--verbose", help="increase output verbosity", action="store_true"
+    )
+    parser.add_argument(
+        "-q", "--quiet", help="decrease output verbosity", action="store_true"
+    )
+    parser.add_argument("-H", "--host", default="127.0.0.1", help="listen IP address")
+    parser.add_argument("-p", "--port", type=int, required=True, help="listen port")
+    parser.add_argument(
+        "-t", "--target", metavar="HOST:PORT", required=True, help="destination address"
+    )
+    parser.add_argument("--loss", type=float, default=0.0, help="packet loss probability")
+    add_link_arguments(parser)
+    args = parser.parse_args()
+    host, _, port = args.target.rpartition(":")
+    args.target = (host or "127.0.0.1", int(port))
+    return args
+
+
+def parse_args_benchmark():
+    parser = argparse.ArgumentParser(
+        prog="benchmark", description="Throughput benchmark over an emulated lossy link"
+    )
+    parser.add_argument(
+        "-v", "--verbose", help="increase output verbosity", action="store_true"
+    )
+    parser.add_argument(
+        "-r", "--protocols", nargs="+", choices=list(ENGINES), default=list(ENGINES)
+    )
+    parser.add_argument(
+        "--sizes", nargs="+", type=parse_size, default=[64 * 1024, 1024**2], help="file sizes (K/M/G)"
+    )
+    parser.add_argument(
+        "--loss", nargs="+", type=float, default=[0.0, 0.01, 0.05], help="loss probabilities"
+    )
+    parser.add_argument(
+        "-w", "--windows", nargs="+", type=int, default=[WINDOW_SIZE], help="window sizes"
+    )
+    parser.add_argument(
+        "--cc",
+        choices=list(CONGESTION_CONTROLLERS),
+        default=DEFAULT_CONGESTION_CONTROL,
+        help="selective repeat congestion control",
+    )
+    parser.add_argument(
+        "--checksum",
+        choices=[CRC32C, CRC32],
+        help="per-packet checksum (default: none)",
+    )
+    add_compression_argument(parser)
+    add_fec_argument(parser)
+    parser.add_argument(
+        "--chunk-size",
+        metavar="BYTES",
+        type=int,
+        default=CHUNK_SIZE,
+        help="data bytes per packet",
+    )
+    add_pacing_arguments(parser, "--send-rate")
+    parser.add_argument(
+        "--content",
+        choices=["random", "text"],
+        default="random",
+        help="source file content: random bytes or compressible log-like text",
+    )
+    add_link_arguments(parser)
+    parser.add_argument("--repeat", type=int, default=1, help="runs per configuration")
+    parser.add_argument(
+        "--timeout", type=float, default=120.0, help="seconds before a run is aborted"
+    )
+    parser.add_argument("--csv", metavar="FILEPATH", help="write results as CSV")
+    parser.add_argument("--json", metavar="FILEPATH", help="write results as JSON")
     args = parser.parse_args()
+    if args.checksum is not None and args.checksum not in available_checksums():
+        parser.error(f"--checksum {args.checksum} needs the {args.checksum} module")
+    validate_compression(parser, args)
+    if not MIN_CHUNK_SIZE <= args.chunk_size <= MAX_CHUNK_SIZE:
+        parser.error(f"--chunk-size must be between {MIN_CHUNK_SIZE} and {MAX_CHUNK_SIZE}")
     return args
@@ -0,0 +1,590 @@
+import asyncio
+import collections
+import itertools
+import logging
+import os
+import socket
+import time
+from lib.server import (
+    HANDSHAKE_PARAMS,
+    SHUTDOWN_GRACE,
+    bind_server_socket,
+    command_reply,
+    create_file_cache,
+    download_offset,
+    download_reply,
+    download_source,
+    finish_upload,
+    legacy_client,
+    negotiate_options,
+    range_params,
+    stat_command,
+    log_download_complete,
+    log_upload_complete,
+    prepare_upload,
+    parse_request,
+    setup_logging,
+    shared_mapping,
+    upload_reply,
+    validate_storage,
+)
+from lib.commands import encode_params, int_param
+from lib.stats import ServerStats, start_exporter
+from lib.chunk_store import ChunkStore
+from lib.scheduler import (
+    ADMITTED,
+    BUSY_RETRY,
+    QUEUE_TIMEOUT,
+    QUEUED,
+    create_admission,
+    create_scheduler,
+)
+from protocols.batch_io import MAX_DATAGRAM_SIZE, BatchedSocket, datagram_length
+from protocols.journal import open_destination
+from lib.pmtu import PROBE, probe_reply
+from lib.session import SESSION_IDLE_TIMEOUT, RecentHellos, fast_command
+from protocols.package import is_control
+from protocols.pacing import rate_from_mbits
+from protocols.engines import get_engine
+from protocols.selective_repeat import CHUNK_SIZE
+
+# Servidor de un solo socket: todas las sesiones comparten el puerto del servidor.
+# Los datagramas de datos no llevan id de sesion, asi que se demultiplexa por la
+# direccion del cliente (cada transferencia usa su propio socket del lado del cliente).
+# El id de sesion viaja en el HI_ACK y distingue sesiones sucesivas de una misma direccion.
+# El socket se lee por lotes (recvmmsg) y lo que mandan las sesiones en una vuelta del
+# loop sale en un solo sendmmsg.
+# Con techos de tasa los datagramas de los downloads pasan por el scheduler, que los despacha
+# por turnos a medida que hay tasa disponible (ver lib/scheduler.py).
+
+HANDSHAKE_TIMEOUT = 2.0
+IDLE_TIMEOUT = 30.0
+LINGER_TIME = 2.0  # el receiver sigue respondiendo EOFs repetidos un rato despues de terminar
+# un solo socket recibe el trafico de todas las sesiones: necesita buffers grandes
+SOCKET_BUFFER_SIZE = 4 * 1024 * 1024
+STOP_POLL_INTERVAL = 0.5
+
+
+class Session:
+    def __init__(self, transport, addr, session_id):
+        self.transport = transport
+        self.addr = addr
+        self.session_id = session_id
+        self.inbox = collections.deque()
+        self.waiter = None
+        self.task = None
+        # Durante la transferencia los datagramas van directo a la maquina de estados
+        # desde el callback del socket; la corrutina solo se despierta por timers.
+        self.endpoint = None
+        self.wake_at = None
+        self.error = None
+        self.last_activity = time.monotonic()
+        self.flow = None  # turnos de la sesion en el scheduler, si hay techos de tasa
+        self.hello = None  # el HI que abrio la sesion
+        # ultima respuesta del handshake: se repite si el cliente repite el HI
+        self.handshake_reply = None
+        self.established = False
+
+    def feed(self, data):
+        endpoint = self.endpoint
+        if endpoint is None or is_control(data):
+            # los datagramas llegan como vistas del buffer de recepcion: se copian para guardarlos
+            # (un comando durante la transferencia es el siguiente de una sesion persistente)
+            self.inbox.append(bytes(data))
+            self._wake()
+            return
+
+        now = time.monotonic()
+        self.last_activity = now
+        try:
+            endpoint.on_datagram(data, now)
+            endpoint.poll(now)
+        except Exception as e:
+            self.error = e
+            self._wake()
+            return
+
+        # despierta a la corrutina si termino o si hay un timer antes del que esta esperando
+        deadline = endpoint.next_deadline()
+        if endpoint.done or (
+            deadline is not None and (self.wake_at is None or deadline < self.wake_at)
+        ):
+            self._wake()
+
+    def sendto(self, data):
+        self.transport.sendto(data, self.addr)
+
+    def reply(self, data):
+        # respuesta a un comando; las del handshake (hasta el primer comando) se guardan
+        if not self.established:
+            self.handshake_reply = data
+        self.sendto(data)
+
+    def send_data(self, data):
+        # datagramas de un download: esperan su turno en el scheduler
+        self.transport.sendto(data, self.addr, self.flow)
+
+    def _wake(self):
+        if self.waiter is not None and not self.waiter.done():
+            self.waiter.set_result(None)
+
+    async def wait(self, timeout):
+        # True si hay datagramas en el inbox, False si vencio el timeout
+        if self.inbox:
+            await asyncio.sleep(0)  # cede el loop al resto de las sesiones
+            return True
+
+        loop = asyncio.get_running_loop()
+        self.waiter = loop.create_future()
+        handle = loop.call_later(max(0.0, timeout), self._wake) if timeout is not None else None
+        try:
+            await self.waiter
+        finally:
+            self.waiter = None
+            if handle is not None:
+                handle.cancel()
+        return bool(self.inbox)
+
+    async def recv(self, timeout):
+        # un endpoint ya terminado puede despertar la espera (EOF repetido entre comandos)
+        deadline = time.monotonic() + timeout
+        while not await self.wait(deadline - time.monotonic()):
+            if time.monotonic() >= deadline:
+                return None
+        return self.inbox.popleft()
+
+
+class AsyncServer:
+    def __init__(
+        self,
+        storage_dir,
+        protocol,
+        window_size,
+        congestion,
+        stats=None,
+        rate_limit=None,
+        chunks=None,
+        files=None,
+        scheduler=None,
+        admission=None,
+    ):
+        self.storage_dir = storage_dir
+        self.protocol = protocol
+        self.engine = get_engine(protocol)
+        self.window_size = window_size
+        self.congestion = congestion
+        self.stats = stats
+        self.rate_limit = rate_limit  # techo de tasa por transferencia, en bytes/s
+        self.chunks = chunks
+        self.files = files  # mapeos compartidos de los archivos que se mandan
+        self.scheduler = scheduler
+        self.admission = admission
+        self.io = None
+        self.server_port = None
+        self.flush_scheduled = False
+        self.dispatch_handle = None
+        self.sessions = {}
+        self.session_ids = itertools.count(1)
+        self.recent = RecentHellos()
+        self.closing = False
+
+    def attach(self, sock):
+        sock.setblocking(False)
+        self.io = BatchedSocket(sock)
+        self.server_port = sock.getsockname()[1]
+        asyncio.get_running_loop().add_reader(sock.fileno(), self.read_ready)
+
+    def detach(self):
+        asyncio.get_running_loop().remove_reader(self.io.sock.fileno())
+        self.flush()
+
+    def read_ready(self):
+        try:
+            datagrams = self.io.recv_available(MAX_DATAGRAM_SIZE)
+        except OSError as e:
+            self.error_received(e)
+            return
+        for data, addr in datagrams:
+            self.datagram_received(data, addr)
+
+    def sendto(self, data, addr, flow=None):
+        # las sesiones hacen de "transport": se encola y se manda todo junto al final de la vuelta
+        if flow is not None:
+            self.scheduler.submit(flow, datagram_length(data), (data, addr))
+            self.schedule_dispatch()
+            return
+        self.io.send(data, addr)
+        if not self.flush_scheduled:
+            self.flush_scheduled = True
+            asyncio.get_running_loop().call_soon(self.flush)
+
+    def schedule_dispatch(self, delay=0.0):
+        # un despacho ya programado antes alcanza; uno mas tarde se adelanta
+        loop = asyncio.get_running_loop()
+        when = loop.time() + max(0.0, delay)
+        if self.dispatch_handle is not None:
+            if self.dispatch_handle.when() <= when:
+                return
+            self.dispatch_handle.cancel()
+        self.dispatch_handle = loop.call_at(when, self.dispatch)
+
+    def dispatch(self):
+        self.dispatch_handle = None
+        granted, wake = self.scheduler.dispatch()
+        for data, addr in granted:
+            self.io.send(data, addr)
+        if granted:
+            self.flush()
+        if wake is not None:
+            self.schedule_dispatch(wake - time.monotonic())
+
+    def flush(self):
+        self.flush_scheduled = False
+        try:
+            self.io.flush()
+        except OSError as e:
+            self.error_received(e)
+
+    def datagram_received(self, data, addr):
+        session = self.sessions.get(addr)
+        if session is not None:
+            if data[:2] != b"HI":
+                session.feed(data)
+                return
+            if data == session.hello:
+                # se perdio la respuesta del handshake y el cliente repite el HI
+                if session.handshake_reply is not None:
+                    session.sendto(session.handshake_reply)
+                return
+            # otro HI desde la misma direccion (otro nonce, ver lib/session.py): el cliente ya
+            # dejo esa sesion, que se corta aunque este esperando EOFs repetidos
+            logging.debug(f"New HI from {addr[0]}:{addr[1]}, closing session {session.session_id}")
+            self.forget(session)
+            session.task.cancel()
+
+        # solo un HI abre una sesion: los datagramas sueltos no consumen recursos
+        if data[:2] != b"HI":
+            logging.debug(f"Ignoring datagram from unknown client {addr[0]}:{addr[1]}")
+            return
+        if self.closing:
+            logging.debug(f"Server shutting down, ignoring HI from {addr[0]}:{addr[1]}")
+            return
+        if self.recent.duplicate(addr, data):
+            logging.debug(f"Ignoring repeated HI from {addr[0]}:{addr[1]}")
+            return
+
+        session = Session(self, addr, next(self.session_ids))
+        session.hello = bytes(data)
+        self.sessions[addr] = session
+        session.task = asyncio.get_running_loop().create_task(self.handle_session(session))
+
+    def error_received(self, exc):
+        logging.debug(f"Socket error: {exc}")
+
+    async def handle_session(self, session):
+        client_ip, client_port = session.addr
+        if not await self.admit(session):
+            self.forget(session)
+            return
+        if self.scheduler is not None:
+            session.flow = self.scheduler.flow(client_ip)
+        logging.info(
+            f"New connection from {client_ip}:{client_port} (session {session.session_id})"
+        )
+        if self.stats is not None:
+            self.stats.session_started()
+        try:
+            # handshake rapido: el HI ya trae el comando (ver lib/session.py)
+            command = fast_command(session.hello)
+            if command is not None:
+                logging.info(
+                    f"Fast handshake with {client_ip}:{client_port}, session {session.session_id}"
+                )
+            elif not await self.handshake(session):
+                logging.warning(f"Handshake failed with {client_ip}:{client_port}")
+                self.count("failed")
+                return
+            else:
+                logging.info(
+                    f"Handshake successful with {client_ip}:{client_port}, session {session.session_id}"
+                )
+            await self.handle_request(session, command)
+        except Exception as e:
+            logging.error(f"Error handling request from {client_ip}:{client_port}: {str(e)}")
+            self.count("failed")
+        finally:
+            self.forget(session)
+            self.recent.add(session.addr, session.hello)
+            if session.flow is not None:
+                self.scheduler.release(session.flow)
+            if self.admission is not None:
+                self.admission.leave()
+            if self.stats is not None:
+                self.stats.session_finished()
+
+    def forget(self, session):
+        if self.sessions.get(session.addr) is session:
+            del self.sessions[session.addr]
+
+    async def admit(self, session):
+        # con el server lleno la sesion espera un lugar o se rechaza; False si no entra
+        if self.admission is None:
+            return True
+        admitted = asyncio.get_running_loop().create_future()
+
+        def on_admit():
+            if not admitted.done():
+                admitted.set_result(None)
+
+        status, position = self.admission.request(on_admit)
+        if status == ADMITTED:
+            return True
+        client_ip, client_port = session.addr
+        if status == QUEUED:
+            logging.info(f"Server full, {client_ip}:{client_port} queued at position {position}")
+            self.count("sessions_queued")
+            session.reply(encode_params("QUEUED", {"position": position}))
+            try:
+                await asyncio.wait_for(asyncio.shield(admitted), QUEUE_TIMEOUT)
+                return True
+            except asyncio.TimeoutError:
+                if not self.admission.cancel(on_admit):
+                    return True
+            except asyncio.CancelledError:
+                # la reemplazo un HI nuevo del mismo cliente mientras esperaba lugar
+                if not self.admission.cancel(on_admit):
+                    self.admission.leave()
+                raise
+        logging.warning(f"Server full, rejecting {client_ip}:{client_port}")
+        self.count("sessions_rejected")
+        session.reply(encode_params("BUSY", {"retry": BUSY_RETRY}))
+        return False
+
+    async def handshake(self, session):
+        hi_ack = encode_params(f"HI_ACK:{session.session_id}", HANDSHAKE_PARAMS)
+        session.reply(hi_ack)
+        while True:
+            received = await session.recv(HANDSHAKE_TIMEOUT)
+            if received is None:
+                return False
+            if received.startswith(b"ACK"):
+                return True
+            if received.startswith(PROBE):
+                # se perdio el ACK, pero el cliente solo prueba el MTU despues de mandarlo
+                session.inbox.appendleft(received)
+                return True
+            if received.startswith(b"HI"):
+                # se perdio el HI_ACK y el cliente reintenta
+                session.sendto(hi_ack)
+                continue
+            logging.error("Invalid ACK message")
+            return False
+
+    async def handle_request(self, session, msg=None):
+        # msg: el comando que ya vino en el HI (handshake rapido)
+        client_ip, client_port = session.addr
+        if msg is None:
+            msg = await session.recv(HANDSHAKE_TIMEOUT)
+            while msg is not None and msg.startswith(PROBE):
+                session.sendto(probe_reply(msg))
+                msg = await session.recv(HANDSHAKE_TIMEOUT)
+        if msg is None:
+            logging.error(f"Timeout waiting for command from {client_ip}:{client_port}")
+            return
+        # con keep=1 la sesion sigue con otro comando; el endpoint que termino queda conectado
+        # y contesta los EOF repetidos mientras se espera el siguiente
+        while msg is not None:
+            params = await self.handle_command(session, msg)
+            session.established = True
+            if int_param(params, "keep") != 1:
+                return
+            msg = await session.recv(SESSION_IDLE_TIMEOUT)
+
+    async def handle_command(self, session, msg):
+        # atiende un comando de la sesion y devuelve sus parametros
+        client_ip, client_port = session.addr
+        server_port = self.server_port
+        command, filename, params = parse_request(msg)
+        legacy = legacy_client(params)
+        options = negotiate_options(self.protocol, params, self.rate_limit, self.window_size)
+        chunk_size = options["chunk"] or CHUNK_SIZE
+        window_size = options["window"] or self.window_size
+        loop = asyncio.get_running_loop()
+
+        if command == "upload":
+            filepath = os.path.join(self.storage_dir, filename)
+            logging.info(f"Upload request for '{filename}' from {client_ip}:{client_port}")
+            start, _ = range_params(params)
+            if self.files is not None and start is None:
+                self.files.invalidate(filepath)
+            destination, journal, end = prepare_upload(filepath, filename, params, self.chunks)
+            if journal is not None:
+                # los checkpoints hacen fsync: fuera del loop
+                journal.executor = lambda save: loop.run_in_executor(None, save)
+            with open_destination(destination, journal, start) as f:
+                endpoint = self.engine.receiver(
+                    f,
+                    session.sendto,
+                    window_size=window_size,
+                    file_size=end,
+                    journal=journal,
+                    checksum=options["checksum"],
+                    compression=options["compress"],
+                    fec=options["fec"] is not None,
+                    chunk_size=chunk_size,
+                    legacy=legacy,
+                )
+                session.reply(command_reply(upload_reply(server_port, journal, options), legacy))
+                metrics = await self.run_endpoint(session, endpoint)
+            log_upload_complete(filename, metrics)
+            if self.stats is not None:
+                self.stats.record_upload(metrics)
+            # reemplazar el archivo o armar un upload delta (que lo lee y escribe entero): fuera del loop
+            await loop.run_in_executor(
+                None,
+                finish_upload,
+                self.chunks,
+                filepath,
+                destination,
+                filename,
+                params,
+                metrics,
+                self.stats,
+            )
+            if int_param(params, "keep") != 1:
+                await self.linger(session)
+
+        elif command == "download":
+            # el manifiesto de chunks se calcula (si esta viejo) fuera del loop
+            filepath = await loop.run_in_executor(
+                None, download_source, self.storage_dir, filename, params, self.chunks
+            )
+            if filepath is None:
+                logging.warning(f"Download request failed: File '{filename}' not found")
+                session.reply(b"NOTFOUND")
+                return params
+
+            size = os.path.getsize(filepath)
+            filesize = size / 1024  # KB
+            logging.info(
+                f"Download request for '{filename}' ({filesize:.2f} KB) from {client_ip}:{client_port}"
+            )
+            start, length = range_params(params)
+            offset = download_offset(filepath, params) if start is None else start
+            with open(filepath, "rb") as f, shared_mapping(self.files, filepath) as mapped:
+                f.seek(offset)
+                endpoint = self.engine.sender(
+                    f,
+                    session.send_data,
+                    window_size=window_size,
+                    congestion=self.congestion,
+                    length=length,
+                    checksum=options["checksum"],
+                    compression=options["compress"],
+                    fec=options["fec"],
+                    chunk_size=chunk_size,
+                    max_rate=options["rate"],
+                    mapped=mapped,
+                    early_eof=options["eof"] is not None,
+                    legacy=legacy,
+                )
+                reply = download_reply(server_port, filepath, offset, options)
+                session.reply(command_reply(reply, legacy))
+                metrics = await self.run_endpoint(session, endpoint)
+            log_download_complete(filename, metrics)
+            if self.stats is not None:
+                self.stats.record_download(metrics)
+
+        elif command == "stat":
+            # el checksum de un archivo grande tarda: se calcula fuera del loop
+            filepath = os.path.join(self.storage_dir, filename)
+            reply = await loop.run_in_executor(
+                None, stat_command, filepath, filename, params, self.chunks, self.files
+            )
+            session.reply(reply)
+
+        return params
+
+    async def run_endpoint(self, session, endpoint):
+        now = time.monotonic()
+        session.endpoint = endpoint
+        session.last_activity = now
+        endpoint.poll(now)
+        while not endpoint.done:
+            deadline = endpoint.next_deadline()
+            idle_deadline = session.last_activity + IDLE_TIMEOUT
+            session.wake_at = idle_deadline if deadline is None else min(deadline, idle_deadline)
+
+            await session.wait(session.wake_at - time.monotonic())
+            if session.error is not None:
+                raise session.error
+            now = time.monotonic()
+            if now >= session.last_activity + IDLE_TIMEOUT:
+                raise TimeoutError(f"No data from client in {IDLE_TIMEOUT:.0f}s")
+            endpoint.poll(now)
+        session.wake_at = None
+        return endpoint.result()
+
+    async def linger(self, session):
+        # el endpoint sigue conectado a la sesion y responde los EOF repetidos
+        await asyncio.sleep(LINGER_TIME)
+
+    def count(self, name):
+        if self.stats is not None:
+            self.stats.increment(name)
+
+    async def drain(self, grace):
+        # apagado ordenado: deja de aceptar sesiones y espera a las que estan en curso
+        self.closing = True
+        tasks = [session.task for session in self.sessions.values() if session.task]
+        if tasks:
+            logging.info(f"Waiting for {len(tasks)} sessions to finish")
+            await asyncio.wait(tasks, timeout=grace)
+
+
+async def serve(args, stats=None, stop_event=None):
+    # con varios workers el proceso padre junta las estadisticas y las exporta
+    exporter = None
+    if stats is None:
+        stats = ServerStats()
+        exporter = start_exporter(args, stats.snapshot)
+
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, SOCKET_BUFFER_SIZE)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, SOCKET_BUFFER_SIZE)
+    bind_server_socket(sock, args)
+    server = AsyncServer(
+        args.storage,
+        args.protocol,
+        args.window,
+        args.cc,
+        stats,
+        rate_from_mbits(getattr(args, "rate", None)),
+        ChunkStore(args.storage),
+        create_file_cache(args, stats),
+        create_scheduler(args),
+        create_admission(args),
+    )
+    server.attach(sock)
+    print("Server started on {}:{} (async)".format(args.host, args.port))
+    try:
+        if stop_event is None:
+            await asyncio.Future()
+        else:
+            while not stop_event.is_set():
+                await asyncio.sleep(STOP_POLL_INTERVAL)
+            await server.drain(SHUTDOWN_GRACE)
+    finally:
+        server.detach()
+        sock.close()
+        if exporter is not None:
+            exporter.stop()
+
+
+def run_async_server(args, stats=None, stop_event=None):
+    setup_logging(args)
+    validate_storage(args.storage)
+    try:
+        asyncio.run(serve(args, stats, stop_event))
+    except Exception as e:
+        logging.error(f"Server error: {str(e)}")
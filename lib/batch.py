@@ -0,0 +1,115 @@
+import copy
+import logging
+import os
+import socket
+import time
+from lib.client import (
+    command_params,
+    encode_command,
+    legacy_server,
+    legacy_transfer,
+    receive_reply,
+    requested_chunk_size,
+    run_transfer,
+    setup_logging,
+    three_way_handshake,
+    validate_path,
+)
+
+# Muchos archivos con una sola sesion (ver lib/session.py)
+# -> un handshake y un probe de MTU para toda la lista, no uno por archivo
+# -> cada comando lleva keep=1 salvo el ultimo, asi el server sigue esperando en el mismo
+#    puerto de transferencia en vez de cerrar la sesion
+# -> el comando siguiente sale apenas termina nuestro lado de la transferencia, sin esperar a
+#    que el server cierre el suyo
+# -> si una transferencia falla a mitad de camino la sesion queda en un estado desconocido:
+#    se abre otra para lo que falta. Con un server sin sesiones, una por archivo (con uno
+#    original, ademas, cada comando sin parametros)
+
+SOCKET_TIMEOUT = 2.0
+
+
+def is_batch(args):
+    src = getattr(args, "src", None)
+    return getattr(args, "files", None) is not None or (src is not None and os.path.isdir(src))
+
+
+def batch_jobs(args, command):
+    # un args por archivo: los paths de --files o los archivos del directorio --src (upload),
+    # o los nombres de --files (download)
+    if args.files is not None:
+        with open(args.files) as f:
+            entries = [line.strip() for line in f if line.strip()]
+    else:
+        entries = sorted(
+            os.path.join(args.src, name)
+            for name in os.listdir(args.src)
+            if os.path.isfile(os.path.join(args.src, name))
+        )
+    jobs = []
+    for entry in entries:
+        job = copy.copy(args)
+        if command == "upload":
+            job.src, job.name = entry, os.path.basename(entry)
+        else:
+            job.name = entry
+        jobs.append(job)
+    return jobs
+
+
+def run_batch(args, command):
+    setup_logging(args)
+    addr = (args.host, args.port)
+    if command == "download":
+        validate_path(args.dst)
+    pending = batch_jobs(args, command)
+    total = len(pending)
+    failed = 0
+    sessions = 0
+    start_time = time.monotonic()
+
+    while pending:
+        with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+            sock.settimeout(SOCKET_TIMEOUT)
+            handshake_ok, transfer_address, server_params = three_way_handshake(sock, addr)
+            if not handshake_ok:
+                logging.error("Handshake with server failed")
+                return False
+            sessions += 1
+            persistent = server_params.get("session") == "1"
+            chunk_size = requested_chunk_size(sock, transfer_address, server_params, args)
+
+            while pending:
+                job = pending.pop(0)
+                keep = persistent and bool(pending)
+                try:
+                    if legacy_server(server_params):
+                        ok = legacy_transfer(sock, transfer_address, job, command)
+                    else:
+                        message = batch_command(job, command, chunk_size, keep)
+                        sock.sendto(message, transfer_address)
+                        response = receive_reply(sock, transfer_address)
+                        ok = run_transfer(sock, transfer_address, job, command, response)
+                except (OSError, ValueError) as e:
+                    logging.error(f"Transfer of {job.name} failed: {e}")
+                    ok = keep = False
+                if not ok:
+                    failed += 1
+                if not keep:
+                    break
+
+    duration = time.monotonic() - start_time
+    logging.info(
+        f"Batch finished: {total - failed}/{total} files in {duration:.2f}s "
+        + f"over {sessions} sessions"
+    )
+    if failed:
+        logging.error(f"{failed} of {total} transfers failed")
+    return not failed
+
+
+def batch_command(job, command, chunk_size, keep):
+    params = command_params(job, command)
+    params["chunk"] = chunk_size
+    params["keep"] = 1 if keep else None
+    return encode_command(job.name, command, params)
@@ -0,0 +1,252 @@
+import csv
+import hashlib
+import json
+import logging
+import multiprocessing
+import os
+import random
+import resource
+import socket
+import tempfile
+import time
+from lib.emulator import LossyLink
+from protocols.engines import get_engine, receive_file, send_file
+from protocols.pacing import rate_from_mbits
+
+# Corre sender y receiver sobre el emulador de enlace para cada combinacion de protocolo
+# (cualquier motor de protocols/engines.py), tamaño de archivo, perdida y ventana. El receiver
+# y el emulador corren en procesos aparte para que el GIL no distorsione los tiempos ni el CPU
+# medido de cada lado.
+
+FIELDS = [
+    "protocol",
+    "size",
+    "loss",
+    "window",
+    "run",
+    "ok",
+    "duration",
+    "goodput_kbps",
+    "retransmissions",
+    "duplicates",
+    "corrupted",
+    "wire_bytes",
+    "compressed",
+    "parity_sent",
+    "fec_recovered",
+    "sender_cpu",
+    "receiver_cpu",
+    "link_dropped",
+]
+
+HOST = "127.0.0.1"
+LOG_LEVELS = ("DEBUG", "INFO", "INFO", "INFO", "WARNING", "ERROR")
+
+
+def run_benchmark(args):
+    setup_logging(args)
+    results = []
+    print(" ".join(f"{field:>13}" for field in FIELDS))
+    with tempfile.TemporaryDirectory(prefix="tp1-bench-") as workdir:
+        for size in args.sizes:
+            src = make_source_file(workdir, size, args.seed, args.content)
+            for protocol in args.protocols:
+                windows = args.windows if get_engine(protocol).windowed else [1]
+                for loss in args.loss:
+                    for window in windows:
+                        for run in range(args.repeat):
+                            result = run_once(args, workdir, src, protocol, loss, window, run)
+                            results.append(result)
+                            print(" ".join(f"{format_value(result[f]):>13}" for f in FIELDS))
+
+    if args.csv:
+        write_csv(args.csv, results)
+    if args.json:
+        write_json(args.json, results)
+    return results
+
+
+def run_once(args, workdir, src, protocol, loss, window, run):
+    context = multiprocessing.get_context("fork")
+    size = os.path.getsize(src)
+    dst = os.path.join(workdir, "received")
+
+    receiver_sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    receiver_sock.bind((HOST, 0))
+    sender_sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sender_sock.bind((HOST, 0))
+    link = LossyLink(
+        receiver_sock.getsockname(),
+        loss=loss,
+        delay=args.delay / 1000,
+        jitter=args.jitter / 1000,
+        reorder=args.reorder,
+        duplicate=args.duplicate,
+        corrupt=args.corrupt,
+        rate=args.rate * 1e6 / 8 if args.rate else None,
+        queue_limit=args.queue,
+        seed=args.seed + run,
+    )
+
+    stop = context.Event()
+    link_results = context.Queue()
+    receiver_results = context.Queue()
+    emulator = context.Process(target=run_link, args=(link, stop, link_results), daemon=True)
+    receiver = context.Process(
+        target=run_receiver,
+        args=(
+            protocol,
+            receiver_sock,
+            link.back_addr,
+            dst,
+            window,
+            size,
+            args.checksum,
+            args.compress,
+            args.fec,
+            args.chunk_size,
+            receiver_results,
+        ),
+        daemon=True,
+    )
+    emulator.start()
+    receiver.start()
+    front_addr = link.front_addr
+    link.close()
+    receiver_sock.close()
+
+    result = dict.fromkeys(FIELDS)
+    result.update(protocol=protocol, size=size, loss=loss, window=window, run=run, ok=False)
+    try:
+        cpu_start = cpu_time()
+        start = time.monotonic()
+        sent = send_file(
+            protocol,
+            sender_sock,
+            front_addr,
+            src,
+            window_size=window,
+            congestion=args.cc,
+            checksum=args.checksum,
+            compression=args.compress,
+            fec=args.fec,
+            chunk_size=args.chunk_size,
+            pacing=not args.no_pacing,
+            max_rate=rate_from_mbits(args.send_rate),
+        )
+        receiver.join(args.timeout)
+        duration = time.monotonic() - start
+        result["sender_cpu"] = cpu_time() - cpu_start
+        result["duration"] = duration
+        result["goodput_kbps"] = size / 1024 / duration if duration > 0 else 0
+        result["retransmissions"] = sent.retransmissions
+        result["wire_bytes"] = sent.wire_bytes_sent
+        result["compressed"] = sent.compressed
+        result["parity_sent"] = sent.parity_sent
+
+        if receiver.is_alive():
+            logging.warning(f"Receiver did not finish in {args.timeout:.0f}s")
+        else:
+            duplicates, corrupted, recovered, receiver_cpu = receiver_results.get(timeout=1)
+            result["duplicates"] = duplicates
+            result["corrupted"] = corrupted
+            result["fec_recovered"] = recovered
+            result["receiver_cpu"] = receiver_cpu
+            result["ok"] = file_digest(src) == file_digest(dst)
+    except Exception as e:
+        logging.error(f"Benchmark run failed: {e}")
+    finally:
+        sender_sock.close()
+        if receiver.is_alive():
+            receiver.terminate()
+        stop.set()
+        emulator.join(5)
+        try:
+            result["link_dropped"] = link_results.get(timeout=1)["dropped"]
+        except Exception:
+            logging.debug("No statistics from the link emulator")
+    return result
+
+
+def run_link(link, stop, results):
+    link.run(stop)
+    results.put(link.stats())
+
+
+def run_receiver(
+    protocol, sock, peer, dst, window, size, checksum, compression, fec, chunk_size, results
+):
+    cpu_start = cpu_time()
+    metrics = receive_file(
+        protocol,
+        sock,
+        peer,
+        dst,
+        window_size=window,
+        file_size=size,
+        checksum=checksum,
+        compression=compression,
+        fec=fec is not None,
+        chunk_size=chunk_size,
+    )
+    results.put(
+        (metrics.duplicates, metrics.corrupted, metrics.fec_recovered, cpu_time() - cpu_start)
+    )
+
+
+def make_source_file(workdir, size, seed, content="random"):
+    # contenido pseudoaleatorio con semilla: las corridas son comparables entre si.
+    # "text" son lineas tipo log, que comprimen como los archivos de texto reales
+    rng = random.Random(seed)
+    path = os.path.join(workdir, f"source-{content}-{size}")
+    with open(path, "wb") as f:
+        if content == "text":
+            data = bytearray()
+            while len(data) < size:
+                data += (
+                    f"{len(data):010d} {rng.choice(LOG_LEVELS)} transfer "
+                    + f"seq={rng.randrange(2**32)} rtt={rng.random() * 100:.3f}ms\n"
+                ).encode()
+            f.write(data[:size])
+        else:
+            f.write(rng.randbytes(size))
+    return path
+
+
+def cpu_time():
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    return usage.ru_utime + usage.ru_stime
+
+
+def file_digest(path):
+    digest = hashlib.md5()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def format_value(value):
+    if isinstance(value, float):
+        return f"{value:.3f}"
+    return str(value)
+
+
+def write_csv(path, results):
+    with open(path, "w", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=FIELDS)
+        writer.writeheader()
+        writer.writerows(results)
+    logging.info(f"Results written to {path}")
+
+
+def write_json(path, results):
+    with open(path, "w") as f:
+        json.dump(results, f, indent=2)
+    logging.info(f"Results written to {path}")
+
+
+def setup_logging(args):
+    # por defecto solo errores: los warnings de retransmision ensucian la tabla
+    level = logging.INFO if args.verbose else logging.ERROR
+    logging.basicConfig(format="%(levelname)s: %(message)s", level=level)
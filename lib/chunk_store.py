@@ -0,0 +1,163 @@
+import hashlib
+import logging
+import os
+import threading
+from protocols.chunking import (
+    DELTA_RECORD,
+    chunk_digest,
+    decode_manifest,
+    encode_manifest,
+    file_chunks,
+)
+from protocols.file_io import DIGEST_ALGORITHM
+
+# Indice de chunks del server para las transferencias delta (ver lib/delta.py)
+# -> los archivos se siguen guardando enteros en el storage (los downloads, el journal y los
+#    mmaps no cambian); el indice direcciona por contenido: hash del chunk -> (archivo, offset)
+# -> el manifiesto de cada archivo se guarda en STORE_DIR/<archivo>.manifest con el tamaño y el
+#    mtime del archivo del que salio: si no coinciden esta viejo y se recalcula cuando se pide
+# -> un upload delta llega como un stream de registros: el chunk entero si el server no lo
+#    tenia, o solo su hash y largo si lo tenia en cualquier archivo. Se arma en un temporal
+#    (leyendo los chunks conocidos del archivo anterior, que sigue intacto) y se reemplaza
+# -> cada chunk se verifica con su hash al leerlo: un indice viejo (otro worker, un archivo
+#    cambiado por fuera) hace fallar el armado, nunca deja un archivo mal armado
+
+STORE_DIR = ".chunks"
+MANIFEST_SUFFIX = ".manifest"
+DELTA_SUFFIX = ".delta"
+
+
+class ChunkStore:
+    def __init__(self, storage_dir):
+        self.storage_dir = storage_dir
+        self.store_dir = os.path.join(storage_dir, STORE_DIR)
+        self._lock = threading.Lock()
+        self._index = {}  # hash -> (archivo, offset, largo)
+        self._files = {}  # archivo -> hashes que aporto al indice
+        self._load()
+
+    def delta_path(self, name):
+        os.makedirs(self.store_dir, exist_ok=True)
+        return os.path.join(self.store_dir, name + DELTA_SUFFIX)
+
+    def manifest(self, name):
+        # path del manifiesto al dia de un archivo, o None si el archivo no existe
+        filepath = os.path.join(self.storage_dir, name)
+        path = os.path.join(self.store_dir, name + MANIFEST_SUFFIX)
+        try:
+            stat = os.stat(filepath)
+        except FileNotFoundError:
+            return None
+        if self._read_manifest(name, path, stat) is None:
+            chunks = file_chunks(filepath)
+            self._write_manifest(path, stat, chunks)
+            self._add(name, chunks)
+            logging.debug(f"Chunk manifest of '{name}': {len(chunks)} chunks")
+        return path
+
+    def forget(self, name):
+        # el archivo cambio (upload comun): sus chunks ya no estan donde dice el indice
+        with self._lock:
+            for digest in self._files.pop(name, ()):
+                if self._index.get(digest, (None,))[0] == name:
+                    del self._index[digest]
+
+    def assemble(self, name, expected_digest=None):
+        # arma el archivo a partir del stream delta recibido; devuelve los bytes reutilizados
+        self.manifest(name)  # el archivo anterior al dia en el indice (otro worker lo pudo cambiar)
+        delta_path = self.delta_path(name)
+        filepath = os.path.join(self.storage_dir, name)
+        temporary = delta_path + ".tmp"
+        digest = hashlib.new(DIGEST_ALGORITHM)
+        chunks = []
+        offset = reused = 0
+        sources = {}
+        try:
+            with open(delta_path, "rb") as delta, open(temporary, "wb") as out:
+                while header := delta.read(DELTA_RECORD.size):
+                    if len(header) != DELTA_RECORD.size:
+                        raise ValueError("Truncated delta stream")
+                    literal, length, chunk_hash = DELTA_RECORD.unpack(header)
+                    if literal:
+                        data = delta.read(length)
+                    else:
+                        data = self._read_chunk(chunk_hash, length, sources)
+                        reused += length
+                    if data is None or chunk_digest(data) != chunk_hash:
+                        raise ValueError(f"Chunk at byte {offset} is missing or does not match")
+                    out.write(data)
+                    digest.update(data)
+                    chunks.append((offset, length, chunk_hash))
+                    offset += length
+            if expected_digest is not None and digest.hexdigest() != expected_digest:
+                raise ValueError("Assembled file does not match the client's digest")
+            os.replace(temporary, filepath)
+        finally:
+            for f in sources.values():
+                f.close()
+            for path in (temporary, delta_path):
+                if os.path.exists(path):
+                    os.remove(path)
+
+        self.forget(name)
+        path = os.path.join(self.store_dir, name + MANIFEST_SUFFIX)
+        self._write_manifest(path, os.stat(filepath), chunks)
+        self._add(name, chunks)
+        return reused
+
+    def _read_chunk(self, chunk_hash, length, sources):
+        with self._lock:
+            location = self._index.get(chunk_hash)
+        if location is None or location[2] != length:
+            return None
+        name, offset, _ = location
+        if name not in sources:
+            try:
+                sources[name] = open(os.path.join(self.storage_dir, name), "rb")
+            except OSError:
+                return None
+        f = sources[name]
+        f.seek(offset)
+        return f.read(length)
+
+    def _add(self, name, chunks):
+        with self._lock:
+            self._files[name] = [digest for _, _, digest in chunks]
+            for offset, length, digest in chunks:
+                self._index.setdefault(digest, (name, offset, length))
+
+    def _read_manifest(self, name, path, stat):
+        # chunks del manifiesto guardado si sigue valido para el archivo, o None
+        try:
+            with open(path, "rb") as f:
+                size, mtime, chunks = decode_manifest(f.read())
+        except (OSError, ValueError):
+            return None
+        if size != stat.st_size or mtime != stat.st_mtime_ns:
+            return None
+        if name not in self._files:
+            self._add(name, chunks)
+        return chunks
+
+    def _write_manifest(self, path, stat, chunks):
+        os.makedirs(self.store_dir, exist_ok=True)
+        temporary = path + ".tmp"
+        with open(temporary, "wb") as f:
+            f.write(encode_manifest(stat.st_size, stat.st_mtime_ns, chunks))
+        os.replace(temporary, path)
+
+    def _load(self):
+        # indexa los manifiestos que siguen validos de una corrida anterior
+        try:
+            entries = os.listdir(self.store_dir)
+        except FileNotFoundError:
+            return
+        for entry in entries:
+            if not entry.endswith(MANIFEST_SUFFIX):
+                continue
+            name = entry[: -len(MANIFEST_SUFFIX)]
+            try:
+                stat = os.stat(os.path.join(self.storage_dir, name))
+            except OSError:
+                continue
+            self._read_manifest(name, os.path.join(self.store_dir, entry), stat)
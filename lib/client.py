@@ -1,89 +1,432 @@
 import socket
 import os
 import logging
-from protocols.stop_and_wait import stop_and_wait_receive, stop_and_wait_send
-from protocols.selective_repeat import selective_repeat_receive, selective_repeat_send
+import time
+from protocols.engines import receive_file, send_file
+from protocols.selective_repeat import CHUNK_SIZE
+from lib.commands import encode_params, int_param, parse_params
+from lib.pmtu import (
+    JUMBO_MTU_LADDER,
+    MTU_LADDER,
+    cached_path_mtu,
+    chunk_size_for_mtu,
+    probe_path_mtu,
+)
+from protocols.pacing import rate_from_mbits
+from protocols.package import is_control
+from lib.session import hello_nonce, stale_eof_ack
+from lib.scheduler import BUSY_RETRY, QUEUE_TIMEOUT
+from protocols.journal import TransferJournal, source_mtime
+from protocols.fec import parse_fec
 
 TIMEOUT = 0.5
+HANDSHAKE_TIMEOUT = 0.5  # primera espera del HI, se duplica en cada reintento
+HANDSHAKE_RETRIES = 4
+BUSY_RETRIES = 3
 
 
-def encode_command(file_name, command):
+def encode_command(file_name, command, params=None):
     if command == "upload":
-        return f"UPLOAD{file_name}".encode()
+        return encode_params(f"UPLOAD{file_name}", params or {})
     elif command == "download":
-        return f"DOWNLOAD{file_name}".encode()
+        return encode_params(f"DOWNLOAD{file_name}", params or {})
+    elif command == "stat":
+        return encode_params(f"STAT{file_name}", params or {})
 
 
-def client_handle_download(sock, addr, filepath, protocol):
+def client_handle_download(
+    sock,
+    addr,
+    filepath,
+    protocol,
+    window_size,
+    file_size=None,
+    journal=None,
+    start=None,
+    checksum=None,
+    compression=None,
+    fec=None,
+    chunk_size=CHUNK_SIZE,
+    legacy=False,
+):
     validate_path(os.path.dirname(filepath))
-    if protocol == "saw":
-        stop_and_wait_receive(sock, addr, filepath)
-    elif protocol == "sr":
-        selective_repeat_receive(sock, addr, filepath)
+    return receive_file(
+        protocol,
+        sock,
+        addr,
+        filepath,
+        journal,
+        start,
+        window_size=window_size,
+        file_size=file_size,
+        checksum=checksum,
+        compression=compression,
+        fec=fec is not None,
+        chunk_size=chunk_size,
+        legacy=legacy,
+    )
 
 
-def client_handle_upload(sock, addr, filepath, protocol):
+def client_handle_upload(
+    sock,
+    addr,
+    filepath,
+    protocol,
+    window_size,
+    congestion,
+    offset=0,
+    length=None,
+    checksum=None,
+    compression=None,
+    fec=None,
+    chunk_size=CHUNK_SIZE,
+    pacing=True,
+    max_rate=None,
+    early_eof=False,
+    legacy=False,
+):
     validate_file(filepath)
-    if protocol == "saw":
-        stop_and_wait_send(sock, addr, filepath)
-    elif protocol == "sr":
-        selective_repeat_send(sock, addr, filepath)
+    return send_file(
+        protocol,
+        sock,
+        addr,
+        filepath,
+        offset,
+        window_size=window_size,
+        congestion=congestion,
+        length=length,
+        checksum=checksum,
+        compression=compression,
+        fec=fec,
+        chunk_size=chunk_size,
+        pacing=pacing,
+        max_rate=max_rate,
+        early_eof=early_eof,
+        legacy=legacy,
+    )
+
+
+def command_params(args, command):
+    # upload: identidad del origen para que el server valide su journal
+    # download: progreso del journal local, si hay uno de un intento anterior
+    # en los dos el checksum y la compresion que se piden; el server contesta cuales usa
+    restart = getattr(args, "restart", False)
+    options = transfer_options(args)
+    if command == "upload":
+        return {
+            "size": os.path.getsize(args.src),
+            "mtime": source_mtime(args.src),
+            "restart": 1 if restart else None,
+            **options,
+        }
+    journal = None if restart else TransferJournal.load(os.path.join(args.dst, args.name))
+    if journal is None:
+        return options
+    return {
+        "size": journal.size,
+        "mtime": journal.mtime,
+        "offset": journal.position,
+        **options,
+    }
+
+
+def transfer_options(args):
+    return {
+        "checksum": getattr(args, "checksum", None),
+        "compress": getattr(args, "compress", None),
+        "fec": getattr(args, "fec", None),
+        "rate": rate_from_mbits(getattr(args, "rate", None)),
+        # ventana de -w: el server contesta la menor entre la suya y esta
+        "window": getattr(args, "window", None),
+        # este cliente confirma el EOF recien con todo recibido: el server lo puede adelantar
+        "eof": 1,
+    }
+
+
+def negotiated_options(reply_params):
+    # lo que acepto el server; uno viejo no contesta nada y quedan los defaults
+    return {
+        "checksum": reply_params.get("checksum"),
+        "compression": reply_params.get("compress"),
+        "fec": parse_fec(reply_params.get("fec")),
+        "chunk_size": int_param(reply_params, "chunk") or CHUNK_SIZE,
+    }
+
+
+def negotiated_window(args, reply_params):
+    # la que contesto el server; uno que no la negocia no la manda y queda la de -w
+    return int_param(reply_params, "window") or args.window
+
+
+def pacing_options(args, reply_params):
+    # para los uploads: el server contesta el techo de tasa combinado con el suyo; uno viejo
+    # no lo conoce y queda el que se pidio
+    return {
+        "pacing": not getattr(args, "no_pacing", False),
+        "max_rate": int_param(reply_params, "rate") or rate_from_mbits(getattr(args, "rate", None)),
+        "early_eof": reply_params.get("eof") == "1",
+    }
+
+
+def requested_chunk_size(sock, addr, server_params, args):
+    # --chunk-size N se pide tal cual; con auto se mide el MTU del camino si el server
+    # contesta probes (lo avisa en el HI_ACK). None deja el default del server
+    chunk_size = getattr(args, "chunk_size", None)
+    if chunk_size != "auto":
+        return chunk_size
+    if server_params.get("probe") != "1":
+        return None
+    ladder = JUMBO_MTU_LADDER if getattr(args, "jumbo", False) else MTU_LADDER
+    mtu = probe_path_mtu(sock, addr, ladder)
+    if mtu is None:
+        logging.debug("Path MTU discovery not available, using the default chunk size")
+        return None
+    logging.debug(f"Path MTU {mtu} -> chunk size {chunk_size_for_mtu(mtu)}")
+    return chunk_size_for_mtu(mtu)
+
+
+def legacy_server(server_params):
+    # un server original contesta el HI_ACK sin parametros: pegaria los del comando al nombre
+    # del archivo y no conoce el header v2
+    return not server_params
+
+
+def legacy_transfer(sock, transfer_address, args, command):
+    # con un server original el comando va sin parametros y la transferencia en formato legacy
+    logging.info("Server without protocol extensions, using the original protocol")
+    sock.sendto(encode_command(args.name, command), transfer_address)
+    response = receive_reply(sock, transfer_address)
+    return run_transfer(sock, transfer_address, args, command, response, legacy=True)
+
+
+def download_journal(filepath, reply_params):
+    # el server confirma desde donde manda; sin mtime (server viejo) no se puede retomar
+    size = int_param(reply_params, "size")
+    mtime = int_param(reply_params, "mtime")
+    if size is None or mtime is None:
+        return None
+    return TransferJournal(filepath, size, mtime, int_param(reply_params, "offset") or 0)
 
 
 def three_way_handshake(socket, addr):
-    socket.sendto(b"HI", addr)
     try:
-        received, transfer_address = socket.recvfrom(6)
+        received, transfer_address = send_hello(socket, addr, b"HI")
         if received.startswith(b"HI_ACK"):
             socket.sendto(b"ACK", transfer_address)
-            return True, transfer_address
+            _, server_params = parse_params(received)
+            return True, transfer_address, server_params
         else:
             logging.error("Invalid HI ACK message")
-            return False, (0, 0)
+            return False, (0, 0), {}
     except Exception as e:
         logging.error(f"Handshake error: {str(e)}")
-    return False, (0, 0)
+    return False, (0, 0), {}
+
+
+def send_hello(sock, addr, hello):
+    # manda el HI y devuelve (respuesta, direccion de transferencia)
+    # -> sin respuesta se repite el HI con backoff (el server repite su respuesta, no abre
+    #    otra sesion); socket.timeout si no contesta nunca
+    # -> un server lleno contesta BUSY con los segundos a esperar antes de reintentar
+    timeout = sock.gettimeout()
+    wait = HANDSHAKE_TIMEOUT
+    retries = busy_retries = 0
+    try:
+        while True:
+            sock.sendto(hello, addr)
+            try:
+                received, transfer_address = receive_admission(sock, wait)
+            except socket.timeout:
+                if retries == HANDSHAKE_RETRIES:
+                    raise
+                retries += 1
+                wait *= 2
+                logging.debug(f"No answer from server, repeating HI (waiting {wait:.1f}s)")
+                continue
+            if not received.startswith(b"BUSY"):
+                return received, transfer_address
+            if busy_retries == BUSY_RETRIES:
+                raise ConnectionError("Server busy, giving up")
+            busy_retries += 1
+            retry = int_param(parse_params(received)[1], "retry") or BUSY_RETRY
+            logging.warning(f"Server busy, retrying in {retry}s")
+            time.sleep(retry)
+    finally:
+        sock.settimeout(timeout)
+
+
+def receive_admission(sock, wait):
+    # respuesta al HI; con el server lleno puede encolar la sesion (QUEUED) antes de contestar
+    received, transfer_address = receive_control(sock, time.monotonic() + wait)
+    if not received.startswith(b"QUEUED"):
+        return received, transfer_address
+    _, params = parse_params(received)
+    logging.info(f"Server full, waiting in queue (position {params.get('position')})")
+    return receive_control(sock, time.monotonic() + QUEUE_TIMEOUT + wait)
+
+
+def receive_control(sock, deadline):
+    # proximo mensaje de control antes de deadline; los datos de un download que llegan antes
+    # que su respuesta (handshake rapido) se descartan y el server los vuelve a mandar
+    while True:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            raise socket.timeout("timed out")
+        sock.settimeout(remaining)
+        received, address = sock.recvfrom(1024)
+        if is_control(received):
+            return received, address
+
+
+def send_request(sock, addr, message, args=None):
+    # handshake y comando en una sesion nueva: devuelve (respuesta, direccion de transferencia)
+    # con args se negocia ademas el tamaño de chunk para una transferencia
+    handshake_ok, transfer_address, server_params = three_way_handshake(sock, addr)
+    if not handshake_ok:
+        raise ConnectionError("Handshake with server failed")
+    if args is not None:
+        chunk_size = requested_chunk_size(sock, transfer_address, server_params, args)
+        message = encode_params(message, {"chunk": chunk_size})
+    sock.sendto(message, transfer_address)
+    response, _ = sock.recvfrom(1024)
+    return response, transfer_address
 
 
 def run_client(args, command):
     setup_logging(args)
     addr = (args.host, args.port)
-    protocol = args.protocol
 
     with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as c_sock:
         c_sock.settimeout(2.0)
 
-        handshake_ok, transfer_address = three_way_handshake(c_sock, addr)
+        if fast_handshake_enabled(args):
+            return run_fast(c_sock, addr, args, command)
+
+        handshake_ok, transfer_address, server_params = three_way_handshake(c_sock, addr)
         if handshake_ok:
             logging.info("Handshake successful | Proceeding with transfer")
-            encoded_command = encode_command(args.name, command)
-            c_sock.sendto(encoded_command, transfer_address)
             try:
+                if legacy_server(server_params):
+                    return legacy_transfer(c_sock, transfer_address, args, command)
+                params = command_params(args, command)
+                params["chunk"] = requested_chunk_size(c_sock, transfer_address, server_params, args)
+                encoded_command = encode_command(args.name, command, params)
+                c_sock.sendto(encoded_command, transfer_address)
                 response, _ = c_sock.recvfrom(1024)
-
-                if command == "upload":
-                    logging.info(f"Uploading file: {args.src} -> {args.name}")
-                    if not response.startswith(b"READY"):
-                        logging.error("Server not ready")
-                        return
-                    client_handle_upload(c_sock, transfer_address, args.src, protocol)
-                    logging.info("Upload completed successfully")
-
-                elif command == "download":
-                    logging.info(f"Downloading file: {args.name} -> {args.dst}")
-                    if response == b"NOTFOUND":
-                        logging.error("File not found on server")
-                        return
-                    elif response.startswith(b"FOUND"):
-                        filepath = os.path.join(args.dst, args.name)
-                        client_handle_download(
-                            c_sock, transfer_address, filepath, protocol
-                        )
-                        logging.info("Download completed successfully")
+                return run_transfer(c_sock, transfer_address, args, command, response)
             except socket.timeout:
                 logging.error("Timeout in server response")
         else:
             logging.error("Handshake with server failed")
+        return False
+
+
+def fast_handshake_enabled(args):
+    # el comando va en el HI, antes de poder medir el MTU: con --jumbo se prefiere medirlo
+    return not getattr(args, "jumbo", False)
+
+
+def fast_chunk_size(args, addr):
+    # sin probe de MTU: con auto el PMTU que ya conoce el kernel (ver lib/pmtu.py), dentro de
+    # la escalera sin jumbo; si no lo expone se asume el de Ethernet
+    chunk_size = getattr(args, "chunk_size", None)
+    if chunk_size != "auto":
+        return chunk_size
+    mtu = cached_path_mtu(addr)
+    if mtu is None:
+        mtu = MTU_LADDER[0]
+    return chunk_size_for_mtu(min(max(mtu, MTU_LADDER[-1]), MTU_LADDER[0]))
+
+
+def run_fast(sock, addr, args, command):
+    # handshake rapido (ver lib/session.py): el HI lleva el comando y la respuesta ya es
+    # READY/FOUND; un server que no lo conoce contesta HI_ACK y se sigue como siempre
+    params = command_params(args, command)
+    params["chunk"] = fast_chunk_size(args, addr)
+    params["nonce"] = hello_nonce()
+    encoded_command = encode_command(args.name, command, params)
+    try:
+        response, transfer_address = send_hello(sock, addr, b"HI" + encoded_command)
+        if response.startswith(b"HI_ACK"):
+            logging.debug("Server without fast handshake, sending the command after the ACK")
+            sock.sendto(b"ACK", transfer_address)
+            if legacy_server(parse_params(response)[1]):
+                return legacy_transfer(sock, transfer_address, args, command)
+            sock.sendto(encoded_command, transfer_address)
+            response = receive_reply(sock, transfer_address)
+    except OSError as e:
+        logging.error(f"Handshake with server failed: {e}")
+        return False
+    return run_transfer(sock, transfer_address, args, command, response)
+
+
+def run_transfer(sock, transfer_address, args, command, response, legacy=False):
+    # transferencia de un comando ya enviado, a partir de la respuesta del server
+    # (legacy: con un server original, ver legacy_server)
+    if command == "upload":
+        logging.info(f"Uploading file: {args.src} -> {args.name}")
+        if not response.startswith(b"READY"):
+            logging.error("Server not ready")
+            return False
+        _, reply_params = parse_params(response)
+        offset = int_param(reply_params, "offset") or 0
+        if offset:
+            logging.info(f"Resuming upload at byte {offset}")
+        metrics = client_handle_upload(
+            sock,
+            transfer_address,
+            args.src,
+            args.protocol,
+            negotiated_window(args, reply_params),
+            args.cc,
+            offset,
+            **negotiated_options(reply_params),
+            **pacing_options(args, reply_params),
+            legacy=legacy,
+        )
+        if metrics.digest_ok is False:
+            logging.error("Upload corrupted: the server discarded it, repeat the upload")
+            return False
+        logging.info("Upload completed successfully")
+        return True
+
+    logging.info(f"Downloading file: {args.name} -> {args.dst}")
+    if not response.startswith(b"FOUND"):
+        logging.error("File not found on server")
+        return False
+    _, reply_params = parse_params(response)
+    filepath = os.path.join(args.dst, args.name)
+    metrics = client_handle_download(
+        sock,
+        transfer_address,
+        filepath,
+        args.protocol,
+        negotiated_window(args, reply_params),
+        int_param(reply_params, "size"),
+        download_journal(filepath, reply_params),
+        **negotiated_options(reply_params),
+        legacy=legacy,
+    )
+    if metrics.digest_ok is False:
+        logging.error("Download corrupted: file digest does not match")
+        return False
+    logging.info("Download completed successfully")
+    return True
+
+
+def receive_reply(sock, transfer_address):
+    # respuesta a un comando de una sesion persistente: antes pueden llegar restos de la
+    # transferencia anterior (un EOF repetido se vuelve a confirmar, ver lib/session.py) o una
+    # respuesta del handshake repetida porque se repitio el HI
+    while True:
+        response, _ = sock.recvfrom(1024)
+        if response.startswith((b"HI_ACK", b"QUEUED")):
+            continue
+        if is_control(response):
+            return response
+        ack = stale_eof_ack(response)
+        if ack is not None:
+            sock.sendto(ack, transfer_address)
 
 
 def setup_logging(args):
@@ -0,0 +1,31 @@
+# Parametros opcionales de los mensajes de control: se agregan al final del mensaje como
+# "\0clave=valor" (NUL no puede aparecer en un nombre de archivo). Un server original no los
+# entiende (los pegaria al nombre del archivo), asi que el cliente solo los manda si el server
+# los anuncia en el HI_ACK; a uno que contesta el HI_ACK sin parametros le manda el comando
+# pelado (el HI del handshake rapido ya los lleva, pero el original solo mira que empiece
+# con HI). Del otro lado, un comando sin parametros es de un cliente original: el server le
+# contesta sin parametros y transfiere con el header de 2 bytes (ver protocols/engines.py).
+SEPARATOR = b"\0"
+
+
+def encode_params(message, params):
+    encoded = message.encode() if isinstance(message, str) else message
+    for key, value in params.items():
+        if value is not None:
+            encoded += SEPARATOR + f"{key}={value}".encode()
+    return encoded
+
+
+def parse_params(message):
+    # devuelve (mensaje sin parametros, dict de parametros como str)
+    head, *fields = message.split(SEPARATOR)
+    params = {}
+    for field in fields:
+        key, _, value = field.decode().partition("=")
+        params[key] = value
+    return head, params
+
+
+def int_param(params, key):
+    value = params.get(key)
+    return int(value) if value else None
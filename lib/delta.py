@@ -0,0 +1,266 @@
+import logging
+import os
+import socket
+import tempfile
+from lib.client import (
+    client_handle_download,
+    client_handle_upload,
+    command_params,
+    encode_command,
+    legacy_server,
+    legacy_transfer,
+    negotiated_options,
+    negotiated_window,
+    pacing_options,
+    receive_reply,
+    requested_chunk_size,
+    run_client,
+    run_transfer,
+    setup_logging,
+    three_way_handshake,
+    transfer_options,
+    validate_file,
+    validate_path,
+)
+from lib.commands import int_param, parse_params
+from protocols.chunking import DELTA_RECORD, chunk_digest, decode_manifest, file_chunks
+from protocols.file_io import DIGEST_ALGORITHM, file_digest, resize_file
+
+# Transferencias delta: solo viajan los chunks que el otro lado no tiene
+# -> el server anuncia delta=1 en el HI_ACK y sirve el manifiesto de chunks de cada archivo
+#    (DOWNLOAD con manifest=1, ver lib/chunk_store.py); todo va por una sesion persistente
+# -> upload: se corta el archivo local (protocols/chunking.py) y se manda un stream con los
+#    chunks que no estan en el manifiesto y solo el hash de los demas (UPLOAD con delta=1).
+#    El server arma el archivo y se confirma con el checksum completo (STAT)
+# -> download: se corta la copia local, se bajan por rangos (start/length, como en las
+#    transferencias en paralelo) los chunks que faltan y el resto se copia de la copia local
+# -> sin version anterior del otro lado, o si casi todo cambio, es una transferencia comun;
+#    si algo falla a mitad de camino se repite entera en una sesion nueva
+
+SOCKET_TIMEOUT = 2.0
+DIGEST_TIMEOUT = 120.0  # el server arma el archivo y calcula su checksum antes de contestar
+MAX_RANGES = 256  # con mas tramos distintos conviene bajar el archivo entero
+PARTIAL_SUFFIX = ".delta"
+
+
+def run_delta(args, command):
+    setup_logging(args)
+    addr = (args.host, args.port)
+    if command == "upload":
+        validate_file(args.src)
+    else:
+        validate_path(args.dst)
+
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+        sock.settimeout(SOCKET_TIMEOUT)
+        handshake_ok, transfer_address, server_params = three_way_handshake(sock, addr)
+        if not handshake_ok:
+            logging.error("Handshake with server failed")
+            return False
+        if legacy_server(server_params):
+            return legacy_transfer(sock, transfer_address, args, command)
+        chunk_size = requested_chunk_size(sock, transfer_address, server_params, args)
+        if server_params.get("delta") != "1":
+            logging.info("Server does not support delta transfers, sending the whole file")
+            return plain_transfer(sock, transfer_address, args, command, chunk_size)
+        # done: ya no hace falta repetir la transferencia sin delta
+        try:
+            if command == "upload":
+                done = delta_upload(sock, transfer_address, args, chunk_size)
+            else:
+                done = delta_download(sock, transfer_address, args, chunk_size)
+        except (OSError, ValueError) as e:
+            logging.error(f"Delta {command} failed: {e}")
+            done = False
+
+    if not done:
+        logging.warning(f"Repeating the {command} without delta")
+        return run_client(args, command)
+    return True
+
+
+def plain_transfer(sock, addr, args, command, chunk_size):
+    # transferencia comun en la sesion ya abierta; es el ultimo comando de la sesion
+    params = command_params(args, command)
+    params["chunk"] = chunk_size
+    sock.sendto(encode_command(args.name, command, params), addr)
+    return run_transfer(sock, addr, args, command, receive_reply(sock, addr))
+
+
+def session_command(sock, addr, name, command, params, keep=True):
+    params["keep"] = 1 if keep else None
+    sock.sendto(encode_command(name, command, params), addr)
+    return receive_reply(sock, addr)
+
+
+def fetch_manifest(sock, addr, args, chunk_size):
+    # (tamaño, mtime, chunks) del archivo en el server, o None si no lo tiene
+    params = {"manifest": 1, "chunk": chunk_size, **transfer_options(args)}
+    response = session_command(sock, addr, args.name, "download", params)
+    if not response.startswith(b"FOUND"):
+        return None
+    _, reply_params = parse_params(response)
+    fd, path = tempfile.mkstemp(suffix=".manifest")
+    os.close(fd)
+    try:
+        metrics = client_handle_download(
+            sock,
+            addr,
+            path,
+            args.protocol,
+            negotiated_window(args, reply_params),
+            int_param(reply_params, "size"),
+            **negotiated_options(reply_params),
+        )
+        if metrics.digest_ok is False:
+            raise ValueError("Chunk manifest corrupted in transit")
+        with open(path, "rb") as f:
+            return decode_manifest(f.read())
+    finally:
+        os.remove(path)
+
+
+def delta_upload(sock, addr, args, chunk_size):
+    remote = fetch_manifest(sock, addr, args, chunk_size)
+    size = os.path.getsize(args.src)
+    chunks = file_chunks(args.src)
+    known = set() if remote is None else {digest for _, _, digest in remote[2]}
+    new_bytes = sum(length for _, length, digest in chunks if digest not in known)
+    if size and new_bytes == size:
+        logging.info("Nothing to reuse on the server, sending the whole file")
+        plain_transfer(sock, addr, args, "upload", chunk_size)
+        return True
+    logging.info(
+        f"Uploading delta: {args.src} -> {args.name}, {new_bytes} of {size} bytes are new"
+    )
+
+    fd, delta_path = tempfile.mkstemp(suffix=PARTIAL_SUFFIX)
+    try:
+        with os.fdopen(fd, "wb") as delta, open(args.src, "rb") as src:
+            for offset, length, digest in chunks:
+                literal = digest not in known
+                delta.write(DELTA_RECORD.pack(literal, length, digest))
+                if literal:
+                    src.seek(offset)
+                    delta.write(src.read(length))
+        local_digest = file_digest(args.src)
+        params = {
+            "size": os.path.getsize(delta_path),
+            "delta": 1,
+            DIGEST_ALGORITHM: local_digest,
+            "chunk": chunk_size,
+            **transfer_options(args),
+        }
+        response = session_command(sock, addr, args.name, "upload", params)
+        if not response.startswith(b"READY"):
+            logging.error("Server not ready")
+            return False
+        _, reply_params = parse_params(response)
+        client_handle_upload(
+            sock,
+            addr,
+            delta_path,
+            args.protocol,
+            negotiated_window(args, reply_params),
+            args.cc,
+            **negotiated_options(reply_params),
+            **pacing_options(args, reply_params),
+        )
+    finally:
+        os.remove(delta_path)
+
+    # el server arma el archivo al terminar el stream: el checksum completo confirma el resultado
+    sock.settimeout(DIGEST_TIMEOUT)
+    response = session_command(sock, addr, args.name, "stat", {"digest": 1}, keep=False)
+    _, info = parse_params(response)
+    if not response.startswith(b"INFO") or info.get(DIGEST_ALGORITHM) != local_digest:
+        logging.error("The server copy does not match the local file after the delta upload")
+        return False
+    logging.info("Upload completed successfully")
+    return True
+
+
+def delta_download(sock, addr, args, chunk_size):
+    filepath = os.path.join(args.dst, args.name)
+    if not os.path.isfile(filepath):
+        plain_transfer(sock, addr, args, "download", chunk_size)
+        return True
+    remote = fetch_manifest(sock, addr, args, chunk_size)
+    if remote is None:
+        plain_transfer(sock, addr, args, "download", chunk_size)
+        return True
+    size, mtime, chunks = remote
+    local = {digest: offset for offset, _, digest in file_chunks(filepath)}
+    ranges = missing_ranges(chunks, local)
+    new_bytes = sum(length for _, length in ranges)
+    if (size and new_bytes == size) or len(ranges) > MAX_RANGES:
+        logging.info("Local copy too different, downloading the whole file")
+        plain_transfer(sock, addr, args, "download", chunk_size)
+        return True
+    logging.info(
+        f"Downloading delta: {args.name} -> {args.dst}, {new_bytes} of {size} bytes are new"
+    )
+
+    partial = filepath + PARTIAL_SUFFIX
+    try:
+        resize_file(partial, size)
+        for index, (start, length) in enumerate(ranges):
+            params = {
+                "start": start,
+                "length": length,
+                "chunk": chunk_size,
+                **transfer_options(args),
+            }
+            keep = index < len(ranges) - 1
+            response = session_command(sock, addr, args.name, "download", params, keep)
+            if not response.startswith(b"FOUND"):
+                logging.error("File not found on server")
+                return False
+            _, reply_params = parse_params(response)
+            if int_param(reply_params, "mtime") != mtime:
+                raise ValueError("File changed on the server during the delta download")
+            metrics = client_handle_download(
+                sock,
+                addr,
+                partial,
+                args.protocol,
+                negotiated_window(args, reply_params),
+                start + length,
+                start=start,
+                **negotiated_options(reply_params),
+            )
+            if metrics.digest_ok is False:
+                raise ValueError(f"Bytes {start}-{start + length} corrupted in transit")
+        if not ranges:
+            # no falta nada: el STAT solo cierra la sesion
+            session_command(sock, addr, args.name, "stat", {}, keep=False)
+
+        with open(filepath, "rb") as src, open(partial, "r+b") as dst:
+            for offset, length, digest in chunks:
+                if digest in local:
+                    src.seek(local[digest])
+                    dst.seek(offset)
+                    dst.write(src.read(length))
+            for offset, length, digest in chunks:
+                dst.seek(offset)
+                if chunk_digest(dst.read(length)) != digest:
+                    raise ValueError(f"Chunk at byte {offset} does not match the manifest")
+        os.replace(partial, filepath)
+    finally:
+        if os.path.exists(partial):
+            os.remove(partial)
+    logging.info("Download completed successfully")
+    return True
+
+
+def missing_ranges(chunks, local):
+    # (inicio, largo) de los tramos del archivo nuevo que no estan en la copia local
+    ranges = []
+    for offset, length, digest in chunks:
+        if digest in local:
+            continue
+        if ranges and sum(ranges[-1]) == offset:
+            ranges[-1] = (ranges[-1][0], ranges[-1][1] + length)
+        else:
+            ranges.append((offset, length))
+    return ranges
@@ -0,0 +1,167 @@
+import heapq
+import itertools
+import logging
+import random
+import selectors
+import socket
+import time
+
+# Emulador de enlace con perdidas, en proceso y sin privilegios (reemplazo de comcast/mininet
+# para pruebas locales). Es un proxy UDP con dos sockets:
+# -> front: donde manda el sender (o el cliente)
+# -> back: desde donde se reenvia al destino, y donde el destino tiene que contestar
+# Todo lo que entra por un lado sale por el otro con perdida, corrupcion, demora, jitter,
+# reordenamiento, duplicacion y limite de ancho de banda, elegidos con un generador con semilla.
+# Con el servidor async (un solo puerto) funciona tambien para cliente/servidor completos.
+
+POLL_INTERVAL = 0.1
+REORDER_DELAY = 0.005  # demora extra de un paquete reordenado, lo deja detras de los siguientes
+QUEUE_LIMIT = 1024 * 1024  # bytes encolados por sentido antes de descartar (con --rate)
+MAX_DATAGRAM_SIZE = 65536
+
+
+class LossyLink:
+    def __init__(
+        self,
+        target,
+        loss=0.0,
+        delay=0.0,
+        jitter=0.0,
+        reorder=0.0,
+        duplicate=0.0,
+        rate=None,
+        seed=None,
+        host="127.0.0.1",
+        front_port=0,
+        corrupt=0.0,
+        queue_limit=QUEUE_LIMIT,
+    ):
+        self.target = target
+        self.loss = loss
+        self.delay = delay
+        self.jitter = jitter
+        self.reorder = reorder
+        self.duplicate = duplicate
+        self.corrupt = corrupt
+        self.rate = rate  # bytes por segundo, None es sin limite
+        self.queue_limit = queue_limit
+        self.rng = random.Random(seed)
+
+        self.front = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.front.bind((host, front_port))
+        self.back = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.back.bind((host, 0))
+        self.client = None  # ultima direccion que mando algo al front
+
+        self.queue = []  # heap de (deliver_at, orden, socket, datagrama, direccion)
+        self.order = itertools.count()
+        self.link_free_at = {self.front: 0.0, self.back: 0.0}
+
+        self.forwarded = 0
+        self.dropped = 0
+        self.duplicated = 0
+        self.reordered = 0
+        self.corrupted = 0
+
+    @property
+    def front_addr(self):
+        return self.front.getsockname()
+
+    @property
+    def back_addr(self):
+        return self.back.getsockname()
+
+    def run(self, stop_event=None):
+        selector = selectors.DefaultSelector()
+        selector.register(self.front, selectors.EVENT_READ)
+        selector.register(self.back, selectors.EVENT_READ)
+        try:
+            while stop_event is None or not stop_event.is_set():
+                now = time.monotonic()
+                self._deliver(now)
+                timeout = POLL_INTERVAL
+                if self.queue:
+                    timeout = min(timeout, max(0.0, self.queue[0][0] - now))
+                for key, _ in selector.select(timeout):
+                    self._receive(key.fileobj)
+        finally:
+            selector.close()
+
+    def close(self):
+        self.front.close()
+        self.back.close()
+
+    def stats(self):
+        return {
+            "forwarded": self.forwarded,
+            "dropped": self.dropped,
+            "duplicated": self.duplicated,
+            "reordered": self.reordered,
+            "corrupted": self.corrupted,
+        }
+
+    def _receive(self, sock):
+        try:
+            data, addr = sock.recvfrom(MAX_DATAGRAM_SIZE)
+        except OSError as e:
+            logging.debug(f"Emulator receive error: {e}")
+            return
+
+        if sock is self.front:
+            self.client = addr
+            out, destination = self.back, self.target
+        elif self.client is not None:
+            out, destination = self.front, self.client
+        else:
+            return
+
+        if self.rng.random() < self.loss:
+            self.dropped += 1
+            return
+        if data and self.rng.random() < self.corrupt:
+            # se invierte un byte al azar: header o payload
+            self.corrupted += 1
+            corrupted = bytearray(data)
+            corrupted[self.rng.randrange(len(corrupted))] ^= 0xFF
+            data = bytes(corrupted)
+        now = time.monotonic()
+        self._schedule(out, data, destination, now)
+        if self.rng.random() < self.duplicate:
+            self.duplicated += 1
+            self._schedule(out, data, destination, now)
+
+    def _schedule(self, sock, data, destination, now):
+        delay = self.delay
+        if self.jitter:
+            delay = max(0.0, delay + self.rng.uniform(-self.jitter, self.jitter))
+        if self.reorder and self.rng.random() < self.reorder:
+            self.reordered += 1
+            delay += max(REORDER_DELAY, 2 * self.jitter)
+
+        departure = now
+        if self.rate:
+            # cola FIFO del enlace: cada paquete sale cuando termino de salir el anterior
+            start = max(now, self.link_free_at[sock])
+            if (start - now) * self.rate > self.queue_limit:
+                self.dropped += 1
+                return
+            departure = start + len(data) / self.rate
+            self.link_free_at[sock] = departure
+
+        deliver_at = departure + delay
+        if deliver_at <= now:
+            self._send(sock, data, destination)
+        else:
+            heapq.heappush(self.queue, (deliver_at, next(self.order), sock, data, destination))
+
+    def _deliver(self, now):
+        while self.queue and self.queue[0][0] <= now:
+            _, _, sock, data, destination = heapq.heappop(self.queue)
+            self._send(sock, data, destination)
+
+    def _send(self, sock, data, destination):
+        try:
+            sock.sendto(data, destination)
+            self.forwarded += 1
+        except OSError as e:
+            logging.debug(f"Emulator send error: {e}")
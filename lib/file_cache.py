@@ -0,0 +1,114 @@
+import collections
+import contextlib
+import os
+import threading
+from protocols.file_io import map_file, unmap_file
+
+# Mapeos compartidos de los archivos que manda el server
+# -> cada download mapeaba el archivo por su cuenta: con un archivo popular cada transferencia
+#    armaba su propio mmap y volvia a recorrer las mismas paginas (page faults, readahead)
+# -> ahora los downloads del mismo archivo comparten un solo mmap con contador de uso; cuando
+#    lo suelta el ultimo queda mapeado en un LRU acotado a max_bytes por si lo vuelven a pedir
+# -> un mapeo vale para una version del archivo (inodo, tamaño y mtime): si cambio se mapea de
+#    nuevo, y un upload lo invalida apenas empieza
+# -> un mapeo invalidado sigue vivo hasta que lo suelta el ultimo download que lo usa
+
+DEFAULT_CACHE_SIZE = 1024 * 1024 * 1024
+
+
+class _Mapping:
+    def __init__(self, view, identity):
+        self.view = view
+        self.identity = identity
+        self.size = len(view)
+        self.users = 0
+        self.cached = True
+
+
+class FileCache:
+    def __init__(self, max_bytes=DEFAULT_CACHE_SIZE, stats=None):
+        self.max_bytes = max_bytes
+        self.stats = stats
+        self._lock = threading.Lock()
+        self._mappings = collections.OrderedDict()  # path -> _Mapping, el menos usado primero
+        self._cached_bytes = 0
+
+    @contextlib.contextmanager
+    def mapped(self, path):
+        # vista del archivo compartida mientras dure la transferencia, o None si no se mapea
+        mapping = self._acquire(path)
+        try:
+            yield None if mapping is None else mapping.view
+        finally:
+            if mapping is not None:
+                self._release(mapping)
+
+    def invalidate(self, path):
+        with self._lock:
+            mapping = self._mappings.pop(path, None)
+            if mapping is not None:
+                self._drop(mapping)
+
+    def _acquire(self, path):
+        try:
+            f = open(path, "rb")
+        except OSError:
+            return None
+        with f:
+            stat = os.fstat(f.fileno())
+            identity = (stat.st_ino, stat.st_size, stat.st_mtime_ns)
+            with self._lock:
+                mapping = self._mappings.get(path)
+                if mapping is not None and mapping.identity == identity:
+                    self._mappings.move_to_end(path)
+                    mapping.users += 1
+                    self._count("file_cache_hits")
+                    return mapping
+                if mapping is not None:
+                    del self._mappings[path]
+                    self._drop(mapping)
+
+            # mapear fuera del lock; si otro download lo mapeo mientras tanto, gana el ultimo
+            view = map_file(f)
+            if view is None:
+                return None
+            mapping = _Mapping(view, identity)
+            mapping.users = 1
+            with self._lock:
+                previous = self._mappings.pop(path, None)
+                if previous is not None:
+                    self._drop(previous)
+                self._mappings[path] = mapping
+                self._cached_bytes += mapping.size
+                self._count("file_cache_misses")
+                self._evict()
+            return mapping
+
+    def _release(self, mapping):
+        with self._lock:
+            mapping.users -= 1
+            if not mapping.cached:
+                if mapping.users == 0:
+                    unmap_file(mapping.view)
+                return
+            self._evict()
+
+    def _evict(self):
+        # saca los mapeos sin uso mas viejos hasta entrar en max_bytes
+        for path, mapping in list(self._mappings.items()):
+            if self._cached_bytes <= self.max_bytes:
+                break
+            if mapping.users == 0:
+                del self._mappings[path]
+                self._drop(mapping)
+
+    def _drop(self, mapping):
+        # ya no se entrega; se libera ahora o cuando lo suelte el ultimo que lo usa
+        mapping.cached = False
+        self._cached_bytes -= mapping.size
+        if mapping.users == 0:
+            unmap_file(mapping.view)
+
+    def _count(self, name):
+        if self.stats is not None:
+            self.stats.increment(name)
@@ -0,0 +1,177 @@
+import concurrent.futures
+import logging
+import multiprocessing
+import os
+import socket
+import time
+from lib.client import (
+    client_handle_download,
+    client_handle_upload,
+    encode_command,
+    negotiated_options,
+    negotiated_window,
+    pacing_options,
+    transfer_options,
+    send_request,
+    setup_logging,
+    validate_file,
+    validate_path,
+)
+from lib.commands import int_param, parse_params
+from protocols.file_io import DIGEST_ALGORITHM, file_digest, resize_file
+from protocols.selective_repeat import CHUNK_SIZE
+
+# Transferencia de un archivo grande por varias sesiones a la vez
+# -> el archivo se parte en N rangos contiguos, alineados al tamaño de chunk
+# -> cada rango viaja en su propia sesion (su socket, handshake y comando con start/length),
+#    en threads o en procesos; con procesos cada sesion tiene su propio loop sin GIL
+# -> el server escribe cada rango en su offset de un .part compartido, identificado por el
+#    tamaño y el checksum del archivo completo que el cliente calcula antes de empezar
+# -> al final se compara el checksum del archivo completo de los dos lados (comando STAT); en
+#    un upload el STAT lleva commit=1 y el server reemplaza el archivo solo si el .part coincide
+
+SOCKET_TIMEOUT = 2.0
+DIGEST_TIMEOUT = 120.0  # el server tiene que leer el archivo entero antes de contestar
+
+
+def run_parallel(args, command):
+    setup_logging(args)
+    addr = (args.host, args.port)
+
+    if command == "upload":
+        validate_file(args.src)
+        filepath = args.src
+        size = os.path.getsize(filepath)
+        logging.info(f"Uploading file: {args.src} -> {args.name} over {args.streams} streams")
+        key = {"size": size, DIGEST_ALGORITHM: file_digest(filepath)}
+    else:
+        info = request_stat(addr, args.name)
+        if info is None:
+            logging.error("File not found on server")
+            return False
+        validate_path(args.dst)
+        filepath = os.path.join(args.dst, args.name)
+        size = int_param(info, "size")
+        key = {"size": size}
+        resize_file(filepath, size)
+        logging.info(f"Downloading file: {args.name} -> {args.dst} over {args.streams} streams")
+
+    ranges = split_ranges(size, args.streams)
+    start_time = time.monotonic()
+    if args.parallel == "processes":
+        executor = concurrent.futures.ProcessPoolExecutor(
+            len(ranges), mp_context=multiprocessing.get_context("fork")
+        )
+    else:
+        executor = concurrent.futures.ThreadPoolExecutor(len(ranges))
+    with executor:
+        futures = [
+            executor.submit(transfer_range, args, command, filepath, key, start, length)
+            for start, length in ranges
+        ]
+        failed = 0
+        for future in futures:
+            try:
+                future.result()
+            except Exception as e:
+                logging.error(f"Stream failed: {e}")
+                failed += 1
+    if failed:
+        logging.error(f"{failed} of {len(ranges)} streams failed")
+        return False
+
+    duration = time.monotonic() - start_time
+    rate = size / 1024 / duration if duration > 0 else 0
+    logging.info(f"All streams finished: {size} bytes in {duration:.2f}s ({rate:.2f} KB/s)")
+    commit = key if command == "upload" else None
+    if not verify_digest(addr, args.name, filepath, commit):
+        return False
+    logging.info(f"{command.capitalize()} completed successfully")
+    return True
+
+
+def split_ranges(size, streams):
+    # rangos (inicio, largo) alineados al chunk; un archivo vacio es un solo rango vacio
+    if size == 0:
+        return [(0, 0)]
+    chunks = -(-size // CHUNK_SIZE)
+    per_stream = -(-chunks // streams) * CHUNK_SIZE
+    return [(start, min(per_stream, size - start)) for start in range(0, size, per_stream)]
+
+
+def transfer_range(args, command, filepath, key, start, length):
+    # key: tamaño (y en un upload checksum) del archivo completo, comun a todos los rangos
+    addr = (args.host, args.port)
+    params = {**key, "start": start, "length": length, **transfer_options(args)}
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+        sock.settimeout(SOCKET_TIMEOUT)
+        response, transfer_address = send_request(
+            sock, addr, encode_command(args.name, command, params), args
+        )
+        logging.debug(f"Stream for bytes {start}-{start + length} started")
+        if command == "upload":
+            if not response.startswith(b"READY"):
+                raise ConnectionError("Server not ready")
+            _, reply_params = parse_params(response)
+            client_handle_upload(
+                sock,
+                transfer_address,
+                filepath,
+                args.protocol,
+                negotiated_window(args, reply_params),
+                args.cc,
+                start,
+                length,
+                **negotiated_options(reply_params),
+                **pacing_options(args, reply_params),
+            )
+        else:
+            if not response.startswith(b"FOUND"):
+                raise FileNotFoundError("File not found on server")
+            _, reply_params = parse_params(response)
+            client_handle_download(
+                sock,
+                transfer_address,
+                filepath,
+                args.protocol,
+                negotiated_window(args, reply_params),
+                start + length,
+                start=start,
+                **negotiated_options(reply_params),
+            )
+
+
+def request_stat(addr, name, digest=False, commit=None):
+    # devuelve los parametros de la respuesta INFO, o None si el archivo no existe
+    # commit: tamaño y checksum de un upload en paralelo que el server confirma antes de contestar
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+        sock.settimeout(DIGEST_TIMEOUT if digest else SOCKET_TIMEOUT)
+        params = {"digest": 1} if digest else None
+        if commit is not None:
+            params = {**(params or {}), "commit": 1, **commit}
+        response, _ = send_request(sock, addr, encode_command(name, "stat", params))
+    if not response.startswith(b"INFO"):
+        return None
+    _, params = parse_params(response)
+    return params
+
+
+def verify_digest(addr, name, filepath, commit=None):
+    # commit: el del upload, con el checksum local ya calculado
+    with concurrent.futures.ThreadPoolExecutor(1) as executor:
+        remote = executor.submit(request_stat, addr, name, True, commit)
+        local_digest = file_digest(filepath) if commit is None else commit[DIGEST_ALGORITHM]
+        try:
+            info = remote.result()
+        except (OSError, ConnectionError) as e:
+            logging.error(f"Could not get the server checksum: {e}")
+            return False
+
+    remote_digest = info.get(DIGEST_ALGORITHM) if info is not None else None
+    if remote_digest != local_digest:
+        logging.error(
+            f"Checksum mismatch: local {DIGEST_ALGORITHM} {local_digest}, server {remote_digest}"
+        )
+        return False
+    logging.info(f"Checksum verified ({DIGEST_ALGORITHM} {local_digest})")
+    return True
@@ -0,0 +1,110 @@
+import errno
+import logging
+import socket
+import time
+from protocols.package import MAX_HEADER_SIZE
+from protocols.fec import PARITY_HEADER_SIZE
+from lib.commands import encode_params, int_param, parse_params
+
+# Descubrimiento del MTU del camino (PMTU) para elegir el tamaño de chunk
+# -> con DF (IP_PMTUDISC_DO) el kernel no fragmenta: un datagrama mas grande que el MTU que
+#    conoce falla al mandarse (EMSGSIZE) y uno mas grande que el de algun salto se descarta
+# -> el cliente prueba una escalera de MTUs de mayor a menor mandando PROBE con relleno; el
+#    server contesta PROBE_ACK con el tamaño que le llego y el primero confirmado es el PMTU
+# -> sin jumbo la escalera empieza en el MTU de Ethernet; con jumbo prueba antes el de
+#    loopback y el de jumbo frames (datacenter)
+# El server anuncia en el HI_ACK que contesta probes, asi que con servers viejos no se prueba.
+# El handshake rapido no tiene el RTT de los probes: usa el PMTU que el kernel ya conoce del
+# destino (el MTU de la interfaz de salida, o uno menor aprendido de un ICMP "fragmentation
+# needed"; Linux manda UDP con DF, asi que lo aprende en la primera transferencia por el camino).
+# El chunk es lo que entra en el MTU descontando los headers IP/UDP y el header mas grande del
+# protocolo: un paquete perdido es un solo frame y no un datagrama fragmentado.
+
+IP_MTU_DISCOVER = getattr(socket, "IP_MTU_DISCOVER", 10)
+IP_PMTUDISC_DO = getattr(socket, "IP_PMTUDISC_DO", 2)
+IP_MTU = getattr(socket, "IP_MTU", 14)
+
+PROBE = b"PROBE"
+PROBE_ACK = b"PROBE_ACK"
+IP_UDP_OVERHEAD = 28
+MTU_LADDER = (1500, 1492, 1280, 576)
+JUMBO_MTU_LADDER = (65535, 9000) + MTU_LADDER
+PROBE_TIMEOUT = 0.2
+PROBE_TRIES = 2
+
+MIN_CHUNK_SIZE = 512
+MAX_CHUNK_SIZE = 65535 - IP_UDP_OVERHEAD - MAX_HEADER_SIZE - PARITY_HEADER_SIZE
+
+
+def chunk_size_for_mtu(mtu):
+    return mtu - IP_UDP_OVERHEAD - MAX_HEADER_SIZE - PARITY_HEADER_SIZE
+
+
+def negotiate_chunk_size(requested):
+    # el server acepta el chunk pedido dentro de los limites; None si no se pidio
+    if requested is None:
+        return None
+    return min(max(requested, MIN_CHUNK_SIZE), MAX_CHUNK_SIZE)
+
+
+def probe_reply(probe):
+    return encode_params(PROBE_ACK, {"size": len(probe)})
+
+
+def cached_path_mtu(addr):
+    # PMTU que tiene el kernel para addr sin mandar nada, o None si no lo expone
+    try:
+        with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+            sock.connect(addr)
+            return sock.getsockopt(socket.IPPROTO_IP, IP_MTU)
+    except OSError:
+        return None
+
+
+def probe_path_mtu(sock, addr, ladder=MTU_LADDER):
+    # devuelve el MTU mas grande de la escalera que llega al server, o None
+    try:
+        previous = sock.getsockopt(socket.IPPROTO_IP, IP_MTU_DISCOVER)
+        sock.setsockopt(socket.IPPROTO_IP, IP_MTU_DISCOVER, IP_PMTUDISC_DO)
+    except OSError:
+        # sin DF los probes grandes se fragmentan y llegan igual: no sirven para medir
+        logging.debug("Cannot set the DF bit, skipping path MTU discovery")
+        return None
+
+    timeout = sock.gettimeout()
+    try:
+        for mtu in ladder:
+            size = mtu - IP_UDP_OVERHEAD
+            probe = PROBE + bytes(size - len(PROBE))
+            for _ in range(PROBE_TRIES):
+                try:
+                    sock.sendto(probe, addr)
+                except OSError as e:
+                    if e.errno != errno.EMSGSIZE:
+                        raise
+                    break  # mas grande que el MTU que ya conoce el kernel
+                if _wait_probe_ack(sock, size):
+                    logging.debug(f"Path MTU probe of {mtu} bytes acknowledged")
+                    return mtu
+            logging.debug(f"Path MTU probe of {mtu} bytes failed")
+    finally:
+        sock.settimeout(timeout)
+        sock.setsockopt(socket.IPPROTO_IP, IP_MTU_DISCOVER, previous)
+    return None
+
+
+def _wait_probe_ack(sock, size):
+    # los ACKs atrasados de probes anteriores (otro tamaño) se ignoran
+    deadline = time.monotonic() + PROBE_TIMEOUT
+    while True:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            return False
+        sock.settimeout(remaining)
+        try:
+            response, _ = sock.recvfrom(1024)
+        except socket.timeout:
+            return False
+        head, params = parse_params(response)
+        if head == PROBE_ACK and int_param(params, "size") == size:
+            return True
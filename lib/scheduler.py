@@ -0,0 +1,249 @@
+import collections
+import threading
+import time
+from protocols.pacing import rate_from_mbits
+
+# Reparto del uplink del server entre sesiones
+# -> sin techos cada transferencia manda lo que le permite su ventana, y un download de
+#    selective repeat con la ventana llena le gana el enlace a uno de stop & wait
+# -> --total-rate (todo el server) y --client-rate (cada IP de cliente) son token buckets en
+#    Mbit/s que admiten deuda, como el pacer (protocols/pacing.py)
+# -> los datagramas de los downloads que esperan turno se atienden con deficit round robin: en
+#    cada vuelta una sesion suma QUANTUM bytes de credito y manda mientras le alcance, asi el
+#    enlace se reparte en bytes y no en datagramas (ni en quien llama mas seguido)
+# -> el server async encola los datagramas y los despacha (submit/dispatch); en el server con
+#    threads cada transferencia espera su turno al mandar (acquire, ver BatchedSocket)
+# -> admision: con --max-sessions sesiones en curso las nuevas esperan un lugar en orden (hasta
+#    --max-queued, el cliente recibe QUEUED) o se rechazan con BUSY y un retry en segundos
+# Con varios workers cada proceso tiene su scheduler: los techos valen por worker.
+
+QUANTUM = 16 * 1024  # credito por vuelta: al menos un datagrama del chunk mas grande
+BURST_TIME = 0.005  # rafaga que admite un bucket lleno, en segundos de su tasa
+QUEUE_TIMEOUT = 30.0  # lo que espera una sesion encolada antes de rendirse
+BUSY_RETRY = 1  # segundos que se le sugieren al cliente rechazado
+
+ADMITTED = "admitted"
+QUEUED = "queued"
+BUSY = "busy"
+
+
+class TokenBucket:
+    def __init__(self, rate):
+        self.rate = rate  # bytes/s
+        self.burst = max(QUANTUM, rate * BURST_TIME)
+        self.tokens = self.burst
+        self.last = time.monotonic()
+
+    def refill(self, now):
+        self.tokens = min(self.burst, self.tokens + (now - self.last) * self.rate)
+        self.last = now
+
+    def ready(self):
+        return self.tokens >= 0
+
+    def ready_at(self):
+        # cuando se termina de pagar la deuda
+        return self.last - self.tokens / self.rate
+
+
+class Flow:
+    # los datagramas de una sesion que esperan turno
+    def __init__(self, scheduler, ip, bucket):
+        self.scheduler = scheduler
+        self.ip = ip
+        self.bucket = bucket  # techo de la IP, compartido con sus otras sesiones
+        self.queue = collections.deque()  # (tamaño, item)
+        self.deficit = 0
+        self.credited = False  # ya sumo el QUANTUM de esta vuelta
+        self.active = False
+
+    def acquire(self, size, wait=True):
+        return self.scheduler.acquire(self, size, wait)
+
+
+class _Ticket:
+    def __init__(self):
+        self.granted = False
+
+
+class FairScheduler:
+    def __init__(self, total_rate=None, client_rate=None, quantum=QUANTUM):
+        self.total = TokenBucket(total_rate) if total_rate else None
+        self.client_rate = client_rate
+        self.quantum = quantum
+        self._cond = threading.Condition()
+        self._clients = {}  # ip -> [bucket, sesiones]
+        self._active = collections.deque()  # flows con datagramas esperando, en orden de turno
+
+    def flow(self, ip):
+        with self._cond:
+            client = self._clients.get(ip)
+            if client is None:
+                bucket = TokenBucket(self.client_rate) if self.client_rate else None
+                client = self._clients[ip] = [bucket, 0]
+            client[1] += 1
+            return Flow(self, ip, client[0])
+
+    def release(self, flow):
+        # termino la sesion: lo que le quedaba encolado ya no sale
+        with self._cond:
+            flow.queue.clear()
+            self._deactivate(flow)
+            client = self._clients[flow.ip]
+            client[1] -= 1
+            if client[1] == 0:
+                del self._clients[flow.ip]
+            self._cond.notify_all()
+
+    def submit(self, flow, size, item):
+        with self._cond:
+            self._submit(flow, size, item)
+
+    def dispatch(self, now=None):
+        # (items que pueden salir ya, en orden, y cuando volver a despachar o None)
+        with self._cond:
+            return self._dispatch(time.monotonic() if now is None else now)
+
+    def acquire(self, flow, size, wait=True):
+        # modo threads: bloquea hasta que le toca a este datagrama. Con wait=False no espera
+        # y devuelve False si no tiene turno ya (el que llama puede mandar lo que tenga antes)
+        ticket = _Ticket()
+        with self._cond:
+            self._submit(flow, size, ticket)
+            while True:
+                now = time.monotonic()
+                granted, wake = self._dispatch(now)
+                for other in granted:
+                    other.granted = True
+                if granted:
+                    self._cond.notify_all()
+                if ticket.granted:
+                    return True
+                if not wait:
+                    flow.queue.remove((size, ticket))
+                    if not flow.queue:
+                        self._deactivate(flow)
+                    return False
+                self._cond.wait(None if wake is None else max(0.0, wake - now))
+
+    def _submit(self, flow, size, item):
+        flow.queue.append((size, item))
+        if not flow.active:
+            flow.active = True
+            flow.deficit = 0
+            flow.credited = False
+            self._active.append(flow)
+
+    def _deactivate(self, flow):
+        if flow.active:
+            self._active.remove(flow)
+            flow.active = False
+
+    def _dispatch(self, now):
+        if self.total is not None:
+            self.total.refill(now)
+        for bucket, _ in self._clients.values():
+            if bucket is not None:
+                bucket.refill(now)
+
+        granted = []
+        blocked = 0  # flows seguidos frenados por el techo de su IP
+        while self._active and blocked < len(self._active):
+            if self.total is not None and not self.total.ready():
+                break
+            flow = self._active[0]
+            if flow.bucket is not None and not flow.bucket.ready():
+                # no pierde el credito de la vuelta: sigue cuando se libere su IP
+                self._active.rotate(-1)
+                blocked += 1
+                continue
+            blocked = 0
+            if not flow.credited:
+                flow.deficit += self.quantum
+                flow.credited = True
+            while flow.queue and flow.queue[0][0] <= flow.deficit:
+                if self.total is not None and not self.total.ready():
+                    break
+                if flow.bucket is not None and not flow.bucket.ready():
+                    break
+                size, item = flow.queue.popleft()
+                flow.deficit -= size
+                if self.total is not None:
+                    self.total.tokens -= size
+                if flow.bucket is not None:
+                    flow.bucket.tokens -= size
+                granted.append(item)
+            if not flow.queue:
+                self._active.popleft()
+                flow.active = False
+            elif flow.queue[0][0] > flow.deficit:
+                # se le termino el credito: turno del siguiente
+                self._active.rotate(-1)
+                flow.credited = False
+            # si no, lo freno un bucket y se resuelve en la proxima vuelta del while
+        return granted, self._wake_time()
+
+    def _wake_time(self):
+        if not self._active:
+            return None
+        if self.total is not None and not self.total.ready():
+            return self.total.ready_at()
+        return min(
+            (flow.bucket.ready_at() for flow in self._active if flow.bucket is not None),
+            default=None,
+        )
+
+
+class Admission:
+    # lugares para sesiones en curso; las que no entran esperan en orden o se rechazan
+    def __init__(self, max_sessions=None, max_queued=0):
+        self.max_sessions = max_sessions
+        self.max_queued = max_queued
+        self.active = 0
+        self._lock = threading.Lock()
+        self._waiting = collections.deque()  # callbacks de las sesiones encoladas
+
+    def request(self, on_admit):
+        # (estado, posicion en la cola); con QUEUED on_admit se llama cuando se libera un lugar
+        with self._lock:
+            if self.max_sessions is None or self.active < self.max_sessions:
+                self.active += 1
+                return ADMITTED, 0
+            if len(self._waiting) < self.max_queued:
+                self._waiting.append(on_admit)
+                return QUEUED, len(self._waiting)
+            return BUSY, 0
+
+    def cancel(self, on_admit):
+        # False si ya se le habia dado el lugar (entonces tiene que llamar a leave)
+        with self._lock:
+            try:
+                self._waiting.remove(on_admit)
+            except ValueError:
+                return False
+            return True
+
+    def leave(self):
+        # el lugar pasa directo a la primera sesion encolada
+        with self._lock:
+            if not self._waiting:
+                self.active -= 1
+                return
+            on_admit = self._waiting.popleft()
+        on_admit()
+
+
+def create_scheduler(args):
+    # None sin techos: no hace falta repartir nada
+    total_rate = rate_from_mbits(getattr(args, "total_rate", None))
+    client_rate = rate_from_mbits(getattr(args, "client_rate", None))
+    if total_rate is None and client_rate is None:
+        return None
+    return FairScheduler(total_rate, client_rate)
+
+
+def create_admission(args):
+    max_sessions = getattr(args, "max_sessions", None)
+    if max_sessions is None:
+        return None
+    return Admission(max_sessions, getattr(args, "max_queued", 0) or 0)
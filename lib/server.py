@@ -1,44 +1,166 @@
+import contextlib
 import socket
 import os
 import logging
 import threading
-from protocols.stop_and_wait import stop_and_wait_receive, stop_and_wait_send
-from protocols.selective_repeat import selective_repeat_receive, selective_repeat_send
+import time
+from protocols.engines import get_engine, receive_file, send_file
+from protocols.selective_repeat import CHUNK_SIZE, WINDOW_SIZE, negotiate_window
+from lib.commands import encode_params, int_param, parse_params
+from lib.stats import ServerStats, start_exporter
+from lib.chunk_store import ChunkStore
+from lib.file_cache import FileCache
+from lib.scheduler import (
+    ADMITTED,
+    BUSY_RETRY,
+    QUEUE_TIMEOUT,
+    QUEUED,
+    create_admission,
+    create_scheduler,
+)
+from protocols.journal import resume_journal
+from protocols.checksum import negotiate_checksum
+from protocols.compression import negotiate_compression
+from protocols.fec import parse_fec
+from protocols.pacing import negotiate_rate, rate_from_mbits
+from protocols.batch_io import MAX_DATAGRAM_SIZE
+from lib.pmtu import PROBE, negotiate_chunk_size, probe_reply
+from lib.session import SESSION_IDLE_TIMEOUT, RecentHellos, fast_command, stale_eof_ack
+from protocols.package import is_control
+from protocols.file_io import DIGEST_ALGORITHM, file_digest, resize_file
 
 TIMEOUT = 0.5
+PART_SUFFIX = ".part"  # upload en curso, reemplaza al archivo al terminar bien
+SHUTDOWN_GRACE = 30.0  # tiempo que se espera a las transferencias en curso al apagar
+# probe=1: este server contesta los probes de MTU antes del comando
+# session=1: acepta varios comandos por sesion (keep=1, ver lib/session.py)
+# delta=1: sirve manifiestos de chunks y acepta uploads delta (ver lib/delta.py)
+HANDSHAKE_PARAMS = {"probe": 1, "session": 1, "delta": 1}
 
 
-def run_server(args):
+class HandshakeReplies:
+    # respuestas del handshake de una sesion (HI_ACK, QUEUED/BUSY o READY/FOUND en el handshake
+    # rapido): si el cliente repite el HI, el loop principal repite la ultima
+    def __init__(self, hello):
+        self.hello = bytes(hello)
+        self.sock = None
+        self.last = None
+        self.finished = None  # cuando termino la sesion, si llego a correr
+
+    def sendto(self, data, addr):
+        self.last = data
+        self.sock.sendto(data, addr)
+
+    def repeat(self, addr):
+        if self.last is None:
+            return
+        try:
+            self.sock.sendto(self.last, addr)
+        except OSError:
+            pass  # la sesion justo cerro su socket
+
+
+def run_server(args, stats=None, stop_event=None):
     host, port = args.host, args.port
     storage, protocol = args.storage, args.protocol
+    window_size, congestion = args.window, args.cc
+    rate_limit = rate_from_mbits(getattr(args, "rate", None))
 
     setup_logging(args)
     validate_storage(storage)
+    chunks = ChunkStore(storage)
+
+    # con varios workers el proceso padre junta las estadisticas y las exporta
+    exporter = None
+    if stats is None:
+        stats = ServerStats()
+        exporter = start_exporter(args, stats.snapshot)
+    files = create_file_cache(args, stats)
+    scheduler = create_scheduler(args)
+    admission = create_admission(args)
 
     with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as s_socket:
         try:
-            s_socket.bind((host, port))
+            bind_server_socket(s_socket, args)
             print("Server started on {}:{}".format(host, port))
 
-            while True:
-                data, addr = s_socket.recvfrom(1024)
+            # con stop_event el loop se despierta periodicamente para poder apagarse
+            if stop_event is not None:
+                s_socket.settimeout(TIMEOUT)
+            sessions = {}  # addr -> (thread, respuestas del handshake) de las sesiones en curso
+            recent = RecentHellos()
+
+            while stop_event is None or not stop_event.is_set():
+                try:
+                    data, addr = s_socket.recvfrom(1024)
+                except socket.timeout:
+                    continue
+                for client_addr, (thread, replies) in list(sessions.items()):
+                    if not thread.is_alive():
+                        # una sesion rechazada (BUSY) no cuenta: el cliente repite el mismo HI
+                        if replies.finished is not None:
+                            recent.add(client_addr, replies.hello, replies.finished)
+                        del sessions[client_addr]
+                if addr in sessions and (data[:2] != b"HI" or sessions[addr][1].hello == data):
+                    # se perdio la respuesta del handshake y el cliente repite el HI
+                    sessions[addr][1].repeat(addr)
+                    continue
+                # otro HI desde la misma direccion (otro nonce, ver lib/session.py) abre una
+                # sesion nueva: la anterior termina sola por timeout en su puerto
+                if recent.duplicate(addr, data):
+                    logging.debug(f"Ignoring repeated HI from {addr[0]}:{addr[1]}")
+                    continue
+                replies = HandshakeReplies(data)
                 client_thread = threading.Thread(
                     target=server_handle_request,
-                    args=(s_socket, data, addr, storage, protocol),
+                    args=(
+                        s_socket,
+                        data,
+                        addr,
+                        storage,
+                        protocol,
+                        window_size,
+                        congestion,
+                        stats,
+                        rate_limit,
+                        chunks,
+                        files,
+                        scheduler,
+                        admission,
+                        replies,
+                    ),
                     daemon=True,
                 )
                 client_thread.start()
+                sessions[addr] = (client_thread, replies)
+
+            # apagado ordenado: no se aceptan sesiones nuevas pero se terminan las actuales
+            shutdown_deadline = time.monotonic() + SHUTDOWN_GRACE
+            for client_thread, _ in sessions.values():
+                client_thread.join(max(0.0, shutdown_deadline - time.monotonic()))
 
         except Exception as e:
             logging.error(f"Server error: {str(e)}")
+        finally:
+            if exporter is not None:
+                exporter.stop()
+
 
+def bind_server_socket(sock, args):
+    # con varios workers todos comparten el puerto y el kernel reparte por (ip, puerto)
+    # de origen, asi que todos los datagramas de un cliente llegan al mismo proceso
+    if getattr(args, "workers", 1) > 1:
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+    sock.bind((args.host, args.port))
 
-def three_way_handshake(socket, addr, data):
+
+def three_way_handshake(socket, addr, data, replies=None):
     if data.startswith(b"HI"):
-        socket.sendto(b"HI_ACK", addr)
+        (replies or socket).sendto(encode_params("HI_ACK", HANDSHAKE_PARAMS), addr)
         try:
-            received, _ = socket.recvfrom(3)
-            if received.startswith(b"ACK"):
+            received, _ = socket.recvfrom(MAX_DATAGRAM_SIZE)
+            # un probe de MTU implica que el cliente ya mando el ACK (y reintenta el probe)
+            if received.startswith(b"ACK") or received.startswith(PROBE):
                 return True
             else:
                 logging.error("Invalid ACK message")
@@ -50,86 +172,487 @@ def three_way_handshake(socket, addr, data):
         return False
 
 
-def server_handle_request(sock, data, addr, storage_dir, protocol):
+def server_handle_request(
+    sock,
+    data,
+    addr,
+    storage_dir,
+    protocol,
+    window_size,
+    congestion,
+    stats=None,
+    rate_limit=None,
+    chunks=None,
+    files=None,
+    scheduler=None,
+    admission=None,
+    replies=None,
+):
     client_ip, client_port = addr
     transfer_sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
     transfer_sock.settimeout(2.0)
     transfer_sock.bind(("", 0))
     transfer_port = transfer_sock.getsockname()[1]
+    if replies is None:
+        replies = HandshakeReplies(data)
+    replies.sock = transfer_sock
+
+    if not admit_session(replies, addr, admission, stats):
+        transfer_sock.close()
+        return
+    # los downloads de la sesion mandan cuando les da turno el scheduler (ver lib/scheduler.py)
+    flow = scheduler.flow(client_ip) if scheduler is not None else None
 
     logging.info(f"New connection from {client_ip}:{client_port}")
+    if stats is not None:
+        stats.session_started()
+
+    try:
+        # handshake rapido: el HI ya trae el comando (ver lib/session.py) y la respuesta sale
+        # del puerto de transferencia; si se pierde, el loop principal la repite
+        msg = fast_command(data)
+        if msg is not None:
+            handshake_ok, reply_sock = True, replies
+            logging.info(
+                f"Fast handshake with {client_ip}:{client_port}, transfer port: {transfer_port}"
+            )
+        else:
+            handshake_ok, reply_sock = three_way_handshake(transfer_sock, addr, data, replies), sock
+            if handshake_ok:
+                logging.info(
+                    f"Handshake successful with {client_ip}:{client_port}, transfer port: {transfer_port}"
+                )
+
+        if handshake_ok:
+            # con keep=1 la sesion sigue con otro comando al terminar; los que lleguen durante
+            # la transferencia quedan en control
+            control = []
+            try:
+                if msg is None:
+                    msg, _ = transfer_sock.recvfrom(MAX_DATAGRAM_SIZE)
+                    while msg.startswith(PROBE):
+                        transfer_sock.sendto(probe_reply(msg), addr)
+                        msg, _ = transfer_sock.recvfrom(MAX_DATAGRAM_SIZE)
+                while msg is not None:
+                    params = handle_command(
+                        reply_sock,
+                        transfer_sock,
+                        addr,
+                        msg,
+                        storage_dir,
+                        protocol,
+                        window_size,
+                        congestion,
+                        stats,
+                        rate_limit,
+                        control,
+                        chunks,
+                        files,
+                        flow,
+                    )
+                    if int_param(params, "keep") != 1:
+                        break
+                    # las respuestas de los comandos siguientes ya no son del handshake
+                    reply_sock = sock
+                    msg = next_command(transfer_sock, addr, control)
+
+            except Exception as e:
+                logging.error(
+                    f"Error handling request from {client_ip}:{client_port}: {str(e)}"
+                )
+                if stats is not None:
+                    stats.increment("failed")
+        else:
+            logging.warning(f"Handshake failed with {client_ip}:{client_port}")
+            if stats is not None:
+                stats.increment("failed")
+    finally:
+        replies.finished = time.monotonic()
+        transfer_sock.close()
+        if flow is not None:
+            scheduler.release(flow)
+        if admission is not None:
+            admission.leave()
+        if stats is not None:
+            stats.session_finished()
+
+
+def admit_session(sock, addr, admission, stats=None):
+    # con el server lleno la sesion espera un lugar o se rechaza; False si no entra
+    if admission is None:
+        return True
+    admitted = threading.Event()
+    status, position = admission.request(admitted.set)
+    if status == ADMITTED:
+        return True
+    client_ip, client_port = addr
+    if status == QUEUED:
+        logging.info(f"Server full, {client_ip}:{client_port} queued at position {position}")
+        if stats is not None:
+            stats.increment("sessions_queued")
+        sock.sendto(encode_params("QUEUED", {"position": position}), addr)
+        if admitted.wait(QUEUE_TIMEOUT) or not admission.cancel(admitted.set):
+            return True
+    logging.warning(f"Server full, rejecting {client_ip}:{client_port}")
+    if stats is not None:
+        stats.increment("sessions_rejected")
+    sock.sendto(encode_params("BUSY", {"retry": BUSY_RETRY}), addr)
+    return False
+
+
+def handle_command(
+    sock,
+    transfer_sock,
+    addr,
+    msg,
+    storage_dir,
+    protocol,
+    window_size,
+    congestion,
+    stats=None,
+    rate_limit=None,
+    control=None,
+    chunks=None,
+    files=None,
+    flow=None,
+):
+    # atiende un comando de la sesion y devuelve sus parametros
+    client_ip, client_port = addr
+    transfer_port = transfer_sock.getsockname()[1]
+    command, filename, params = parse_request(msg)
+    legacy = legacy_client(params)
+    options = negotiate_options(protocol, params, rate_limit, window_size)
+    chunk_size = options["chunk"] or CHUNK_SIZE
+    window_size = options["window"] or window_size
+
+    if command == "upload":
+        filepath = os.path.join(storage_dir, filename)
+
+        logging.info(f"Upload request for '{filename}' from {client_ip}:{client_port}")
+        start, _ = range_params(params)
+        if files is not None and start is None:
+            files.invalidate(filepath)
+        destination, journal, end = prepare_upload(filepath, filename, params, chunks)
+        sock.sendto(command_reply(upload_reply(transfer_port, journal, options), legacy), addr)
+
+        metrics = receive_file(
+            protocol,
+            transfer_sock,
+            addr,
+            destination,
+            journal,
+            start,
+            control,
+            window_size=window_size,
+            file_size=end,
+            checksum=options["checksum"],
+            compression=options["compress"],
+            fec=options["fec"] is not None,
+            chunk_size=chunk_size,
+            legacy=legacy,
+        )
+
+        log_upload_complete(filename, metrics)
+        if stats is not None:
+            stats.record_upload(metrics)
+        finish_upload(chunks, filepath, destination, filename, params, metrics, stats)
+
+    elif command == "download":
+        filepath = download_source(storage_dir, filename, params, chunks)
 
-    if three_way_handshake(transfer_sock, addr, data):
+        if filepath is None:
+            logging.warning(f"Download request failed: File '{filename}' not found")
+            sock.sendto(b"NOTFOUND", addr)
+            return params
+
+        size = os.path.getsize(filepath)
+        filesize = size / 1024  # KB
         logging.info(
-            f"Handshake successful with {client_ip}:{client_port}, transfer port: {transfer_port}"
+            f"Download request for '{filename}' ({filesize:.2f} KB) from {client_ip}:{client_port}"
         )
+        start, length = range_params(params)
+        offset = download_offset(filepath, params) if start is None else start
+        reply = download_reply(transfer_port, filepath, offset, options)
+        sock.sendto(command_reply(reply, legacy), addr)
 
-        try:
-            msg, _ = transfer_sock.recvfrom(1024)
+        with shared_mapping(files, filepath) as mapped:
+            metrics = send_file(
+                protocol,
+                transfer_sock,
+                addr,
+                filepath,
+                offset,
+                control,
+                flow,
+                window_size=window_size,
+                congestion=congestion,
+                length=length,
+                checksum=options["checksum"],
+                compression=options["compress"],
+                fec=options["fec"],
+                chunk_size=chunk_size,
+                max_rate=options["rate"],
+                mapped=mapped,
+                early_eof=options["eof"] is not None,
+                legacy=legacy,
+            )
 
-            if msg.startswith(b"UPLOAD"):
-                filename = msg[6:].decode()
-                filepath = os.path.join(storage_dir, filename)
+        log_download_complete(filename, metrics)
+        if stats is not None:
+            stats.record_download(metrics)
 
-                logging.info(
-                    f"Upload request for '{filename}' from {client_ip}:{client_port}"
-                )
-                sock.sendto(f"READY:{transfer_port}".encode(), addr)
+    elif command == "stat":
+        filepath = os.path.join(storage_dir, filename)
+        sock.sendto(stat_command(filepath, filename, params, chunks, files), addr)
 
-                if protocol == "saw":
-                    total_bytes, duration, duplicates = stop_and_wait_receive(
-                        transfer_sock, addr, filepath
-                    )
-                elif protocol == "sr":
-                    total_bytes, duration, duplicates = selective_repeat_receive(
-                        transfer_sock, addr, filepath
-                    )
+    return params
 
-                filesize_kb = total_bytes / 1024
-                transfer_rate = filesize_kb / duration if duration > 0 else 0
 
-                logging.info(
-                    f"Upload complete: '{filename}', {filesize_kb:.2f} KB, {transfer_rate:.2f} KB/s"
-                )
+def next_command(transfer_sock, addr, control):
+    # proximo comando de una sesion persistente, o None si el cliente no manda mas
+    if control:
+        return control.pop(0)
+    transfer_sock.settimeout(SESSION_IDLE_TIMEOUT)
+    try:
+        while True:
+            msg, _ = transfer_sock.recvfrom(MAX_DATAGRAM_SIZE)
+            if is_control(msg):
+                return msg
+            reply = stale_eof_ack(msg)
+            if reply is not None:
+                transfer_sock.sendto(reply, addr)
+    except socket.timeout:
+        return None
 
-            elif msg.startswith(b"DOWNLOAD"):
-                filename = msg[8:].decode()
-                filepath = os.path.join(storage_dir, filename)
 
-                if not os.path.exists(filepath):
-                    logging.warning(
-                        f"Download request failed: File '{filename}' not found"
-                    )
-                    sock.sendto(b"NOTFOUND", addr)
-                    return
+def parse_request(msg):
+    msg, params = parse_params(msg)
+    if msg.startswith(b"UPLOAD"):
+        return "upload", msg[6:].decode(), params
+    elif msg.startswith(b"DOWNLOAD"):
+        return "download", msg[8:].decode(), params
+    elif msg.startswith(b"STAT"):
+        return "stat", msg[4:].decode(), params
+    return None, None, params
 
-                filesize = os.path.getsize(filepath) / 1024  # KB
-                logging.info(
-                    f"Download request for '{filename}' ({filesize:.2f} KB) from {client_ip}:{client_port}"
-                )
-                sock.sendto(f"FOUND:{transfer_port}".encode(), addr)
 
-                if protocol == "saw":
-                    total_bytes, duration, retransmissions = stop_and_wait_send(
-                        transfer_sock, addr, filepath
-                    )
-                elif protocol == "sr":
-                    total_bytes, duration, retransmissions = selective_repeat_send(
-                        transfer_sock, addr, filepath
-                    )
+def legacy_client(params):
+    # un comando sin parametros es de un cliente original (ver lib/commands.py): se le contesta
+    # como siempre y la transferencia va con el header de 2 bytes
+    return not params
 
-                transfer_rate = (total_bytes / 1024) / duration if duration > 0 else 0
 
-                logging.info(
-                    f"Download complete: '{filename}', {total_bytes / 1024:.2f} KB, {transfer_rate:.2f} KB/s"
-                )
+def command_reply(reply, legacy=False):
+    # al cliente original se le contesta como el server de siempre, sin parametros
+    return parse_params(reply)[0] if legacy else reply
 
-        except Exception as e:
-            logging.error(
-                f"Error handling request from {client_ip}:{client_port}: {str(e)}"
-            )
-    else:
-        logging.warning(f"Handshake failed with {client_ip}:{client_port}")
+
+def prepare_upload(filepath, filename, params, chunks=None):
+    # (destino, journal, fin de lo que se recibe) de un upload
+    # -> delta: se recibe aparte y se arma al terminar (ver lib/chunk_store.py)
+    # -> rango de una transferencia en paralelo: en el .part que comparten las sesiones del
+    #    mismo upload, sin journal; reemplaza al archivo con el STAT commit=1 (commit_upload)
+    # -> el resto se recibe en <archivo>.part (con su journal para retomar) y reemplaza al
+    #    anterior solo si el digest coincide: un upload corrupto no pisa lo que habia
+    start, length = range_params(params)
+    size = int_param(params, "size")
+    if chunks is not None and params.get("delta") == "1":
+        return chunks.delta_path(filename), None, size
+    if start is not None:
+        destination = range_part_path(filepath, params)
+        resize_file(destination, size)
+        return destination, None, start + length
+    destination = filepath + PART_SUFFIX
+    return destination, upload_journal(destination, params), size
+
+
+def finish_upload(chunks, filepath, destination, filename, params, metrics, stats=None):
+    start, _ = range_params(params)
+    if metrics.digest_ok is False:
+        # lo recibido no es lo que mando el cliente (se lo dice el ACK del EOF)
+        logging.error(f"Discarding the upload of '{filename}', the previous file is kept")
+        if start is None:
+            with contextlib.suppress(FileNotFoundError):
+                os.remove(destination)
+        return
+    if start is not None:
+        return  # el resto de los rangos sigue llegando al .part, ver commit_upload
+    if destination == filepath + PART_SUFFIX:
+        os.replace(destination, filepath)
+    if chunks is None:
+        return
+    if params.get("delta") != "1":
+        chunks.forget(filename)
+        return
+    try:
+        reused = chunks.assemble(filename, params.get(DIGEST_ALGORITHM))
+    except (OSError, ValueError) as e:
+        logging.error(f"Could not assemble the delta upload of '{filename}': {e}")
+        return
+    logging.info(f"Delta upload of '{filename}' reused {reused / 1024:.2f} KB already stored")
+    if stats is not None:
+        stats.increment("deduplicated_bytes", reused)
+
+
+def range_part_path(filepath, params):
+    # .part de un upload en paralelo: el tamaño y el checksum del archivo completo que manda el
+    # cliente lo identifican, asi los rangos de otro upload del mismo nombre no se mezclan
+    digest = params.get(DIGEST_ALGORITHM) or ""
+    return f"{filepath}.{int_param(params, 'size')}-{digest[:16]}{PART_SUFFIX}"
+
+
+def commit_upload(filepath, filename, params, chunks=None, files=None):
+    # STAT commit=1: el cliente termino todos los rangos. El .part reemplaza al archivo solo si
+    # su checksum es el que anuncio el cliente; si no, se descarta y queda el anterior (y su
+    # mapeo en el cache). Devuelve el checksum del archivo nuevo o None
+    part = range_part_path(filepath, params)
+    expected = params.get(DIGEST_ALGORITHM)
+    if not os.path.isfile(part):
+        logging.error(f"No parallel upload of '{filename}' to commit")
+        return None
+    digest = file_digest(part)
+    if digest != expected:
+        logging.error(f"Discarding the parallel upload of '{filename}', the previous file is kept")
+        os.remove(part)
+        return None
+    os.replace(part, filepath)
+    if files is not None:
+        files.invalidate(filepath)
+    if chunks is not None:
+        chunks.forget(filename)
+    logging.info(f"Parallel upload of '{filename}' verified and stored")
+    return digest
+
+
+def create_file_cache(args, stats=None):
+    # --file-cache en MB: mapeos sin uso que se conservan para los proximos downloads
+    max_bytes = getattr(args, "file_cache", None)
+    if max_bytes is None:
+        return FileCache(stats=stats)
+    return FileCache(max_bytes * 1024 * 1024, stats)
+
+
+def shared_mapping(files, filepath):
+    # mapeo del archivo compartido entre los downloads (ver lib/file_cache.py)
+    return files.mapped(filepath) if files is not None else contextlib.nullcontext()
+
+
+def download_source(storage_dir, filename, params, chunks=None):
+    # el archivo a mandar, o con manifest=1 el manifiesto de sus chunks; None si no existe
+    if chunks is not None and params.get("manifest") == "1":
+        return chunks.manifest(filename)
+    filepath = os.path.join(storage_dir, filename)
+    return filepath if os.path.exists(filepath) else None
+
+
+def range_params(params):
+    # (inicio, largo) del rango de una transferencia en paralelo, o (None, None)
+    start = int_param(params, "start")
+    if start is None:
+        return None, None
+    return start, int_param(params, "length")
+
+
+def stat_command(filepath, filename, params, chunks=None, files=None):
+    # respuesta a un STAT; con commit=1 antes confirma el upload en paralelo
+    digest = None
+    if params.get("commit") == "1":
+        digest = commit_upload(filepath, filename, params, chunks, files)
+    return stat_reply(filepath, params, digest)
+
+
+def stat_reply(filepath, params, digest=None):
+    # tamaño y mtime del archivo y, si se pide, su checksum (verificacion de punta a punta);
+    # digest: el checksum ya calculado al confirmar el upload
+    if not os.path.isfile(filepath):
+        return b"NOTFOUND"
+    stat = os.stat(filepath)
+    if digest is None and params.get("digest") == "1":
+        digest = file_digest(filepath)
+    return encode_params(
+        "INFO", {"size": stat.st_size, "mtime": stat.st_mtime_ns, DIGEST_ALGORITHM: digest}
+    )
+
+
+def upload_journal(filepath, params):
+    return resume_journal(
+        filepath,
+        int_param(params, "size"),
+        int_param(params, "mtime"),
+        restart=params.get("restart") == "1",
+    )
+
+
+def negotiate_options(protocol, params, rate_limit=None, window_size=WINDOW_SIZE):
+    # opciones que pidio el cliente tal como las acepta el server; vuelven en la respuesta
+    # con los mismos nombres (las que quedan en None no se mandan)
+    engine = get_engine(protocol)
+    return {
+        "checksum": negotiate_checksum(params.get("checksum")),
+        "compress": negotiate_compression(params.get("compress")),
+        # la paridad FEC solo tiene sentido con varios paquetes en vuelo y buffer fuera de orden
+        "fec": parse_fec(params.get("fec")) if engine.fec else None,
+        "chunk": negotiate_chunk_size(int_param(params, "chunk")),
+        # techo de tasa del pacer (bytes/s): lo aplica el que manda, de los dos lados
+        "rate": negotiate_rate(int_param(params, "rate"), rate_limit) if engine.windowed else None,
+        # EOF adelantado: el receiver lo confirma recien con todo adentro (ver selective_repeat)
+        "eof": 1 if engine.windowed and params.get("eof") == "1" else None,
+        # ventana: la menor entre la del cliente y la del server (ver selective_repeat)
+        "window": negotiate_window(int_param(params, "window"), window_size) if engine.windowed else None,
+    }
+
+
+def upload_reply(port, journal, options=None):
+    offset = journal.offset if journal is not None else None
+    return encode_params(f"READY:{port}", {"offset": offset, **(options or {})})
+
+
+def download_offset(filepath, params):
+    # se retoma desde el offset del cliente solo si el archivo no cambio desde ese intento
+    offset = int_param(params, "offset")
+    if not offset:
+        return 0
+    stat = os.stat(filepath)
+    if (
+        int_param(params, "size") != stat.st_size
+        or int_param(params, "mtime") != stat.st_mtime_ns
+        or offset > stat.st_size
+    ):
+        logging.info("File changed since the interrupted download, starting over")
+        return 0
+    logging.info(f"Resuming download at byte {offset}")
+    return offset
+
+
+def download_reply(port, filepath, offset, options=None):
+    stat = os.stat(filepath)
+    return encode_params(
+        f"FOUND:{port}",
+        {
+            "size": stat.st_size,
+            "mtime": stat.st_mtime_ns,
+            "offset": offset,
+            **(options or {}),
+        },
+    )
+
+
+def log_upload_complete(filename, metrics):
+    logging.info(
+        f"Upload complete: '{filename}', {metrics.payload_bytes / 1024:.2f} KB, "
+        + f"{metrics.goodput / 1024:.2f} KB/s, {metrics.duplicates} duplicates, "
+        + f"{metrics.corrupted} corrupted"
+    )
+    if metrics.digest_ok is False:
+        logging.error(f"Upload of '{filename}' does not match the client's digest")
+
+
+def log_download_complete(filename, metrics):
+    logging.info(
+        f"Download complete: '{filename}', {metrics.payload_bytes / 1024:.2f} KB, "
+        + f"{metrics.goodput / 1024:.2f} KB/s, {metrics.retransmissions} retransmissions, "
+        + f"RTO {metrics.rto * 1000:.1f} ms"
+    )
 
 
 def setup_logging(args):
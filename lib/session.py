@@ -0,0 +1,68 @@
+import os
+import time
+from protocols.package import CHECKSUM_FLAGS, Package
+
+# Sesiones persistentes: varios comandos con un solo handshake
+# -> el server anuncia session=1 en el HI_ACK (uno viejo no, y se hace un handshake por archivo)
+# -> un comando con keep=1 deja la sesion abierta al terminar la transferencia: el server
+#    espera el proximo comando en el mismo puerto de transferencia hasta SESSION_IDLE_TIMEOUT
+# -> el cliente manda el comando siguiente apenas termina su lado de la transferencia, mientras
+#    el server cierra la suya (pipelining). Si al server le llega con la transferencia todavia
+#    abierta lo aparta (ver run_endpoint) y lo atiende despues
+# -> entre comandos solo llegan restos de la transferencia anterior; el unico que importa es
+#    un EOF repetido porque se perdio su ACK, que se contesta como lo haria el receiver
+# Handshake rapido: el primer datagrama es HI seguido del comando (HIDOWNLOADarchivo\0...) y
+# el server contesta directo con READY/FOUND desde el puerto de transferencia; en un download
+# la primera ventana sale atras de la respuesta sin esperar nada. Un server viejo ve un HI y
+# contesta HI_ACK, y el cliente sigue con el handshake de tres pasos.
+# -> el cliente repite el HI con backoff si no llega respuesta: mientras la sesion sigue, el
+#    server repite la ultima respuesta del handshake en vez de abrir otra
+# -> terminada la sesion, un HI repetido atrasado se descarta por DUPLICATE_WINDOW desde que
+#    termino: con el handshake rapido traeria otra vez el comando (un segundo upload del mismo
+#    archivo). El HI lleva un nonce por ejecucion del cliente, asi que solo se descartan los
+#    reintentos de ese mismo HI; repetir el comando (para retomar, o detras de un NAT o del
+#    emulador, con la misma direccion) manda otro nonce y abre una sesion nueva
+
+SESSION_IDLE_TIMEOUT = 10.0
+DUPLICATE_WINDOW = 10.0  # mas que todos los reintentos del HI del cliente
+
+
+def stale_eof_ack(datagram):
+    # ACK para un EOF repetido de la transferencia anterior, o None si no es eso
+    packet = Package.from_bytes(datagram)
+    if packet.ack or not packet.eof or packet.checksum_ok is False:
+        return None
+    checksum = next((name for name, flag in CHECKSUM_FLAGS.items() if packet.flags & flag), None)
+    return packet.reply_ack().to_bytes(checksum)
+
+
+def hello_nonce():
+    # distingue los reintentos de un HI rapido de otra ejecucion con el mismo comando
+    return os.urandom(4).hex()
+
+
+def fast_command(hello):
+    # el comando que trae un HI del handshake rapido, o None si es un HI comun
+    command = bytes(hello[2:])
+    return command or None
+
+
+class RecentHellos:
+    # HIs rapidos de las sesiones terminadas hace menos de DUPLICATE_WINDOW, por direccion del
+    # cliente (un HI comun repetido solo abre una sesion que no completa el handshake)
+    def __init__(self, window=DUPLICATE_WINDOW):
+        self.window = window
+        self._hellos = {}  # addr -> (HI, vencimiento)
+
+    def add(self, addr, hello, finished=None):
+        # finished: cuando termino la sesion (monotonic), si no es ahora
+        if fast_command(hello) is not None:
+            finished = time.monotonic() if finished is None else finished
+            self._hellos[addr] = (bytes(hello), finished + self.window)
+
+    def duplicate(self, addr, hello):
+        now = time.monotonic()
+        for expired in [a for a, (_, until) in self._hellos.items() if until <= now]:
+            del self._hellos[expired]
+        entry = self._hellos.get(addr)
+        return entry is not None and entry[0] == bytes(hello)
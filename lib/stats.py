@@ -0,0 +1,211 @@
+import http.server
+import logging
+import os
+import threading
+from protocols.metrics import RTT_BUCKETS, Histogram, merge_histograms
+
+# Contadores del servidor. Se actualizan al terminar cada transferencia con su TransferMetrics
+# y se exportan en formato de texto de Prometheus a un archivo y/o por HTTP en localhost.
+
+COUNTERS = (
+    "sessions",
+    "uploads",
+    "downloads",
+    "failed",
+    "bytes_received",
+    "bytes_sent",
+    "wire_bytes_received",
+    "wire_bytes_sent",
+    "retransmissions",
+    "duplicates",
+    "corrupted",
+    "digest_mismatches",
+    "parity_sent",
+    "fec_recovered",
+    "deduplicated_bytes",
+    "file_cache_hits",
+    "file_cache_misses",
+    "sessions_queued",
+    "sessions_rejected",
+)
+GAUGES = ("active_sessions",)
+HISTOGRAMS = {
+    "transfer_duration_seconds": (0.1, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 300.0),
+    "transfer_goodput_bytes": tuple(2**exponent for exponent in range(16, 30, 2)),
+    "rtt_seconds": RTT_BUCKETS,
+}
+METRIC_PREFIX = "tp1_"
+EXPORT_INTERVAL = 5.0
+
+
+class ServerStats:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters = dict.fromkeys(COUNTERS, 0)
+        self._gauges = dict.fromkeys(GAUGES, 0)
+        self._histograms = {name: Histogram(bounds) for name, bounds in HISTOGRAMS.items()}
+
+    def increment(self, name, amount=1):
+        with self._lock:
+            self._counters[name] += amount
+
+    def session_started(self):
+        with self._lock:
+            self._counters["sessions"] += 1
+            self._gauges["active_sessions"] += 1
+
+    def session_finished(self):
+        with self._lock:
+            self._gauges["active_sessions"] -= 1
+
+    def record_upload(self, metrics):
+        with self._lock:
+            self._counters["uploads"] += 1
+            self._counters["bytes_received"] += metrics.payload_bytes
+            self._counters["duplicates"] += metrics.duplicates
+            self._counters["fec_recovered"] += metrics.fec_recovered
+            self._record_transfer(metrics)
+
+    def record_download(self, metrics):
+        with self._lock:
+            self._counters["downloads"] += 1
+            self._counters["bytes_sent"] += metrics.payload_bytes
+            self._counters["retransmissions"] += metrics.retransmissions
+            self._counters["parity_sent"] += metrics.parity_sent
+            self._record_transfer(metrics)
+
+    def _record_transfer(self, metrics):
+        self._counters["wire_bytes_received"] += metrics.wire_bytes_received
+        self._counters["wire_bytes_sent"] += metrics.wire_bytes_sent
+        self._counters["corrupted"] += metrics.corrupted
+        if metrics.digest_ok is False:
+            self._counters["digest_mismatches"] += 1
+        self._histograms["transfer_duration_seconds"].observe(metrics.duration)
+        self._histograms["transfer_goodput_bytes"].observe(metrics.goodput)
+        rtt = self._histograms["rtt_seconds"]
+        for index, count in enumerate(metrics.rtt.counts):
+            rtt.counts[index] += count
+        rtt.sum += metrics.rtt.sum
+        rtt.count += metrics.rtt.count
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                "counters": dict(self._counters),
+                "gauges": dict(self._gauges),
+                "histograms": {
+                    name: histogram.as_dict() for name, histogram in self._histograms.items()
+                },
+            }
+
+
+def merge_snapshots(snapshots):
+    total = ServerStats().snapshot()
+    for snapshot in snapshots:
+        for section in ("counters", "gauges"):
+            for name, value in snapshot[section].items():
+                total[section][name] = total[section].get(name, 0) + value
+        for name, histogram in snapshot["histograms"].items():
+            total["histograms"][name] = merge_histograms(total["histograms"][name], histogram)
+    return total
+
+
+def format_snapshot(snapshot):
+    values = {**snapshot["counters"], **snapshot["gauges"]}
+    return ", ".join(f"{name}={value}" for name, value in values.items())
+
+
+def format_prometheus(snapshot):
+    lines = []
+    for name, value in snapshot["counters"].items():
+        lines.append(f"# TYPE {METRIC_PREFIX}{name}_total counter")
+        lines.append(f"{METRIC_PREFIX}{name}_total {value}")
+    for name, value in snapshot["gauges"].items():
+        lines.append(f"# TYPE {METRIC_PREFIX}{name} gauge")
+        lines.append(f"{METRIC_PREFIX}{name} {value}")
+    for name, histogram in snapshot["histograms"].items():
+        metric = METRIC_PREFIX + name
+        lines.append(f"# TYPE {metric} histogram")
+        cumulative = 0
+        bounds = [f"{bound:g}" for bound in histogram["bounds"]] + ["+Inf"]
+        for bound, count in zip(bounds, histogram["counts"]):
+            cumulative += count
+            lines.append(f'{metric}_bucket{{le="{bound}"}} {cumulative}')
+        lines.append(f"{metric}_sum {histogram['sum']:g}")
+        lines.append(f"{metric}_count {histogram['count']}")
+    return "\n".join(lines) + "\n"
+
+
+class StatsExporter:
+    # exporta periodicamente a un archivo (escritura atomica) y sirve GET /metrics en localhost
+    def __init__(self, snapshot, stats_file=None, stats_port=None, interval=EXPORT_INTERVAL):
+        self.snapshot = snapshot
+        self.stats_file = stats_file
+        self.interval = interval
+        self.stopped = threading.Event()
+        self.httpd = None
+        self.threads = []
+
+        if stats_port is not None:
+            self.httpd = http.server.ThreadingHTTPServer(
+                ("127.0.0.1", stats_port), self._handler()
+            )
+            self.threads.append(threading.Thread(target=self.httpd.serve_forever, daemon=True))
+        if stats_file is not None:
+            self.threads.append(threading.Thread(target=self._write_loop, daemon=True))
+
+    def start(self):
+        for thread in self.threads:
+            thread.start()
+        return self
+
+    def stop(self):
+        self.stopped.set()
+        if self.httpd is not None:
+            self.httpd.shutdown()
+            self.httpd.server_close()
+        for thread in self.threads:
+            thread.join()
+        if self.stats_file is not None:
+            self.write_file()
+
+    def write_file(self):
+        temporary = f"{self.stats_file}.tmp"
+        with open(temporary, "w") as f:
+            f.write(format_prometheus(self.snapshot()))
+        os.replace(temporary, self.stats_file)
+
+    def _write_loop(self):
+        while not self.stopped.wait(self.interval):
+            try:
+                self.write_file()
+            except OSError as e:
+                logging.error(f"Could not write stats file: {e}")
+
+    def _handler(self):
+        exporter = self
+
+        class MetricsHandler(http.server.BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path not in ("/", "/metrics"):
+                    self.send_error(404)
+                    return
+                body = format_prometheus(exporter.snapshot()).encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                logging.debug(f"Stats request: {format % args}")
+
+        return MetricsHandler
+
+
+def start_exporter(args, snapshot):
+    stats_file = getattr(args, "stats_file", None)
+    stats_port = getattr(args, "stats_port", None)
+    if stats_file is None and stats_port is None:
+        return None
+    return StatsExporter(snapshot, stats_file, stats_port).start()
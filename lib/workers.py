@@ -0,0 +1,100 @@
+import logging
+import multiprocessing
+import queue
+import signal
+import threading
+from lib.async_server import run_async_server
+from lib.server import SHUTDOWN_GRACE, run_server, setup_logging
+from lib.stats import ServerStats, format_snapshot, merge_snapshots, start_exporter
+
+# Modo multiproceso: N workers independientes hacen bind al mismo puerto con
+# SO_REUSEPORT y el kernel reparte los clientes entre ellos. Cada worker corre el
+# servidor normal (threads o async) y reporta sus contadores al proceso padre.
+
+STATS_INTERVAL = 5.0
+
+
+def run_workers(args):
+    setup_logging(args)
+    context = multiprocessing.get_context("fork")
+    results = context.Queue()
+    workers = [
+        context.Process(target=worker_main, args=(args, worker_id, results), daemon=False)
+        for worker_id in range(args.workers)
+    ]
+    for worker in workers:
+        worker.start()
+    print(f"Started {len(workers)} workers on {args.host}:{args.port}")
+
+    snapshots = {}
+    exporter = start_exporter(args, lambda: merge_snapshots(list(snapshots.values())))
+    try:
+        while any(worker.is_alive() for worker in workers):
+            collect_snapshots(results, snapshots, timeout=STATS_INTERVAL)
+    except KeyboardInterrupt:
+        print("\nStopping workers...")
+    finally:
+        for worker in workers:
+            if worker.is_alive():
+                worker.terminate()  # SIGTERM: el worker termina las transferencias en curso
+        for worker in workers:
+            worker.join(SHUTDOWN_GRACE + STATS_INTERVAL)
+            if worker.is_alive():
+                logging.warning(f"Worker {worker.pid} did not stop, killing it")
+                worker.kill()
+                worker.join()
+        collect_snapshots(results, snapshots, timeout=0)
+        if exporter is not None:
+            exporter.stop()
+        report_stats(snapshots)
+
+
+def worker_main(args, worker_id, results):
+    stop_event = threading.Event()
+
+    def request_stop(signum, frame):
+        stop_event.set()
+
+    signal.signal(signal.SIGTERM, request_stop)
+    signal.signal(signal.SIGINT, request_stop)
+
+    stats = ServerStats()
+    reporter = threading.Thread(
+        target=report_loop, args=(stats, worker_id, results, stop_event), daemon=True
+    )
+    reporter.start()
+    try:
+        if args.mode == "async":
+            run_async_server(args, stats, stop_event)
+        else:
+            run_server(args, stats, stop_event)
+    finally:
+        stop_event.set()
+        reporter.join()
+        results.put((worker_id, stats.snapshot()))
+        results.close()
+        results.join_thread()
+
+
+def report_loop(stats, worker_id, results, stop_event):
+    while not stop_event.wait(STATS_INTERVAL):
+        results.put((worker_id, stats.snapshot()))
+
+
+def collect_snapshots(results, snapshots, timeout):
+    # se queda con el ultimo snapshot de cada worker (los contadores son acumulativos)
+    try:
+        worker_id, snapshot = results.get(timeout=timeout) if timeout else results.get_nowait()
+        snapshots[worker_id] = snapshot
+        while True:
+            worker_id, snapshot = results.get_nowait()
+            snapshots[worker_id] = snapshot
+    except queue.Empty:
+        pass
+
+
+def report_stats(snapshots):
+    for worker_id in sorted(snapshots):
+        logging.info(f"Worker {worker_id}: {format_snapshot(snapshots[worker_id])}")
+    total = merge_snapshots(snapshots.values())
+    print(f"Total ({len(snapshots)} workers): {format_snapshot(total)}")
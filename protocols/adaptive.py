@@ -0,0 +1,138 @@
+import logging
+from protocols.package import SEQ_MODULO
+from protocols.go_back_n import GoBackNSender
+from protocols.selective_repeat import DUP_THRESHOLD, SelectiveRepeatSender, seq_after_or_equal
+
+# ARQ adaptativo: receiver de Selective Repeat y un sender que elige como recuperarse segun lo
+# que ve en el enlace. Arranca en Selective Repeat y cada EPOCH paquetes confirmados mira:
+# -> reordenamiento: paquetes que se confirman despues de uno posterior sin haber sido
+#    retransmitidos (o con una retransmision espuria, confirmada antes de medio RTT). Con
+#    reordenamiento sube dup_threshold hasta la distancia vista, asi un paquete demorado no
+#    dispara una retransmision rapida, y se queda en Selective Repeat
+# -> perdidas en rafaga: si los paquetes perdidos vienen en tiras de GO_BACK_BURST o mas
+#    (una cola que desborda, un corte del enlace) pasa a Go-Back-N: ante un hueco o un timer
+#    vencido retransmite todo lo que sigue sin confirmar en vez de esperar la evidencia de cada
+#    paquete (los del final de la rafaga no tienen SACKs detras y esperarian el RTO)
+# -> perdidas sueltas: vuelve a Selective Repeat, que no manda de mas (una epoca sin perdidas
+#    no cambia nada)
+# El receiver es el de Selective Repeat: acepta las dos estrategias sin negociar nada.
+
+SELECTIVE = "sr"
+GO_BACK = "gbn"
+EPOCH = 64  # paquetes confirmados entre decisiones
+REORDER_RATE = 0.01  # fraccion de paquetes reordenados a partir de la que no se vuelve atras
+GO_BACK_BURST = 4.0  # largo medio de las rafagas de perdida para pasar a Go-Back-N
+
+
+class AdaptiveSender(GoBackNSender):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.strategy = SELECTIVE
+        self.highest_acked = None
+        self.epoch_acked = 0
+        self.epoch_reordered = 0
+        self.epoch_distance = 0  # mayor distancia de reordenamiento de la epoca
+        self.epoch_lost = set()
+        self.going_back = False
+        self.switches = 0
+
+    def _retransmit_expired(self, now):
+        if self.strategy == GO_BACK:
+            super()._retransmit_expired(now)
+        else:
+            SelectiveRepeatSender._retransmit_expired(self, now)
+
+    def _retransmit(self, seq, now):
+        # lo que se manda de mas al volver atras no cuenta como perdido
+        if not self.going_back:
+            self.epoch_lost.add(seq)
+        super()._retransmit(seq, now)
+
+    def _go_back(self, start, now):
+        self.epoch_lost.add(start)
+        self.going_back = True
+        super()._go_back(start, now)
+        self.going_back = False
+
+    def _on_duplicate_ack(self, ack_packet, now):
+        pass  # los huecos los muestra el SACK
+
+    def _on_new_acks(self, newly_acked, cumulative_ack, highest_offset, now):
+        for seq in newly_acked:
+            self._observe(seq, now)
+        retransmitted = len(self.fast_retransmitted)
+        self._fast_retransmit(cumulative_ack, highest_offset, now)
+        if self.strategy == GO_BACK and len(self.fast_retransmitted) > retransmitted:
+            # el hueco suele ser el principio de una rafaga: lo que le sigue sin SACK tambien
+            self._go_back_unsacked(cumulative_ack, now)
+        if self.epoch_acked >= EPOCH:
+            self._choose_strategy()
+
+    def _observe(self, seq, now):
+        self.epoch_acked += 1
+        highest = self.highest_acked
+        if highest is None or seq_after_or_equal(seq, highest):
+            self.highest_acked = seq
+            return
+        spurious = (
+            seq in self.retransmitted
+            and self.rtt.srtt is not None
+            and now - self.send_times[seq] < self.rtt.srtt / 2
+        )
+        if seq not in self.retransmitted or spurious:
+            self.epoch_reordered += 1
+            self.epoch_distance = max(self.epoch_distance, (highest - seq) % SEQ_MODULO)
+            self.epoch_lost.discard(seq)
+
+    def _go_back_unsacked(self, start, now):
+        self.going_back = True
+        seq = start
+        while seq != self.next_seq:
+            if (
+                seq in self.buffer
+                and seq not in self.acks_received
+                and seq not in self.fast_retransmitted
+            ):
+                self._retransmit(seq, now)
+                self.timers.schedule(seq, now + self.rtt.rto)
+                self.fast_retransmitted.add(seq)
+            seq = (seq + 1) % SEQ_MODULO
+        self.going_back = False
+
+    def _choose_strategy(self):
+        reorder_rate = self.epoch_reordered / self.epoch_acked
+        lost = len(self.epoch_lost)
+        # una rafaga empieza en cada perdido cuyo anterior llego
+        bursts = sum((seq - 1) % SEQ_MODULO not in self.epoch_lost for seq in self.epoch_lost)
+        burst = lost / bursts if bursts else 0.0
+
+        if reorder_rate > REORDER_RATE:
+            strategy = SELECTIVE
+            limit = max(DUP_THRESHOLD, self.window_size // 4)
+            self.dup_threshold = min(max(DUP_THRESHOLD, self.epoch_distance + 1), limit)
+        else:
+            self.dup_threshold = DUP_THRESHOLD
+            if not lost:
+                strategy = self.strategy  # sin perdidas no hay con que decidir
+            else:
+                strategy = GO_BACK if burst >= GO_BACK_BURST else SELECTIVE
+        if strategy != self.strategy:
+            logging.info(
+                f"Switching to {'Go-Back-N' if strategy == GO_BACK else 'Selective Repeat'}: "
+                + f"loss bursts of {burst:.1f} packets, {reorder_rate:.1%} reordered"
+            )
+            self.strategy = strategy
+            self.switches += 1
+
+        self.epoch_acked = 0
+        self.epoch_reordered = 0
+        self.epoch_distance = 0
+        self.epoch_lost = set()
+
+    def result(self):
+        metrics = super().result()
+        logging.info(
+            f"Recovery strategy: {self.strategy}, {self.switches} switches, "
+            + f"duplicate ACK threshold: {self.dup_threshold}"
+        )
+        return metrics
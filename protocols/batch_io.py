@@ -0,0 +1,274 @@
+import ctypes
+import ctypes.util
+import errno
+import logging
+import os
+import socket
+import struct
+
+# I/O de datagramas por lotes
+# -> send() encola y flush() manda toda la rafaga con un solo sendmmsg
+# -> recv_many() espera el primer datagrama y despues drena lo que haya con un solo recvmmsg
+# -> se recibe en un anillo de buffers preasignados y se devuelven memoryviews: son validos
+#    hasta la proxima lectura, quien necesite guardar un datagrama tiene que copiarlo
+# -> un datagrama puede ser un buffer o una tupla de partes (ej. header + slice del mmap del
+#    archivo), que se mandan como scatter-gather sin juntarlas
+# -> si la libc no tiene sendmmsg/recvmmsg (no es Linux) se usa sendto/recvfrom de a uno
+# -> con gate cada datagrama espera su turno antes de salir: gate.acquire(tamaño, wait) es el
+#    scheduler del server (ver lib/scheduler.py)
+# Solo IPv4, igual que el resto del proyecto.
+
+BATCH_SIZE = 64
+MAX_PARTS = 2
+MAX_DATAGRAM_SIZE = 65536
+SOCKADDR_IN_SIZE = 16
+
+
+class IOVec(ctypes.Structure):
+    _fields_ = [("iov_base", ctypes.c_void_p), ("iov_len", ctypes.c_size_t)]
+
+
+class MsgHdr(ctypes.Structure):
+    _fields_ = [
+        ("msg_name", ctypes.c_void_p),
+        ("msg_namelen", ctypes.c_uint32),
+        ("msg_iov", ctypes.POINTER(IOVec)),
+        ("msg_iovlen", ctypes.c_size_t),
+        ("msg_control", ctypes.c_void_p),
+        ("msg_controllen", ctypes.c_size_t),
+        ("msg_flags", ctypes.c_int),
+    ]
+
+
+class MMsgHdr(ctypes.Structure):
+    _fields_ = [("msg_hdr", MsgHdr), ("msg_len", ctypes.c_uint)]
+
+
+def _load_libc():
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        sendmmsg, recvmmsg = libc.sendmmsg, libc.recvmmsg
+    except (OSError, AttributeError):
+        return None, None
+    sendmmsg.argtypes = [ctypes.c_int, ctypes.POINTER(MMsgHdr), ctypes.c_uint, ctypes.c_int]
+    sendmmsg.restype = ctypes.c_int
+    recvmmsg.argtypes = [
+        ctypes.c_int,
+        ctypes.POINTER(MMsgHdr),
+        ctypes.c_uint,
+        ctypes.c_int,
+        ctypes.c_void_p,
+    ]
+    recvmmsg.restype = ctypes.c_int
+    return sendmmsg, recvmmsg
+
+
+_sendmmsg, _recvmmsg = _load_libc()
+MSG_DONTWAIT = getattr(socket, "MSG_DONTWAIT", 0)
+
+
+def batching_supported():
+    return _sendmmsg is not None and MSG_DONTWAIT != 0
+
+
+def encode_sockaddr(addr):
+    host, port = addr
+    return struct.pack("=H", socket.AF_INET) + struct.pack("!H", port) + socket.inet_aton(host)
+
+
+def decode_sockaddr(raw):
+    return socket.inet_ntoa(raw[4:8]), struct.unpack("!H", raw[2:4])[0]
+
+
+def datagram_length(datagram):
+    if isinstance(datagram, tuple):
+        return sum(len(part) for part in datagram)
+    return len(datagram)
+
+
+def _buffer_address(datagram):
+    # direccion de los datos del datagrama sin copiarlos (bytes o bytearray/memoryview escribible)
+    if isinstance(datagram, bytes):
+        buf = ctypes.c_char_p(datagram)
+        return buf, ctypes.cast(buf, ctypes.c_void_p).value
+    try:
+        buf = (ctypes.c_char * len(datagram)).from_buffer(datagram)
+    except TypeError:
+        buf = ctypes.create_string_buffer(bytes(datagram), len(datagram))
+    return buf, ctypes.addressof(buf)
+
+
+def _raise_errno():
+    code = ctypes.get_errno()
+    raise OSError(code, os.strerror(code))
+
+
+class BatchedSocket:
+    def __init__(self, sock, batch_size=BATCH_SIZE, gate=None):
+        self.sock = sock
+        self.batch_size = batch_size
+        self.gate = gate
+        self.batched = batching_supported() and sock.family == socket.AF_INET
+        self.pending = []
+        self.sendmmsg_calls = 0
+        self.recvmmsg_calls = 0
+
+        self._names = {}
+        self._recv_size = 0
+        if self.batched:
+            self._send_msgs = (MMsgHdr * batch_size)()
+            self._send_iovs = (IOVec * (batch_size * MAX_PARTS))()
+            for i in range(batch_size):
+                self._send_msgs[i].msg_hdr.msg_iov = ctypes.pointer(
+                    self._send_iovs[i * MAX_PARTS]
+                )
+
+    def send(self, datagram, addr):
+        self.pending.append((datagram, addr))
+        if len(self.pending) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        pending, self.pending = self.pending, []
+        if self.gate is not None:
+            pending = self._wait_turns(pending)
+        self._send_all(pending)
+
+    def _wait_turns(self, pending):
+        # lo que ya tiene turno sale antes de esperar el turno del siguiente
+        granted = []
+        for datagram, addr in pending:
+            size = datagram_length(datagram)
+            if not self.gate.acquire(size, wait=False):
+                self._send_all(granted)
+                granted = []
+                self.gate.acquire(size)
+            granted.append((datagram, addr))
+        return granted
+
+    def _send_all(self, pending):
+        if not self.batched:
+            for datagram, addr in pending:
+                self._sendto(datagram, addr)
+            return
+
+        start = 0
+        while start < len(pending):
+            batch = pending[start : start + self.batch_size]
+            sent = self._sendmmsg(batch)
+            if sent <= 0:
+                # buffer del socket lleno: sendto espera (respetando el timeout del socket)
+                self._sendto(*batch[0])
+                sent = 1
+            start += sent
+
+    def _sendmmsg(self, batch):
+        # los buffers se referencian en `keep` hasta que vuelve la syscall
+        keep = []
+        for i, (datagram, addr) in enumerate(batch):
+            parts = datagram if isinstance(datagram, tuple) else (datagram,)
+            for j, part in enumerate(parts):
+                buf, address = _buffer_address(part)
+                keep.append((part, buf))
+                iov = self._send_iovs[i * MAX_PARTS + j]
+                iov.iov_base = address
+                iov.iov_len = len(part)
+            name = self._names.get(addr)
+            if name is None:
+                name = self._names[addr] = ctypes.create_string_buffer(
+                    encode_sockaddr(addr), SOCKADDR_IN_SIZE
+                )
+            hdr = self._send_msgs[i].msg_hdr
+            hdr.msg_iovlen = len(parts)
+            hdr.msg_name = ctypes.addressof(name)
+            hdr.msg_namelen = SOCKADDR_IN_SIZE
+
+        self.sendmmsg_calls += 1
+        sent = _sendmmsg(self.sock.fileno(), self._send_msgs, len(batch), MSG_DONTWAIT)
+        if sent < 0 and ctypes.get_errno() not in (errno.EAGAIN, errno.EWOULDBLOCK):
+            _raise_errno()
+        return sent
+
+    def _sendto(self, datagram, addr):
+        if not isinstance(datagram, tuple):
+            self.sock.sendto(datagram, addr)
+        elif hasattr(self.sock, "sendmsg"):
+            self.sock.sendmsg(datagram, [], 0, addr)
+        else:
+            self.sock.sendto(b"".join(datagram), addr)
+
+    def recv_many(self, bufsize):
+        # bloquea (con el timeout del socket) hasta el primer datagrama y drena el resto
+        if bufsize > self._recv_size:
+            self._setup_recv_buffers(bufsize)
+        size, addr = self.sock.recvfrom_into(self._recv_bufs[0], bufsize)
+        first = (self._recv_views[0][:size], addr)
+        if not self.batched:
+            return [first]
+        return [first] + self._recvmmsg(1)
+
+    def recv_available(self, bufsize):
+        # no bloquea: devuelve [] si no hay nada para leer
+        if bufsize > self._recv_size:
+            self._setup_recv_buffers(bufsize)
+        if not self.batched:
+            try:
+                size, addr = self.sock.recvfrom_into(self._recv_bufs[0], bufsize)
+            except (BlockingIOError, socket.timeout):
+                return []
+            return [(self._recv_views[0][:size], addr)]
+        return self._recvmmsg(0)
+
+    def _recvmmsg(self, first):
+        self.recvmmsg_calls += 1
+        received = _recvmmsg(
+            self.sock.fileno(),
+            ctypes.byref(self._recv_msgs[first]),
+            self.batch_size - first,
+            MSG_DONTWAIT,
+            None,
+        )
+        if received < 0:
+            if ctypes.get_errno() in (errno.EAGAIN, errno.EWOULDBLOCK):
+                return []
+            _raise_errno()
+
+        datagrams = []
+        for i in range(first, first + received):
+            view = self._recv_views[i][: self._recv_msgs[i].msg_len]
+            datagrams.append((view, decode_sockaddr(self._recv_names[i].raw)))
+            self._recv_msgs[i].msg_hdr.msg_namelen = SOCKADDR_IN_SIZE
+        return datagrams
+
+    def _setup_recv_buffers(self, bufsize):
+        # anillo de buffers de recepcion, se asigna una sola vez por tamaño de datagrama
+        self._recv_size = bufsize
+        count = self.batch_size if self.batched else 1
+        self._recv_bufs = [bytearray(bufsize) for _ in range(count)]
+        self._recv_views = [memoryview(buf) for buf in self._recv_bufs]
+        if not self.batched:
+            return
+        self._recv_msgs = (MMsgHdr * count)()
+        self._recv_iovs = (IOVec * count)()
+        self._recv_arrays = [(ctypes.c_char * bufsize).from_buffer(buf) for buf in self._recv_bufs]
+        self._recv_names = [ctypes.create_string_buffer(SOCKADDR_IN_SIZE) for _ in range(count)]
+        for i in range(count):
+            self._recv_iovs[i].iov_base = ctypes.addressof(self._recv_arrays[i])
+            self._recv_iovs[i].iov_len = bufsize
+            hdr = self._recv_msgs[i].msg_hdr
+            hdr.msg_iov = ctypes.pointer(self._recv_iovs[i])
+            hdr.msg_iovlen = 1
+            hdr.msg_name = ctypes.addressof(self._recv_names[i])
+            hdr.msg_namelen = SOCKADDR_IN_SIZE
+
+
+def tune_socket_buffers(sock, size):
+    # que entre una ventana completa en los buffers del socket: si no, una rafaga se descarta
+    # en el kernel antes de salir (SO_SNDBUF) o antes de que se la lea (SO_RCVBUF).
+    # Solo se agrandan; el kernel los limita a net.core.wmem_max / rmem_max
+    for option in (socket.SO_SNDBUF, socket.SO_RCVBUF):
+        try:
+            if sock.getsockopt(socket.SOL_SOCKET, option) < size:
+                sock.setsockopt(socket.SOL_SOCKET, option, size)
+        except OSError as e:
+            logging.debug(f"Could not resize socket buffer: {e}")
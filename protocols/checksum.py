@@ -0,0 +1,41 @@
+import zlib
+
+# Checksums por paquete, para los datagramas corruptos que pasan el checksum de UDP
+# (o viajan sin el). Cada paquete indica en sus flags cual lleva:
+# -> CRC32C (Castagnoli) si esta instalado el modulo crc32c, que usa la instruccion del CPU
+# -> si no, zlib.crc32, que esta siempre disponible
+# El cliente pide uno en el comando y el server contesta cual se usa en la transferencia.
+try:
+    import crc32c as _crc32c
+except ImportError:
+    _crc32c = None
+
+CRC32C = "crc32c"
+CRC32 = "crc32"
+
+_FUNCTIONS = {CRC32: zlib.crc32}
+if _crc32c is not None:
+    _FUNCTIONS[CRC32C] = _crc32c.crc32c
+
+
+def available_checksums():
+    return list(_FUNCTIONS)
+
+
+def preferred_checksum():
+    return CRC32C if CRC32C in _FUNCTIONS else CRC32
+
+
+def negotiate_checksum(requested):
+    # se acepta el pedido del cliente si esta disponible; si no, CRC32, que tienen todos
+    if requested is None:
+        return None
+    return requested if requested in _FUNCTIONS else CRC32
+
+
+def compute_checksum(name, *parts):
+    function = _FUNCTIONS[name]
+    value = 0
+    for part in parts:
+        value = function(part, value)
+    return value
@@ -0,0 +1,108 @@
+import hashlib
+import struct
+from protocols.file_io import map_file, unmap_file
+
+# Chunking por contenido (CDC) para las transferencias delta
+# -> los cortes dependen solo de los ultimos WINDOW bytes y no de la posicion: insertar o borrar
+#    bytes en el medio de un archivo mueve los cortes de alrededor, pero el resto de los chunks
+#    queda igual y se reconoce por su hash (BLAKE2b de 128 bits)
+# -> hash rodante por byte: XOR de una tabla distinta por posicion de la ventana
+#    (T_0[b_i] ^ T_1[b_i-1] ^ ...). Se calcula para un bloque entero con bytes.translate y
+#    enteros grandes (un byte del entero por posicion), sin recorrer los bytes en Python
+# -> hay corte despues del byte i si sus dos hashes (8 y 5 bits) dan cero: en promedio cada
+#    8 KB, acotado entre MIN_CHUNK_SIZE y MAX_CHUNK_SIZE
+# Manifiesto: [tamaño (64 bits) | mtime en ns (64 bits)] + [largo (32 bits) | hash] por chunk
+# Stream delta: por chunk [literal (8 bits) | largo (32 bits) | hash] + el chunk si es literal
+
+WINDOW = 8
+MIN_CHUNK_SIZE = 2 * 1024
+MAX_CHUNK_SIZE = 64 * 1024
+BLOCK_SIZE = 1024 * 1024  # bytes de hash rodante que se calculan de una vez
+DIGEST_SIZE = 16
+
+MANIFEST_HEADER = struct.Struct("!QQ")
+MANIFEST_ENTRY = struct.Struct("!I16s")
+DELTA_RECORD = struct.Struct("!?I16s")
+
+# tablas fijas: cliente y server tienen que cortar igual
+_CUT_TABLES = [hashlib.shake_256(b"cdc-cut-%d" % k).digest(256) for k in range(WINDOW)]
+_MASK_TABLES = [
+    bytes(value & 0x1F for value in hashlib.shake_256(b"cdc-mask-%d" % k).digest(256))
+    for k in range(WINDOW)
+]
+
+
+def chunk_digest(data):
+    return hashlib.blake2b(data, digest_size=DIGEST_SIZE).digest()
+
+
+def _rolling_hash(block, tables):
+    # un byte por posicion: el byte i es el XOR de tables[k][block[i - k]]
+    value = 0
+    for k, table in enumerate(tables):
+        value ^= int.from_bytes(block.translate(table), "little") << (8 * k)
+    return value
+
+
+def _cut_marks(data, start, end):
+    # un byte por posicion de [start, end): cero donde se puede cortar despues de ese byte
+    lead = min(start, WINDOW - 1)
+    block = bytes(data[start - lead : end])
+    marks = _rolling_hash(block, _CUT_TABLES) | _rolling_hash(block, _MASK_TABLES)
+    return marks.to_bytes(len(block) + WINDOW, "little")[lead : lead + end - start]
+
+
+def split_chunks(data):
+    # (offset, largo) de cada chunk de data (bytes, memoryview o mmap)
+    size = len(data)
+    chunks = []
+    marks_start, marks = 0, b""
+    offset = 0
+    while offset < size:
+        low = offset + MIN_CHUNK_SIZE
+        high = min(offset + MAX_CHUNK_SIZE, size)
+        cut = high
+        if low < high:
+            if low - 1 < marks_start or high - 1 > marks_start + len(marks):
+                marks_start = low - 1
+                marks = _cut_marks(data, marks_start, min(marks_start + BLOCK_SIZE, size))
+            position = marks.find(0, low - 1 - marks_start, high - 1 - marks_start)
+            if position >= 0:
+                cut = marks_start + position + 1
+        chunks.append((offset, cut - offset))
+        offset = cut
+    return chunks
+
+
+def file_chunks(filepath):
+    # [(offset, largo, hash)] de un archivo
+    with open(filepath, "rb") as f:
+        view = map_file(f)
+        if view is None:
+            data = f.read()
+            return [(o, n, chunk_digest(data[o : o + n])) for o, n in split_chunks(data)]
+        try:
+            return [(o, n, chunk_digest(view[o : o + n])) for o, n in split_chunks(view)]
+        finally:
+            unmap_file(view)
+
+
+def encode_manifest(size, mtime, chunks):
+    parts = [MANIFEST_HEADER.pack(size, mtime)]
+    parts.extend(MANIFEST_ENTRY.pack(length, digest) for _, length, digest in chunks)
+    return b"".join(parts)
+
+
+def decode_manifest(raw):
+    # (tamaño, mtime, [(offset, largo, hash)]); ValueError si esta truncado
+    if len(raw) < MANIFEST_HEADER.size or (len(raw) - MANIFEST_HEADER.size) % MANIFEST_ENTRY.size:
+        raise ValueError("Truncated chunk manifest")
+    size, mtime = MANIFEST_HEADER.unpack_from(raw)
+    chunks = []
+    offset = 0
+    for length, digest in MANIFEST_ENTRY.iter_unpack(raw[MANIFEST_HEADER.size :]):
+        chunks.append((offset, length, digest))
+        offset += length
+    if offset != size:
+        raise ValueError("Chunk manifest does not add up to the file size")
+    return size, mtime, chunks
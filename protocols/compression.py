@@ -0,0 +1,89 @@
+import zlib
+
+# Compresion opcional de los datos, chunk por chunk: cada paquete se comprime solo, asi que
+# perder o retransmitir uno no afecta a los demas. Los comprimidos llevan FLAG_COMPRESSED.
+# -> zlib (deflate crudo, siempre disponible) es el default
+# -> zstd y lz4 si estan instalados los modulos zstandard y lz4
+# El cliente pide un algoritmo en el comando y el server contesta cual se usa.
+# Un chunk que no achica al menos MIN_SAVING viaja sin comprimir; despues de PROBE_AFTER
+# chunks seguidos asi (datos ya comprimidos o aleatorios) se prueba solo uno cada PROBE_EVERY.
+try:
+    import zstandard as _zstd
+except ImportError:
+    _zstd = None
+try:
+    import lz4.block as _lz4
+except ImportError:
+    _lz4 = None
+
+ZLIB = "zlib"
+ZSTD = "zstd"
+LZ4 = "lz4"
+
+ZLIB_LEVEL = 1
+ZSTD_LEVEL = 1
+MIN_SAVING = 0.1
+PROBE_AFTER = 16
+PROBE_EVERY = 64
+
+
+def available_compressions():
+    names = [ZLIB]
+    if _zstd is not None:
+        names.append(ZSTD)
+    if _lz4 is not None:
+        names.append(LZ4)
+    return names
+
+
+def negotiate_compression(requested):
+    # se acepta el pedido del cliente si esta disponible; si no, zlib, que tienen todos
+    if requested is None:
+        return None
+    return requested if requested in available_compressions() else ZLIB
+
+
+class ChunkCompressor:
+    def __init__(self, name):
+        self.name = name
+        self.skipped = 0  # chunks seguidos que no valio la pena comprimir
+        if name == ZSTD:
+            self._zstd_compressor = _zstd.ZstdCompressor(level=ZSTD_LEVEL)
+            self._zstd_decompressor = _zstd.ZstdDecompressor()
+
+    def compress(self, chunk):
+        # devuelve el chunk comprimido, o None si conviene mandarlo como esta
+        if self.skipped >= PROBE_AFTER and (self.skipped - PROBE_AFTER) % PROBE_EVERY:
+            self.skipped += 1
+            return None
+        if self.name == ZSTD:
+            compressed = self._zstd_compressor.compress(chunk)
+        elif self.name == LZ4:
+            compressed = _lz4.compress(chunk)
+        else:
+            compressor = zlib.compressobj(ZLIB_LEVEL, zlib.DEFLATED, -zlib.MAX_WBITS)
+            compressed = compressor.compress(chunk) + compressor.flush()
+        if len(compressed) > len(chunk) * (1 - MIN_SAVING):
+            self.skipped += 1
+            return None
+        self.skipped = 0
+        return compressed
+
+    def decompress(self, data, max_size):
+        # devuelve el chunk original, o None si los datos no son validos (o superan max_size)
+        try:
+            if self.name == ZSTD:
+                chunk = self._zstd_decompressor.decompress(data, max_output_size=max_size)
+            elif self.name == LZ4:
+                # el bloque lz4 empieza con el tamaño original
+                if len(data) < 4 or int.from_bytes(data[:4], "little") > max_size:
+                    return None
+                chunk = _lz4.decompress(data)
+            else:
+                decompressor = zlib.decompressobj(-zlib.MAX_WBITS)
+                chunk = decompressor.decompress(data, max_size)
+                if not decompressor.eof or decompressor.unconsumed_tail:
+                    return None
+        except Exception:
+            return None
+        return chunk if len(chunk) <= max_size else None
@@ -0,0 +1,112 @@
+# Control de congestion para Selective Repeat
+# -> La ventana efectiva del sender es min(cwnd, ventana de control de flujo)
+# -> cwnd se mide en paquetes
+# -> on_loss: perdida aislada (reduccion multiplicativa, una vez por ventana)
+# -> on_timeout: vencio el RTO (sin ACKs que muestren la perdida), se vuelve a slow start
+
+INITIAL_CWND = 10
+MIN_CWND = 1
+MIN_SSTHRESH = 2
+
+CUBIC_C = 0.4
+CUBIC_BETA = 0.7
+
+
+class RenoController:
+    name = "reno"
+
+    def __init__(self, initial_cwnd=INITIAL_CWND):
+        self.cwnd = float(initial_cwnd)
+        self.ssthresh = float("inf")
+        self.losses = 0
+
+    @property
+    def window(self):
+        return max(MIN_CWND, int(self.cwnd))
+
+    def in_slow_start(self):
+        return self.cwnd < self.ssthresh
+
+    def on_ack(self, now, srtt):
+        if self.in_slow_start():
+            self.cwnd += 1
+        else:
+            self.cwnd += 1 / self.cwnd
+
+    def on_loss(self, now):
+        self.losses += 1
+        self.ssthresh = max(self.cwnd / 2, MIN_SSTHRESH)
+        self.cwnd = self.ssthresh
+
+    def on_timeout(self, now):
+        self.losses += 1
+        self.ssthresh = max(self.cwnd / 2, MIN_SSTHRESH)
+        self.cwnd = MIN_CWND
+
+
+class CubicController(RenoController):
+    name = "cubic"
+
+    def __init__(self, initial_cwnd=INITIAL_CWND):
+        super().__init__(initial_cwnd)
+        self.w_max = 0.0
+        self.k = 0.0
+        self.epoch_start = None
+
+    def on_ack(self, now, srtt):
+        if self.in_slow_start():
+            self.cwnd += 1
+            return
+
+        if self.epoch_start is None:
+            self.epoch_start = now
+            if self.cwnd < self.w_max:
+                self.k = ((self.w_max - self.cwnd) / CUBIC_C) ** (1 / 3)
+            else:
+                self.k = 0.0
+                self.w_max = self.cwnd
+
+        rtt = srtt or 0.0
+        t = now - self.epoch_start + rtt
+        target = CUBIC_C * (t - self.k) ** 3 + self.w_max
+
+        # Region "TCP friendly": nunca crecer mas lento que Reno
+        reno_window = self.w_max * CUBIC_BETA + (
+            3 * (1 - CUBIC_BETA) / (1 + CUBIC_BETA)
+        ) * ((now - self.epoch_start) / rtt if rtt > 0 else 0)
+        target = max(target, reno_window)
+
+        if target > self.cwnd:
+            self.cwnd += (target - self.cwnd) / self.cwnd
+        else:
+            self.cwnd += 0.01 / self.cwnd
+
+    def _reduce(self):
+        self.losses += 1
+        self.w_max = self.cwnd
+        self.ssthresh = max(self.cwnd * CUBIC_BETA, MIN_SSTHRESH)
+        self.epoch_start = None
+
+    def on_loss(self, now):
+        self._reduce()
+        self.cwnd = self.ssthresh
+
+    def on_timeout(self, now):
+        self._reduce()
+        self.cwnd = MIN_CWND
+
+
+CONGESTION_CONTROLLERS = {
+    RenoController.name: RenoController,
+    CubicController.name: CubicController,
+}
+DEFAULT_CONGESTION_CONTROL = RenoController.name
+
+
+def create_congestion_controller(name=DEFAULT_CONGESTION_CONTROL):
+    if name not in CONGESTION_CONTROLLERS:
+        raise ValueError(
+            f"Unknown congestion control '{name}', expected one of: "
+            + ", ".join(CONGESTION_CONTROLLERS)
+        )
+    return CONGESTION_CONTROLLERS[name]()
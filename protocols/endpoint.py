@@ -0,0 +1,58 @@
+import socket
+import time
+from protocols.package import is_control
+
+# Los protocolos estan escritos como maquinas de estado sin I/O propio:
+# -> send(datagrama) es un callback que les pasa el driver
+# -> on_datagram(raw, now) procesa un datagrama recibido
+# -> poll(now) dispara lo que dependa del tiempo (timers, ACKs diferidos, ventana)
+# -> next_deadline() indica hasta cuando se puede esperar sin llamar a poll
+# -> done indica que la transferencia termino y result() devuelve las estadisticas
+# Asi el mismo codigo corre sobre un socket bloqueante o dentro del servidor asyncio.
+# Los datagramas se leen y se mandan por lotes (ver batch_io).
+# Los mensajes de control que lleguen durante la transferencia nunca van al endpoint: con una
+# lista en control se guardan ahi (el comando siguiente de una sesion persistente) y si no se
+# descartan (una respuesta del handshake repetida).
+
+IDLE_TIMEOUT = 30.0
+MAX_CONTROL_SIZE = 1024
+
+
+def run_endpoint(io, endpoint, idle_timeout=IDLE_TIMEOUT, control=None):
+    # io es un BatchedSocket: lo que el endpoint manda en una vuelta sale en un solo flush
+    sock = io.sock
+    # un comando puede ser mas largo que lo que espera el endpoint (un ACK en el sender)
+    bufsize = endpoint.max_datagram_size
+    if control is not None:
+        bufsize = max(bufsize, MAX_CONTROL_SIZE)
+    last_activity = time.monotonic()
+    endpoint.poll(last_activity)
+    io.flush()
+    while not endpoint.done:
+        # sin timers pendientes se espera al otro extremo, pero no para siempre: si se cayo
+        # la transferencia se corta y el receiver deja el journal listo para retomarla
+        idle_deadline = last_activity + idle_timeout
+        deadline = endpoint.next_deadline()
+        deadline = idle_deadline if deadline is None else min(deadline, idle_deadline)
+        sock.settimeout(max(0.0, deadline - time.monotonic()))
+
+        try:
+            datagrams = io.recv_many(bufsize)
+        except (socket.timeout, BlockingIOError):
+            now = time.monotonic()
+            if now >= idle_deadline:
+                raise TimeoutError(f"No data from peer in {idle_timeout:.0f}s")
+            endpoint.poll(now)
+            io.flush()
+            continue
+
+        now = last_activity = time.monotonic()
+        for raw_data, _ in datagrams:
+            if is_control(raw_data):
+                if control is not None:
+                    control.append(bytes(raw_data))
+                continue
+            endpoint.on_datagram(raw_data, now)
+        endpoint.poll(now)
+        io.flush()
+    return endpoint.result()
@@ -0,0 +1,193 @@
+import logging
+from protocols.adaptive import AdaptiveSender
+from protocols.batch_io import BatchedSocket, tune_socket_buffers
+from protocols.congestion import DEFAULT_CONGESTION_CONTROL
+from protocols.endpoint import run_endpoint
+from protocols.go_back_n import GoBackNReceiver, GoBackNSender
+from protocols.journal import open_destination
+from protocols.selective_repeat import (
+    CHUNK_SIZE,
+    WINDOW_SIZE,
+    LegacySelectiveRepeatSender,
+    SelectiveRepeatReceiver,
+    SelectiveRepeatSender,
+    max_data_size,
+)
+from protocols.stop_and_wait import (
+    LegacyStopAndWaitSender,
+    StopAndWaitReceiver,
+    StopAndWaitSender,
+)
+
+# Motores de recuperacion de errores que se eligen con -r
+# -> cada motor arma el sender y el receiver (endpoints sans-IO, ver endpoint.py) a partir de
+#    las mismas opciones con nombre; las que no usa las ignora
+# -> windowed: usa la ventana (-w), control de congestion, pacing y el EOF adelantado
+# -> fec: acepta paridad FEC
+# -> legacy: el peer es uno original (mando o recibio un comando sin parametros): se usa el
+#    header de 2 bytes y las opciones que no conoce se ignoran. Los receivers detectan el
+#    formato solos; con ventana el peer original es Selective Repeat
+# -> send_file / receive_file corren cualquier motor sobre un socket; el server async arma los
+#    endpoints con sender() y receiver() y los corre en su loop
+# Un motor nuevo se agrega a ENGINES y queda disponible en el cliente, los dos servers y el
+# benchmark. Cliente y server tienen que usar el mismo.
+
+
+class StopAndWaitEngine:
+    name = "saw"
+    title = "Stop & Wait"
+    windowed = False
+    fec = False
+
+    def sender(
+        self,
+        f,
+        send,
+        length=None,
+        checksum=None,
+        compression=None,
+        chunk_size=CHUNK_SIZE,
+        mapped=None,
+        legacy=False,
+        **options,
+    ):
+        if legacy:
+            return LegacyStopAndWaitSender(f, send)
+        return StopAndWaitSender(f, send, length, checksum, compression, chunk_size, mapped)
+
+    def receiver(
+        self,
+        f,
+        send,
+        journal=None,
+        checksum=None,
+        compression=None,
+        chunk_size=CHUNK_SIZE,
+        **options,
+    ):
+        return StopAndWaitReceiver(f, send, journal, checksum, compression, chunk_size)
+
+
+class SelectiveRepeatEngine:
+    name = "sr"
+    title = "Selective Repeat"
+    windowed = True
+    fec = True
+    sender_class = SelectiveRepeatSender
+    receiver_class = SelectiveRepeatReceiver
+
+    def sender(
+        self,
+        f,
+        send,
+        window_size=WINDOW_SIZE,
+        congestion=DEFAULT_CONGESTION_CONTROL,
+        length=None,
+        checksum=None,
+        compression=None,
+        fec=None,
+        chunk_size=CHUNK_SIZE,
+        pacing=True,
+        max_rate=None,
+        mapped=None,
+        early_eof=False,
+        legacy=False,
+    ):
+        if legacy:
+            return LegacySelectiveRepeatSender(f, send, congestion, pacing, max_rate, mapped)
+        return self.sender_class(
+            f,
+            send,
+            window_size,
+            congestion,
+            length,
+            checksum,
+            compression,
+            fec if self.fec else None,
+            chunk_size,
+            pacing,
+            max_rate,
+            mapped,
+            early_eof,
+        )
+
+    def receiver(
+        self,
+        f,
+        send,
+        window_size=WINDOW_SIZE,
+        file_size=None,
+        journal=None,
+        checksum=None,
+        compression=None,
+        fec=False,
+        chunk_size=CHUNK_SIZE,
+        legacy=False,
+    ):
+        receiver_class = SelectiveRepeatReceiver if legacy else self.receiver_class
+        return receiver_class(
+            f,
+            send,
+            window_size,
+            file_size,
+            journal,
+            checksum,
+            compression,
+            fec and self.fec,
+            chunk_size,
+        )
+
+
+class GoBackNEngine(SelectiveRepeatEngine):
+    name = "gbn"
+    title = "Go-Back-N"
+    fec = False  # sin buffer fuera de orden no hay donde reconstruir un paquete
+    sender_class = GoBackNSender
+    receiver_class = GoBackNReceiver
+
+
+class AdaptiveEngine(SelectiveRepeatEngine):
+    name = "adaptive"
+    title = "Adaptive ARQ"
+    sender_class = AdaptiveSender
+
+
+ENGINES = {
+    engine.name: engine
+    for engine in (StopAndWaitEngine(), SelectiveRepeatEngine(), GoBackNEngine(), AdaptiveEngine())
+}
+
+
+def get_engine(name):
+    if name not in ENGINES:
+        raise ValueError(f"Unknown protocol '{name}', expected one of: " + ", ".join(ENGINES))
+    return ENGINES[name]
+
+
+def send_file(protocol, sock, addr, filepath, offset=0, control=None, gate=None, **options):
+    engine = get_engine(protocol)
+    logging.info(f"Starting file transfer using {engine.title} protocol: {filepath}")
+    with open(filepath, "rb") as f:
+        f.seek(offset)
+        io = BatchedSocket(sock, gate=gate)
+        sender = engine.sender(f, lambda datagram: io.send(datagram, addr), **options)
+        tune_buffers(engine, sock, sender)
+        return run_endpoint(io, sender, control=control)
+
+
+def receive_file(protocol, sock, addr, filepath, journal=None, start=None, control=None, **options):
+    engine = get_engine(protocol)
+    logging.info(f"Receiving file using {engine.title} protocol: {filepath}")
+    with open_destination(filepath, journal, start) as f:
+        io = BatchedSocket(sock)
+        receiver = engine.receiver(
+            f, lambda datagram: io.send(datagram, addr), journal=journal, **options
+        )
+        tune_buffers(engine, sock, receiver)
+        return run_endpoint(io, receiver, control=control)
+
+
+def tune_buffers(engine, sock, endpoint):
+    # con ventana entra una ventana entera de datagramas en el buffer del socket
+    if engine.windowed:
+        tune_socket_buffers(sock, endpoint.window_size * max_data_size(endpoint.chunk_size))
@@ -0,0 +1,117 @@
+import struct
+
+# Correccion de errores hacia adelante (FEC) para enlaces con mucha perdida
+# -> el sender agrupa los paquetes de datos en bloques de K consecutivos y al cerrar cada
+#    bloque manda un paquete de paridad (FLAG_PARITY) con el XOR de sus chunks originales
+#    (sin comprimir). El seq_num de la paridad es el del primer paquete del bloque
+# -> si al receiver le falta un solo paquete del bloque lo reconstruye con la paridad y los
+#    demas, sin esperar el timeout ni la retransmision
+# -> K fijo, o adaptativo: con la perdida medida se busca que cada bloque pierda en promedio
+#    TARGET_LOSSES paquetes (lo que una paridad XOR alcanza a cubrir); sin perdidas no se
+#    manda paridad
+# La paridad no ocupa lugar en la ventana ni se retransmite: si se pierde, se pierde.
+# Payload de la paridad: [paquetes del bloque (8 bits) | XOR de los largos (16 bits)] + XOR
+
+PARITY_HEADER = struct.Struct("!BH")
+PARITY_HEADER_SIZE = PARITY_HEADER.size
+
+ADAPTIVE = "auto"
+MIN_BLOCK_SIZE = 2
+MAX_BLOCK_SIZE = 64
+TARGET_LOSSES = 0.5
+MIN_LOSS_RATE = 0.002  # por debajo la paridad no paga lo que ocupa
+LOSS_SMOOTHING = 1 / 128  # peso de cada muestra en el promedio movil de perdida
+
+
+def parse_fec(value):
+    # K como entero, ADAPTIVE, o None (sin FEC); lo que no se entiende se ignora
+    if value is None or value == ADAPTIVE:
+        return value
+    try:
+        block_size = int(value)
+    except ValueError:
+        return None
+    return min(max(block_size, MIN_BLOCK_SIZE), MAX_BLOCK_SIZE)
+
+
+class ParityEncoder:
+    def __init__(self, block_size=ADAPTIVE):
+        self.adaptive = block_size == ADAPTIVE
+        self.loss_rate = 0.0
+        self.block_size = None if self.adaptive else block_size
+        self.block_start = None
+        self.count = 0
+        self.lengths = 0
+        self.parity = 0
+
+    def observe(self, lost):
+        # una muestra por paquete confirmado (False) o retransmitido (True)
+        self.loss_rate += (float(lost) - self.loss_rate) * LOSS_SMOOTHING
+
+    def add(self, seq, chunk):
+        # suma el chunk al bloque abierto; devuelve (seq, payload) de la paridad si lo cierra
+        if self.block_start is None:
+            self.block_size = self._next_block_size()
+            if self.block_size is None:
+                return None
+            self.block_start = seq
+        self.count += 1
+        self.lengths ^= len(chunk)
+        self.parity ^= int.from_bytes(chunk, "little")
+        if self.count >= self.block_size:
+            return self.flush()
+        return None
+
+    def flush(self):
+        # cierra el bloque abierto aunque este incompleto (al llegar al final del archivo)
+        if self.block_start is None:
+            return None
+        size = (self.parity.bit_length() + 7) // 8
+        payload = PARITY_HEADER.pack(self.count, self.lengths) + self.parity.to_bytes(
+            size, "little"
+        )
+        parity = (self.block_start, payload)
+        self.block_start = None
+        self.count = 0
+        self.lengths = 0
+        self.parity = 0
+        return parity
+
+    def _next_block_size(self):
+        if not self.adaptive:
+            return self.block_size
+        if self.loss_rate < MIN_LOSS_RATE:
+            return None
+        block_size = int(TARGET_LOSSES / self.loss_rate)
+        return min(max(block_size, MIN_BLOCK_SIZE), MAX_BLOCK_SIZE)
+
+
+class ParityDecoder:
+    # guarda los ultimos MAX_BLOCK_SIZE chunks por numero de chunk absoluto, los que hacen
+    # falta para reconstruir un paquete de un bloque que ya empezo a escribirse
+    def __init__(self):
+        self.chunks = {}
+
+    def remember(self, index, chunk):
+        self.chunks[index] = chunk
+
+    def forget_before(self, index):
+        self.chunks.pop(index - MAX_BLOCK_SIZE, None)
+
+    def recover(self, start, payload):
+        # devuelve (indice, chunk) del unico paquete que falta del bloque, o None
+        if len(payload) < PARITY_HEADER_SIZE:
+            return None
+        count, lengths = PARITY_HEADER.unpack_from(payload)
+        missing = [index for index in range(start, start + count) if index not in self.chunks]
+        if len(missing) != 1:
+            return None
+        parity = int.from_bytes(payload[PARITY_HEADER_SIZE:], "little")
+        for index in range(start, start + count):
+            if index != missing[0]:
+                chunk = self.chunks[index]
+                lengths ^= len(chunk)
+                parity ^= int.from_bytes(chunk, "little")
+        if parity.bit_length() > lengths * 8:
+            return None
+        return missing[0], parity.to_bytes(lengths, "little")
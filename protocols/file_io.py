@@ -0,0 +1,103 @@
+import hashlib
+import io
+import mmap
+import os
+
+# Acceso a archivos sin copias intermedias
+# -> el sender mapea el archivo y cada paquete en vuelo referencia un slice del mmap,
+#    asi la memoria por transferencia no depende del tamaño de la ventana
+# -> el receiver, si conoce el tamaño del archivo, lo preasigna (sparse) y escribe cada
+#    chunk en su offset apenas llega; de los paquetes fuera de orden solo guarda el largo y
+#    cuando se completa el tramo lo relee del archivo para el digest, que va en orden
+
+DIGEST_ALGORITHM = "sha256"  # checksum de punta a punta del archivo completo
+DIGEST_SIZE = hashlib.new(DIGEST_ALGORITHM).digest_size
+DIGEST_BLOCK_SIZE = 1024 * 1024
+
+
+def map_file(f):
+    # ACCESS_COPY da un mapeo escribible (privado) para poder pasar las paginas a sendmmsg
+    # sin copiarlas; nunca se escribe, asi que no se duplica memoria.
+    # Devuelve None si el archivo no se puede mapear (vacio, pipe, etc)
+    try:
+        size = os.fstat(f.fileno()).st_size
+    except (AttributeError, OSError, io.UnsupportedOperation):
+        return None
+    if size == 0:
+        return None
+    try:
+        return memoryview(mmap.mmap(f.fileno(), size, access=mmap.ACCESS_COPY))
+    except (OSError, ValueError):
+        return None
+
+
+class PresizedWriter:
+    def __init__(self, f, size):
+        self.f = f
+        self.fd = f.fileno()
+        self.size = size
+        self.end = f.tell()  # al retomar, lo anterior a la posicion actual ya esta escrito
+        f.flush()
+        # solo agranda: en paralelo cada receiver escribe su rango del mismo archivo
+        if os.fstat(self.fd).st_size < size:
+            os.ftruncate(self.fd, size)
+
+    def write_at(self, offset, data):
+        if hasattr(os, "pwrite"):
+            os.pwrite(self.fd, data, offset)
+        else:
+            self.f.seek(offset)
+            self.f.write(data)
+        self.end = max(self.end, offset + len(data))
+
+    def digest_range(self, digest, offset, length):
+        # agrega al digest un tramo ya escrito, leyendolo de a bloques
+        while length > 0:
+            size = min(length, DIGEST_BLOCK_SIZE)
+            if hasattr(os, "pread"):
+                data = os.pread(self.fd, size, offset)
+            else:
+                self.f.seek(offset)
+                data = self.f.read(size)
+            if not data:
+                break
+            digest.update(data)
+            offset += len(data)
+            length -= len(data)
+
+    def finish(self):
+        # el sender mando menos (o mas) de lo anunciado: el archivo queda con lo recibido
+        if self.end != self.size:
+            self.f.flush()
+            os.ftruncate(self.fd, self.end)
+
+
+def resize_file(filepath, size):
+    # deja el destino de una transferencia en paralelo con su tamaño final antes de que cada
+    # sesion escriba su rango; es idempotente, asi que no importa cual sesion llegue primero
+    fd = os.open(filepath, os.O_RDWR | os.O_CREAT, 0o644)
+    try:
+        if os.fstat(fd).st_size != size:
+            os.ftruncate(fd, size)
+    finally:
+        os.close(fd)
+
+
+def file_digest(filepath, algorithm=DIGEST_ALGORITHM):
+    digest = hashlib.new(algorithm)
+    buffer = bytearray(DIGEST_BLOCK_SIZE)
+    view = memoryview(buffer)
+    with open(filepath, "rb", buffering=0) as f:
+        while size := f.readinto(buffer):
+            digest.update(view[:size])
+    return digest.hexdigest()
+
+
+def unmap_file(view):
+    mapping = view.obj
+    view.release()
+    try:
+        mapping.close()
+    except BufferError:
+        # todavia hay slices en uso (ej. un datagrama encolado): se libera con el GC
+        pass
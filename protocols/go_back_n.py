@@ -0,0 +1,76 @@
+import logging
+from protocols.package import SEQ_MODULO
+from protocols.selective_repeat import (
+    SelectiveRepeatReceiver,
+    SelectiveRepeatSender,
+    seq_after_or_equal,
+)
+
+# Go-Back-N: la misma ventana, pacing y control de congestion que Selective Repeat, con ACKs
+# acumulativos y sin buffer de reordenamiento en el receiver
+# -> el receiver solo acepta el paquete que espera: los que llegan fuera de orden se descartan
+#    y se contesta al instante el ACK acumulativo (un SACK sin bitmap)
+# -> el sender no sabe que llego mas alla del acumulativo: con dup_threshold ACKs repetidos o un
+#    timer vencido vuelve a mandar toda la ventana desde la base, en orden
+# -> despues de volver atras no se vuelve a reaccionar a ACKs repetidos hasta que la base pase
+#    lo que estaba en vuelo (los repetidos que siguen llegando son de la rafaga anterior)
+# El EOF adelantado y el digest del EOF funcionan igual que en Selective Repeat.
+
+
+class GoBackNSender(SelectiveRepeatSender):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.dup_acks = 0
+
+    def _retransmit_expired(self, now):
+        expired = self.timers.pop_expired(now)
+        if not expired:
+            return
+        logging.debug(f"Timeout for packet {expired[0]}, going back to {self.seq_base}")
+        if any(
+            seq in self.retransmitted or seq_after_or_equal(seq, self.recovery_seq)
+            for seq in expired
+        ):
+            self.cc.on_timeout(now)
+            self.recovery_seq = self.next_seq
+        self.rtt.on_timeout()
+        self._go_back(self.seq_base, now)
+
+    def _on_new_acks(self, newly_acked, cumulative_ack, highest_offset, now):
+        self.dup_acks = 0
+
+    def _on_duplicate_ack(self, ack_packet, now):
+        if not ack_packet.sack or ack_packet.seq_num != self.seq_base or not self.buffer:
+            return
+        if not seq_after_or_equal(self.seq_base, self.recovery_seq):
+            return  # ya se volvio atras por esta perdida
+        self.dup_acks += 1
+        if self.dup_acks < self.dup_threshold:
+            return
+        logging.debug(f"Packet {self.seq_base} reported missing, going back")
+        self.dup_acks = 0
+        self.cc.on_loss(now)
+        self.recovery_seq = self.next_seq
+        self._go_back(self.seq_base, now)
+
+    def _go_back(self, start, now):
+        # retransmite en orden todo lo que sigue sin confirmar desde start
+        seq = start
+        while seq != self.next_seq:
+            if seq in self.buffer and seq not in self.acks_received:
+                self._retransmit(seq, now)
+                self.timers.schedule(seq, now + self.rtt.rto)
+            seq = (seq + 1) % SEQ_MODULO
+
+
+class GoBackNReceiver(SelectiveRepeatReceiver):
+    def _on_data(self, seq, data, now):
+        offset = (seq - self.expected_base) % self.seq_modulo
+        if offset == 0:
+            super()._on_data(seq, data, now)
+            return
+        if offset >= self.seq_modulo - self.window_size:
+            self.metrics.duplicates += 1  # ya escrito: el ACK anterior se perdio
+        else:
+            logging.debug(f"Dropping out of order packet {seq}, expecting {self.expected_base}")
+        self._send_sack()
@@ -0,0 +1,158 @@
+import contextlib
+import json
+import logging
+import os
+import threading
+
+# Journal de progreso para retomar transferencias cortadas
+# -> lo mantiene el que recibe (el server en un upload, el cliente en un download) al lado
+#    del archivo destino, en <archivo>.journal
+# -> guarda la identidad del archivo origen (tamaño y mtime) y cuantos bytes contiguos
+#    desde el principio ya estan escritos y sincronizados a disco (fsync)
+# -> se actualiza cada CHECKPOINT_BYTES y al cortarse la transferencia; al terminar se borra
+# Al reintentar, el comando lleva tamaño, mtime y offset y el sender arranca desde ahi.
+# Con executor (el server async) el fsync y la escritura del journal corren en otro hilo sobre
+# un dup del descriptor: el que recibe sigue escribiendo y el archivo se puede cerrar antes.
+
+JOURNAL_SUFFIX = ".journal"
+CHECKPOINT_BYTES = 4 * 1024 * 1024
+
+# transferencia vigente de cada destino: si un reintento llega antes de que se corte por
+# timeout la anterior (el cliente murio), la vieja ya no puede pisar el journal
+_active = {}
+
+
+class TransferJournal:
+    def __init__(self, filepath, size, mtime, offset=0):
+        self.filepath = filepath
+        self.path = filepath + JOURNAL_SUFFIX
+        self.size = size
+        self.mtime = mtime
+        self.offset = offset  # desde donde arranca esta transferencia
+        self.position = offset  # bytes contiguos escritos hasta ahora
+        self.saved = offset  # hasta donde se pidio el ultimo checkpoint
+        self.executor = None  # callable que corre el guardado en otro hilo, None es en linea
+        self.finished = False
+        self.lock = threading.Lock()
+
+    @classmethod
+    def load(cls, filepath):
+        try:
+            with open(filepath + JOURNAL_SUFFIX) as f:
+                state = json.load(f)
+            journal = cls(filepath, int(state["size"]), int(state["mtime"]), int(state["offset"]))
+        except (OSError, ValueError, KeyError, TypeError):
+            return None
+        # el destino tiene que tener al menos lo que el journal da por escrito
+        if not os.path.isfile(filepath) or os.path.getsize(filepath) < journal.offset:
+            return None
+        return journal
+
+    def matches(self, size, mtime):
+        return self.size == size and self.mtime == mtime
+
+    def record(self, f, position):
+        self.position = position
+        if position - self.saved >= CHECKPOINT_BYTES:
+            self.save(f)
+
+    def save(self, f):
+        if _active.get(self.path) is not self:
+            return
+        # primero los datos a disco y despues el journal: nunca apunta a bytes que no estan
+        try:
+            f.flush()
+            fd = os.dup(f.fileno())
+        except (OSError, ValueError) as e:
+            logging.warning(f"Could not save transfer journal {self.path}: {e}")
+            return
+        position = self.saved = self.position
+        if self.executor is None:
+            self._write(fd, position)
+        else:
+            self.executor(lambda: self._write(fd, position))
+
+    def _write(self, fd, position):
+        try:
+            with self.lock:
+                if self.finished:
+                    return  # la transferencia termino: el journal ya se borro
+                os.fsync(fd)
+                temporary = self.path + ".tmp"
+                with open(temporary, "w") as journal_file:
+                    json.dump(
+                        {"size": self.size, "mtime": self.mtime, "offset": position},
+                        journal_file,
+                    )
+                    journal_file.flush()
+                    os.fsync(journal_file.fileno())
+                os.replace(temporary, self.path)
+                if self.finished:
+                    os.remove(self.path)  # termino mientras se guardaba
+        except (OSError, ValueError) as e:
+            logging.warning(f"Could not save transfer journal {self.path}: {e}")
+        finally:
+            os.close(fd)
+
+    def complete(self):
+        if _active.get(self.path) is not self:
+            return
+        # sin el lock: no espera un checkpoint en curso, que ve finished y borra lo que escriba
+        self.finished = True
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
+
+    def release(self):
+        if _active.get(self.path) is self:
+            del _active[self.path]
+
+
+def resume_journal(filepath, size, mtime, restart=False):
+    # journal de un intento anterior con el mismo origen, o uno nuevo desde el principio.
+    # Sin tamaño o sin mtime (clientes viejos) no hay forma de validar el origen: no se retoma
+    if size is None or mtime is None:
+        return None
+    journal = None if restart else TransferJournal.load(filepath)
+    if journal is not None and journal.matches(size, mtime):
+        return journal
+    return TransferJournal(filepath, size, mtime)
+
+
+@contextlib.contextmanager
+def open_destination(filepath, journal=None, start=None):
+    # abre el destino conservando lo ya escrito segun el journal y queda posicionado al final.
+    # Con start es un rango de una transferencia en paralelo: el archivo lo comparten varias
+    # sesiones, asi que no se trunca y se escribe desde start
+    offset = journal.offset if journal is not None else 0
+    if start is not None:
+        f = os.fdopen(os.open(filepath, os.O_RDWR | os.O_CREAT, 0o644), "r+b")
+        f.seek(start)
+    elif offset:
+        f = open(filepath, "r+b")
+        f.seek(offset)
+        f.truncate()
+        logging.info(f"Resuming transfer of {filepath} at byte {offset}")
+    else:
+        # w+b: el receiver relee lo que escribio fuera de orden para el digest
+        f = open(filepath, "w+b")
+    if journal is not None:
+        _active[journal.path] = journal
+    try:
+        yield f
+    except BaseException:
+        if journal is not None:
+            journal.save(f)
+        raise
+    else:
+        if journal is not None:
+            journal.complete()
+    finally:
+        f.close()
+        if journal is not None:
+            journal.release()
+
+
+def source_mtime(filepath):
+    return os.stat(filepath).st_mtime_ns
@@ -0,0 +1,141 @@
+import bisect
+import time
+
+# Metricas de una transferencia, iguales para todos los protocolos y los dos extremos
+# -> payload_bytes: bytes del archivo enviados/escritos una sola vez (lo que mide el goodput)
+# -> wire_bytes_*: todo lo que paso por el socket, con headers, ACKs y retransmisiones
+# -> rtt: histograma de las muestras validas (Karn), window_samples: ocupacion de la ventana
+# -> corrupted: paquetes descartados por checksum (para el protocolo son perdidas)
+# -> digest_ok: si el digest del EOF coincidio con lo recibido (None si no vino digest)
+# -> compressed: paquetes de datos que viajaron comprimidos
+# -> parity_sent / fec_recovered: paquetes de paridad FEC enviados y paquetes reconstruidos
+#    con ellos (no cuentan como retransmisiones)
+
+RTT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0)
+WINDOW_SAMPLE_INTERVAL = 0.1
+MAX_WINDOW_SAMPLES = 600
+
+
+class Histogram:
+    def __init__(self, bounds):
+        self.bounds = tuple(bounds)
+        self.counts = [0] * (len(self.bounds) + 1)  # el ultimo es +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def as_dict(self):
+        return {
+            "bounds": list(self.bounds),
+            "counts": list(self.counts),
+            "sum": self.sum,
+            "count": self.count,
+        }
+
+
+def merge_histograms(first, second):
+    # suma dos histogramas en formato dict (con los mismos limites)
+    return {
+        "bounds": first["bounds"],
+        "counts": [a + b for a, b in zip(first["counts"], second["counts"])],
+        "sum": first["sum"] + second["sum"],
+        "count": first["count"] + second["count"],
+    }
+
+
+class TransferMetrics:
+    def __init__(self, role):
+        self.role = role  # "sender" o "receiver"
+        self.start_time = time.monotonic()
+        self.end_time = None
+
+        self.payload_bytes = 0
+        self.wire_bytes_sent = 0
+        self.wire_bytes_received = 0
+        self.packets_sent = 0
+        self.packets_received = 0
+        self.retransmissions = 0
+        self.duplicates = 0
+        self.acks_sent = 0
+        self.acks_received = 0
+        self.corrupted = 0
+        self.digest_ok = None
+        self.compressed = 0
+        self.parity_sent = 0
+        self.fec_recovered = 0
+
+        self.rtt = Histogram(RTT_BUCKETS)
+        self.rto = None
+        self.window_samples = []  # (segundos desde el inicio, paquetes en vuelo, cwnd)
+        self.max_in_flight = 0
+        self._next_window_sample = self.start_time
+
+    @property
+    def duration(self):
+        end = self.end_time if self.end_time is not None else time.monotonic()
+        return end - self.start_time
+
+    @property
+    def goodput(self):
+        duration = self.duration
+        return self.payload_bytes / duration if duration > 0 else 0.0
+
+    def on_send(self, size, retransmission=False):
+        self.packets_sent += 1
+        self.wire_bytes_sent += size
+        if retransmission:
+            self.retransmissions += 1
+
+    def on_receive(self, size):
+        self.packets_received += 1
+        self.wire_bytes_received += size
+
+    def on_rtt_sample(self, rtt):
+        if rtt is not None:
+            self.rtt.observe(rtt)
+
+    def sample_window(self, now, in_flight, cwnd=None):
+        self.max_in_flight = max(self.max_in_flight, in_flight)
+        if now < self._next_window_sample:
+            return
+        self._next_window_sample = now + WINDOW_SAMPLE_INTERVAL
+        if len(self.window_samples) >= MAX_WINDOW_SAMPLES:
+            # transferencia larga: se descarta una muestra de cada dos y se sigue
+            del self.window_samples[::2]
+        self.window_samples.append((now - self.start_time, in_flight, cwnd))
+
+    def finish(self, rto=None):
+        if self.end_time is None:
+            self.end_time = time.monotonic()
+        if rto is not None:
+            self.rto = rto
+        return self
+
+    def as_dict(self):
+        return {
+            "role": self.role,
+            "duration": self.duration,
+            "goodput": self.goodput,
+            "payload_bytes": self.payload_bytes,
+            "wire_bytes_sent": self.wire_bytes_sent,
+            "wire_bytes_received": self.wire_bytes_received,
+            "packets_sent": self.packets_sent,
+            "packets_received": self.packets_received,
+            "retransmissions": self.retransmissions,
+            "duplicates": self.duplicates,
+            "acks_sent": self.acks_sent,
+            "acks_received": self.acks_received,
+            "corrupted": self.corrupted,
+            "digest_ok": self.digest_ok,
+            "compressed": self.compressed,
+            "parity_sent": self.parity_sent,
+            "fec_recovered": self.fec_recovered,
+            "rto": self.rto,
+            "rtt": self.rtt.as_dict(),
+            "max_in_flight": self.max_in_flight,
+            "window_samples": list(self.window_samples),
+        }
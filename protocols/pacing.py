@@ -0,0 +1,70 @@
+# Pacing del sender con un token bucket
+# -> sin pacing, cuando se abre la ventana los paquetes salen todos juntos: la rafaga llena
+#    los buffers del socket y la cola del enlace y provoca las perdidas que despues hay que
+#    retransmitir
+# -> el bucket se llena a la tasa objetivo y cada paquete gasta su tamaño; los datos nuevos
+#    esperan a que haya tokens, las retransmisiones salen igual pero dejan el bucket en deuda
+# -> la profundidad del bucket es lo que puede salir junto en una vuelta del loop: al menos
+#    MIN_BURST paquetes o BURST_TIME segundos de datos a la tasa actual
+# -> tasa objetivo: la ventana de congestion repartida en el RTT (cwnd * paquete / srtt), con
+#    ganancia PACING_GAIN_SS en slow start para que la ventana pueda duplicarse y PACING_GAIN
+#    despues, como el pacing de Linux
+# -> sin muestra de RTT no hay tasa y la ventana inicial sale junta
+# -> max_rate (bytes por segundo) es un techo fijo, se aplica aunque no haya RTT
+
+PACING_GAIN_SS = 2.0
+PACING_GAIN = 1.25
+BURST_TIME = 0.002
+MIN_BURST = 2
+
+
+class Pacer:
+    def __init__(self, max_rate=None):
+        self.max_rate = max_rate
+        self.rate = max_rate  # bytes por segundo, None sin pacing
+        self.burst = 0.0
+        self.tokens = 0.0
+        self.last_refill = None
+
+    def update_rate(self, cwnd, packet_size, srtt, slow_start):
+        rate = None
+        if srtt:
+            gain = PACING_GAIN_SS if slow_start else PACING_GAIN
+            rate = gain * cwnd * packet_size / srtt
+        if self.max_rate is not None:
+            rate = self.max_rate if rate is None else min(rate, self.max_rate)
+        self.rate = rate
+        if rate is not None:
+            self.burst = max(MIN_BURST * packet_size, rate * BURST_TIME)
+
+    def ready(self, now):
+        # True si un paquete puede salir ahora
+        if self.rate is None:
+            return True
+        if self.last_refill is None:
+            self.tokens = self.burst
+        else:
+            self.tokens = min(self.tokens + (now - self.last_refill) * self.rate, self.burst)
+        self.last_refill = now
+        return self.tokens >= 0
+
+    def consume(self, size):
+        if self.rate is not None:
+            self.tokens -= size
+
+    def next_send_time(self):
+        # cuando se paga la deuda del bucket, o None si ya se puede mandar
+        if self.rate is None or self.last_refill is None or self.tokens >= 0:
+            return None
+        return self.last_refill - self.tokens / self.rate
+
+
+def rate_from_mbits(mbits):
+    # las opciones --rate van en Mbit/s como las del emulador; el pacer trabaja en bytes/s
+    return int(mbits * 1e6 / 8) if mbits else None
+
+
+def negotiate_rate(requested, limit):
+    # el techo mas bajo entre el que pide el cliente y el del server, None si no hay ninguno
+    rates = [rate for rate in (requested, limit) if rate]
+    return min(rates) if rates else None
@@ -1,15 +1,160 @@
+import struct
+from protocols.checksum import CRC32, CRC32C, available_checksums, compute_checksum
+
+# Header v2: [version | flags | seq_num (32 bits)]
+# Con FLAG_CRC32C o FLAG_CRC32 le sigue [checksum (32 bits)] de header + payload
+# Con FLAG_COMPRESSED el payload es el chunk comprimido con el algoritmo negociado
+# Con FLAG_PARITY es un paquete de paridad FEC del bloque que empieza en seq_num (ver fec.py)
+# El header legacy es [seq_num (1 byte) | ack (1 byte)]. Como los seq_num legacy nunca
+# superan SEQ_MODULO = 16, el bit alto del primer byte alcanza para distinguir formatos.
+VERSION = 2
+LEGACY_VERSION = 1
+VERSION_MARKER = 0x80
+
+HEADER = struct.Struct("!BBI")
+HEADER_SIZE = HEADER.size
+CHECKSUM = struct.Struct("!I")
+CHECKSUM_SIZE = CHECKSUM.size
+LEGACY_HEADER_SIZE = 2
+MAX_HEADER_SIZE = HEADER_SIZE + CHECKSUM_SIZE
+
+SEQ_MODULO = 2**32
+LEGACY_SEQ_MODULO = 256
+
+FLAG_ACK = 0x01
+FLAG_EOF = 0x02
+FLAG_SACK = 0x04
+FLAG_CRC32C = 0x08
+FLAG_CRC32 = 0x10
+FLAG_COMPRESSED = 0x20
+FLAG_PARITY = 0x40
+CHECKSUM_FLAGS = {CRC32C: FLAG_CRC32C, CRC32: FLAG_CRC32}
+
+# El ACK de un EOF con digest lleva el digest de lo que se recibio: el sender lo compara con
+# el suyo y sabe si el archivo llego entero antes de dar la transferencia por buena
+# ACK selectivo: seq_num es el ACK acumulativo (proximo seq esperado) y data es un
+# bitmap donde el bit i indica que llego el paquete seq_num + 1 + i
+
+
 class Package:
-    def __init__(self, seq_num, ack, data):
+    def __init__(self, seq_num, ack, data, flags=0, version=VERSION, checksum_ok=None):
         self.seq_num = seq_num
-        self.ack = ack
+        self.flags = (flags | FLAG_ACK) if ack else (flags & ~FLAG_ACK)
         self.data = data
+        self.version = version
+        self.checksum_ok = checksum_ok  # None si el paquete no trae checksum
+
+    @property
+    def ack(self):
+        return bool(self.flags & FLAG_ACK)
+
+    @property
+    def eof(self):
+        return bool(self.flags & FLAG_EOF)
+
+    @property
+    def sack(self):
+        return bool(self.flags & FLAG_SACK)
+
+    @property
+    def compressed(self):
+        return bool(self.flags & FLAG_COMPRESSED)
+
+    @property
+    def parity(self):
+        return bool(self.flags & FLAG_PARITY)
+
+    def sacked_offsets(self):
+        for index, byte in enumerate(self.data):
+            if byte:
+                for bit in range(8):
+                    if byte & (0x80 >> bit):
+                        yield index * 8 + bit
+
+    def intact(self, checksum=None):
+        # con checksum negociado tambien se descartan los paquetes sin checksum:
+        # un error en el byte de flags puede haber borrado el flag
+        if self.checksum_ok is None:
+            return checksum is None
+        return self.checksum_ok
 
-    def to_bytes(self):
-        return bytes([self.seq_num, int(self.ack)]) + self.data
+    def to_bytes(self, checksum=None):
+        if self.version == LEGACY_VERSION:
+            return bytes([self.seq_num % LEGACY_SEQ_MODULO, int(self.ack)]) + self.data
+        return pack_header(self.seq_num, self.flags, checksum, self.data) + self.data
 
     @staticmethod
     def from_bytes(data_bytes):
+        # data_bytes puede ser un memoryview: data queda como una vista, sin copiar el payload
+        if len(data_bytes) >= HEADER_SIZE and data_bytes[0] & VERSION_MARKER:
+            version, flags, seq_num = HEADER.unpack_from(data_bytes)
+            version &= ~VERSION_MARKER
+            if version != VERSION:
+                # version desconocida: casi seguro un header corrupto, se descarta
+                return Package(seq_num, False, b"", flags, version, checksum_ok=False)
+            if not flags & (FLAG_CRC32C | FLAG_CRC32):
+                return Package(seq_num, flags & FLAG_ACK, data_bytes[HEADER_SIZE:], flags, version)
+
+            name = CRC32C if flags & FLAG_CRC32C else CRC32
+            data = data_bytes[HEADER_SIZE + CHECKSUM_SIZE :]
+            checksum_ok = (
+                len(data_bytes) >= HEADER_SIZE + CHECKSUM_SIZE
+                and name in available_checksums()
+                and CHECKSUM.unpack_from(data_bytes, HEADER_SIZE)[0]
+                == compute_checksum(name, data_bytes[:HEADER_SIZE], data)
+            )
+            return Package(seq_num, flags & FLAG_ACK, data, flags, version, checksum_ok)
+
         seq_num = data_bytes[0]
         ack = data_bytes[1]
         data = data_bytes[2:]
-        return Package(seq_num, ack, data)
+        # En el formato legacy un paquete vacio que no es ACK marca el fin del archivo
+        # (el sender SR legacy manda el EOF con ack=1, pero los receivers solo miran data)
+        flags = FLAG_EOF if not data else 0
+        return Package(seq_num, ack, data, flags, LEGACY_VERSION)
+
+    def reply_ack(self, seq_num=None, data=b""):
+        seq = self.seq_num if seq_num is None else seq_num
+        return Package(seq, True, data, self.flags & FLAG_EOF, self.version)
+
+    @staticmethod
+    def sack_ack(cumulative_ack, offsets):
+        bitmap = bytearray()
+        for offset in offsets:
+            index = offset >> 3
+            if index >= len(bitmap):
+                bitmap.extend(bytes(index + 1 - len(bitmap)))
+            bitmap[index] |= 0x80 >> (offset & 7)
+        return Package(cumulative_ack, True, bytes(bitmap), FLAG_SACK)
+
+
+def is_control(datagram):
+    # los mensajes de control (comandos, HI, PROBE) son texto y empiezan con una mayuscula,
+    # que no puede ser el primer byte de un header v2 (bit alto) ni de uno legacy (seq < 16)
+    return len(datagram) > 0 and 0x41 <= datagram[0] <= 0x5A
+
+
+def pack_header(seq_num, flags=0, checksum=None, payload=b""):
+    # con checksum el header incluye el del payload que va a acompañarlo
+    if checksum is None:
+        return HEADER.pack(VERSION_MARKER | VERSION, flags, seq_num)
+    flags = (flags & ~(FLAG_CRC32C | FLAG_CRC32)) | CHECKSUM_FLAGS[checksum]
+    header = HEADER.pack(VERSION_MARKER | VERSION, flags, seq_num)
+    return header + CHECKSUM.pack(compute_checksum(checksum, header, payload))
+
+
+def header_size(checksum=None):
+    return HEADER_SIZE if checksum is None else HEADER_SIZE + CHECKSUM_SIZE
+
+
+def read_datagram(f, seq_num, chunk_size, checksum=None):
+    # Header y payload en un solo bytearray: el payload se lee directo del archivo
+    # (sin concatenar) y el mismo datagrama se reenvia en cada retransmision.
+    # Un paquete sin datos es el EOF.
+    offset = header_size(checksum)
+    buffer = bytearray(offset + chunk_size)
+    view = memoryview(buffer)
+    size = f.readinto(view[offset:]) or 0
+    flags = 0 if size else FLAG_EOF
+    view[:offset] = pack_header(seq_num, flags, checksum, view[offset : offset + size])
+    return view[: offset + size], size
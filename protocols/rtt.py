@@ -0,0 +1,49 @@
+# Estimacion de RTT y RTO segun RFC 6298 (Jacobson/Karels)
+# -> SRTT y RTTVAR se actualizan con cada muestra valida
+# -> Karn: no se toman muestras de paquetes retransmitidos (el ACK es ambiguo)
+# -> Cada timeout duplica el RTO (backoff exponencial) hasta la proxima muestra valida
+
+INITIAL_RTO = 0.5  # segundos, hasta tener la primera muestra
+MIN_RTO = 0.01
+MAX_RTO = 10.0
+CLOCK_GRANULARITY = 0.001
+
+ALPHA = 1 / 8
+BETA = 1 / 4
+K = 4
+
+
+class RttEstimator:
+    def __init__(self, initial_rto=INITIAL_RTO, min_rto=MIN_RTO, max_rto=MAX_RTO):
+        self.min_rto = min_rto
+        self.max_rto = max_rto
+        self.srtt = None
+        self.rttvar = None
+        self.rto = self._bound(initial_rto)
+        self.samples = 0
+        self.backoffs = 0
+
+    def _bound(self, rto):
+        return min(self.max_rto, max(self.min_rto, rto))
+
+    def sample(self, rtt):
+        if self.srtt is None:
+            self.srtt = rtt
+            self.rttvar = rtt / 2
+        else:
+            self.rttvar = (1 - BETA) * self.rttvar + BETA * abs(self.srtt - rtt)
+            self.srtt = (1 - ALPHA) * self.srtt + ALPHA * rtt
+        self.rto = self._bound(self.srtt + max(CLOCK_GRANULARITY, K * self.rttvar))
+        self.samples += 1
+
+    def on_ack(self, send_time, now, retransmitted):
+        # Regla de Karn. Devuelve la muestra tomada (o None)
+        if retransmitted:
+            return None
+        rtt = now - send_time
+        self.sample(rtt)
+        return rtt
+
+    def on_timeout(self):
+        self.rto = self._bound(self.rto * 2)
+        self.backoffs += 1
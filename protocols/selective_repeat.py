@@ -1,215 +1,769 @@
-import socket
+import hashlib
 import logging
 import time
-from protocols.package import Package
-
-
-WINDOW_SIZE = 8
-CHUNK_SIZE = 4096
-TIMEOUT = 0.15  # segundos
-HEADER_SIZE = 2
-SEQ_MODULO = 2 * WINDOW_SIZE
-
-# Al usar SEQ_MODULO = 2 * WINDOW_SIZE, Selective Repeat asegura que no habrá ambigüedad
-# ni solapamiento en los números de secuencia entre paquetes nuevos y viejos.
-
-
-def selective_repeat_send(sock, addr, filepath):
-    sock.settimeout(TIMEOUT)
-    seq_base = 0  # primer elemento
-    next_seq = 0
-    buffer = {}  # Contiene los paquetes enviados pero pendientes de confirmacion
-    timers = {}
-    acks_received = set()
-    eof_sent = False
-    eof_seq = None  # Me guardo el numero del EOF para enviarlo al final
-    eof_reached = False
-
-    total_bytes = 0
-    retransmissions = 0
-    start_time = time.time()
-    last_log_time = start_time
-    condicion_corte = False
-    logging.info(f"Starting file transfer using Selective Repeat protocol: {filepath}")
-
-    with open(filepath, "rb") as f:
-        # while not eof_sent or len(buffer) > 0:  # seq_base < next_seq
-        while not (condicion_corte):
-
-            # solo envia si nuevos paquetes si hay lugar en la ventana / envia hasta llenar ventana
-            while len(buffer) < WINDOW_SIZE and not eof_reached:
-                data = f.read(CHUNK_SIZE)
-                if not data and not eof_reached:
-                    eof_reached = True
-                    eof_seq = next_seq
-                    break
-                else:
-                    packet = Package(next_seq, False, data)
-                    total_bytes += len(packet.to_bytes())
-                    current_time = time.time()
-                    if current_time - last_log_time > 2.0:
-                        logging.info(
-                            f"Window: {len(buffer)}/{WINDOW_SIZE}, "
-                            + f"Base: {seq_base}, Next: {next_seq}, "
-                            + f"Bytes: {total_bytes}"
-                        )
-                        last_log_time = current_time
-                    sock.sendto(packet.to_bytes(), addr)
-                    buffer[next_seq] = packet
-                    timers[next_seq] = time.time()  # inicia timer
-                    next_seq = (next_seq + 1) % SEQ_MODULO
-
-            if eof_reached:
-                if len(buffer) > 0:
-                    for seq in buffer.keys():
-                        sock.sendto(buffer[seq].to_bytes(), addr)                    
-                else:
-                    logging.info(f"EOF reached, sending EOF packet with seq={eof_seq}")
-                    eof_sent = True
-                    pack = Package(eof_seq, True, b"")
-                    sock.sendto(pack.to_bytes(), addr)
-                    condicion_corte = True
-
-            # escuchar ack´s
-            if not condicion_corte:
-
-                try:
-                    raw_ack, _ = sock.recvfrom(HEADER_SIZE)
-                    ack_packet = Package.from_bytes(raw_ack)
-                    if ack_packet.ack and ack_packet.seq_num in buffer:
-                        acks_received.add(ack_packet.seq_num)
-                except socket.timeout:
-                    pass
-
-                # retrasmision por timeout
-                for seq in list(buffer):
-                    if seq not in acks_received and (
-                        time.time() - timers[seq] > TIMEOUT
-                    ):
-                        retransmissions += 1
-                        logging.debug(f"Timeout for packet {seq}, retransmitting")
-                        sock.sendto(buffer[seq].to_bytes(), addr)
-                        total_bytes += len(buffer[seq].to_bytes())
-
-                        timers[seq] = time.time()  # si se retrasmite, reinicia el timer
-
-                # desliza la ventana
-                while seq_base in acks_received:  # and acks_received[seq_base]:
-                    del buffer[seq_base]
-                    del timers[seq_base]
-                    acks_received.remove(seq_base)
-                    seq_base = (seq_base + 1) % SEQ_MODULO
-                    condicion_corte = not buffer and eof_sent
-                    logging.debug(f"Window base advanced to {seq_base}")
-            else:
+from protocols.package import (
+    Package,
+    FLAG_COMPRESSED,
+    FLAG_EOF,
+    FLAG_PARITY,
+    LEGACY_VERSION,
+    MAX_HEADER_SIZE,
+    SEQ_MODULO,
+    pack_header,
+    read_datagram,
+)
+from protocols.rtt import RttEstimator
+from protocols.metrics import TransferMetrics
+from protocols.timers import RetransmissionTimers
+from protocols.congestion import DEFAULT_CONGESTION_CONTROL, create_congestion_controller
+from protocols.batch_io import datagram_length
+from protocols.file_io import DIGEST_ALGORITHM, DIGEST_SIZE, PresizedWriter, map_file, unmap_file
+from protocols.compression import ChunkCompressor
+from protocols.fec import PARITY_HEADER_SIZE, ParityDecoder, ParityEncoder
+from protocols.pacing import Pacer
+
+
+WINDOW_SIZE = 64
+CHUNK_SIZE = 4096  # default si no se negocio otro (clientes y servers viejos)
+EOF_ACK_TRIES = 3
+
+# ACK diferido: el receiver manda un SACK cada ACK_EVERY paquetes en orden o a los
+# ACK_DELAY segundos del primero sin confirmar. Huecos y duplicados se confirman al instante.
+ACK_EVERY = 8
+ACK_DELAY = 0.002
+# Un hueco se da por perdido cuando llegaron DUP_THRESHOLD paquetes posteriores (RFC 6675)
+DUP_THRESHOLD = 3
+
+# Parametros del formato legacy (header de 2 bytes)
+LEGACY_WINDOW_SIZE = 8
+LEGACY_SEQ_MODULO = 2 * LEGACY_WINDOW_SIZE
+
+# Con numeros de secuencia de 32 bits la ventana solo tiene que ser menor a SEQ_MODULO / 2
+# para que Selective Repeat no tenga ambigüedad entre paquetes nuevos y viejos.
+MAX_WINDOW_SIZE = SEQ_MODULO // 2 - 1
+
+
+def validate_window_size(window_size):
+    if not 1 <= window_size <= MAX_WINDOW_SIZE:
+        raise ValueError(f"Window size must be between 1 and {MAX_WINDOW_SIZE}")
+    return window_size
+
+
+def negotiate_window(requested, limit):
+    # las dos puntas usan la menor: el receiver descarta lo que cae fuera de su ventana y un
+    # sender con una mas grande la llenaria de retransmisiones. None si el cliente no la pidio
+    if requested is None:
+        return None
+    return min(requested, limit)
+
+
+def seq_after_or_equal(seq, other):
+    return (seq - other) % SEQ_MODULO <= MAX_WINDOW_SIZE
+
+
+def max_ack_size(window_size):
+    # el SACK con el bitmap de la ventana, o el ACK del EOF con el digest
+    return MAX_HEADER_SIZE + max(window_size // 8 + 1, DIGEST_SIZE)
+
+
+def max_data_size(chunk_size):
+    return MAX_HEADER_SIZE + PARITY_HEADER_SIZE + chunk_size
+
+
+class SelectiveRepeatSender:
+    def __init__(
+        self,
+        f,
+        send,
+        window_size=WINDOW_SIZE,
+        congestion=DEFAULT_CONGESTION_CONTROL,
+        length=None,
+        checksum=None,
+        compression=None,
+        fec=None,
+        chunk_size=CHUNK_SIZE,
+        pacing=True,
+        max_rate=None,
+        mapped=None,
+        early_eof=False,
+    ):
+        self.f = f
+        self.send = send
+        self.chunk_size = chunk_size
+        self.checksum = checksum  # checksum por paquete negociado, None sin checksum
+        # pacing: espacia los paquetes nuevos en el RTT; max_rate (bytes/s) es un techo fijo
+        self.pacer = Pacer(max_rate) if pacing or max_rate is not None else None
+        self.compressor = ChunkCompressor(compression) if compression is not None else None
+        # fec: tamaño de bloque K, ADAPTIVE, o None sin paridad
+        self.fec = ParityEncoder(fec) if fec is not None else None
+        # digest de lo enviado, se calcula al leer cada chunk y viaja en el EOF
+        self.digest = hashlib.new(DIGEST_ALGORITHM)
+        self.window_size = validate_window_size(window_size)
+        self.max_datagram_size = max_ack_size(window_size)
+        # con el archivo mapeado los paquetes en vuelo son slices del mmap, no copias.
+        # mapped es un mapeo del archivo compartido con otros senders: no se libera al terminar
+        self.shared_mapping = mapped is not None
+        self.mapped = mapped if mapped is not None else map_file(f)
+        self.file_offset = f.tell() if self.mapped is not None else 0
+        # con length se manda solo ese rango desde la posicion actual (transferencia en paralelo)
+        self.remaining = length
+        self.rtt = RttEstimator()
+        self.cc = create_congestion_controller(congestion)
+
+        self.seq_base = 0  # primer elemento
+        self.next_seq = 0
+        self.buffer = {}  # Datagramas enviados pero pendientes de confirmacion
+        self.send_times = {}  # ultimo envio de cada paquete, para las muestras de RTT
+        self.timers = RetransmissionTimers()
+        self.retransmitted = set()  # Karn: estos paquetes no dan muestras de RTT
+        self.fast_retransmitted = set()
+        self.acks_received = set()
+        self.eof_reached = False
+        self.eof_seq = None  # Me guardo el numero del EOF para enviarlo al final
+        self.eof_sent = False
+        self.eof_deadline = None
+        self.eof_tries = 0
+        # early_eof: el receiver confirma el EOF recien cuando tiene todo (lo negocian con
+        # eof=1), asi que el EOF puede salir atras del ultimo paquete sin esperar los ACKs y un
+        # archivo que entra en una ventana termina en un RTT
+        self.early_eof = early_eof
+        # Solo se reacciona a una perdida por ventana: las perdidas de paquetes enviados
+        # antes de la ultima reduccion pertenecen al mismo evento de congestion
+        self.recovery_seq = 0
+        self.dup_threshold = DUP_THRESHOLD
+        self.done = False
+
+        self.metrics = TransferMetrics("sender")
+        self.last_log_time = time.time()
+
+    def next_deadline(self):
+        if self.done:
+            return None
+        if self.eof_sent:
+            return self.eof_deadline
+        deadline = self.timers.next_deadline()
+        if self.early_eof and self.eof_deadline is not None:
+            deadline = self.eof_deadline if deadline is None else min(deadline, self.eof_deadline)
+        # si lo unico que frena a los paquetes nuevos es el pacer, se despierta cuando hay tokens
+        if self.pacer is None or not self._window_open():
+            return deadline
+        paced_until = self.pacer.next_send_time()
+        if paced_until is None:
+            return deadline
+        return paced_until if deadline is None else min(deadline, paced_until)
+
+    def poll(self, now):
+        if self.done:
+            return
+        if self.eof_sent:
+            self._poll_eof(now)
+            return
+        self._retransmit_expired(now)
+        if self.pacer is not None:
+            self.pacer.update_rate(
+                self.cc.window,
+                max_data_size(self.chunk_size),
+                self.rtt.srtt,
+                self.cc.in_slow_start(),
+            )
+        self._fill_window(now)
+        self.metrics.sample_window(now, len(self.buffer) - len(self.acks_received), self.cc.window)
+
+        # los paquetes pendientes se recuperan por timeout, el EOF sale con la ventana vacia
+        if self.eof_reached and not self.buffer:
+            logging.info(f"EOF reached, sending EOF packet with seq={self.eof_seq}")
+            self.eof_sent = True
+            self._send_eof(now)
+        elif self.eof_reached and self.early_eof:
+            self._poll_early_eof(now)
+
+    def _fill_window(self, now):
+        # solo envia nuevos paquetes si hay lugar en la ventana de control de flujo,
+        # la cantidad en vuelo no supera la ventana de congestion y el pacer tiene tokens
+        while self._window_open() and (self.pacer is None or self.pacer.ready(now)):
+            datagram, payload = self._next_datagram()
+            size = len(payload)
+            if not size:
+                self.eof_reached = True
+                self.eof_seq = self.next_seq
+                if self.fec is not None:
+                    self._send_parity(self.fec.flush())
                 break
 
-        # mandar un eof
-        eof_ack_recv_tries = 0
-        logging.info("Waiting for EOF acknowledgment")
-        while eof_ack_recv_tries < 3:
-            try:
-                raw_ack, _ = sock.recvfrom(HEADER_SIZE)
-                ack_packet = Package.from_bytes(raw_ack)
-                if ack_packet.ack and ack_packet.seq_num == eof_seq:
-                    logging.info("EOF acknowledged")
-                    break
-            except socket.timeout:
-                logging.warning(f"EOF ACK timeout, retrying ({eof_ack_recv_tries + 1}/3)")
-                sock.sendto(Package(eof_seq, True, b"").to_bytes(), addr)
-                eof_ack_recv_tries += 1
-
-        duration = time.time() - start_time
-        transfer_rate = total_bytes / (1024 * duration) if duration > 0 else 0
-
-        logging.info(f"Transfer complete: {total_bytes} bytes sent in {duration:.2f}s")
+            self.metrics.payload_bytes += size
+            current_time = time.time()
+            if current_time - self.last_log_time > 2.0:
+                logging.info(
+                    f"Window: {len(self.buffer)}/{self.window_size}, cwnd: {self.cc.window}, "
+                    + f"Base: {self.seq_base}, Next: {self.next_seq}, "
+                    + f"Bytes: {self.metrics.payload_bytes}"
+                )
+                self.last_log_time = current_time
+            self._send(datagram)
+            self.buffer[self.next_seq] = datagram
+            self.send_times[self.next_seq] = now
+            self.timers.schedule(self.next_seq, now + self.rtt.rto)  # inicia timer
+            if self.fec is not None:
+                self._send_parity(self.fec.add(self.next_seq, payload))
+            self.next_seq = (self.next_seq + 1) % SEQ_MODULO
+
+    def _window_open(self):
+        return (
+            len(self.buffer) < self.window_size
+            and len(self.buffer) - len(self.acks_received) < self.cc.window
+            and not self.eof_reached
+        )
+
+    def _next_datagram(self):
+        chunk_size = self.chunk_size
+        if self.remaining is not None:
+            chunk_size = min(chunk_size, self.remaining)
+        if self.mapped is None:
+            datagram, size = read_datagram(self.f, self.next_seq, chunk_size, self.checksum)
+            payload = datagram[len(datagram) - size :]
+        else:
+            payload = self.mapped[self.file_offset : self.file_offset + chunk_size]
+            self.file_offset += len(payload)
+            header = pack_header(self.next_seq, 0, self.checksum, payload)
+            datagram, size = (header, payload), len(payload)
+        self.digest.update(payload)
+        if self.remaining is not None:
+            self.remaining -= size
+        if size and self.compressor is not None:
+            compressed = self.compressor.compress(payload)
+            if compressed is not None:
+                header = pack_header(self.next_seq, FLAG_COMPRESSED, self.checksum, compressed)
+                datagram = (header, compressed)
+                self.metrics.compressed += 1
+        return datagram, payload
+
+    def _send(self, datagram, retransmission=False):
+        size = datagram_length(datagram)
+        self.metrics.on_send(size, retransmission)
+        if self.pacer is not None:
+            self.pacer.consume(size)
+        self.send(datagram)
+
+    def _send_parity(self, parity):
+        if parity is None:
+            return
+        block_start, payload = parity
+        self._send(Package(block_start, False, payload, FLAG_PARITY).to_bytes(self.checksum))
+        self.metrics.parity_sent += 1
+
+    def _retransmit(self, seq, now):
+        if self.fec is not None:
+            self.fec.observe(True)
+        self._send(self.buffer[seq], retransmission=True)
+        self.send_times[seq] = now
+        self.retransmitted.add(seq)
+
+    def _retransmit_expired(self, now):
+        # retrasmision por timeout: solo los timers vencidos, en orden de vencimiento
+        expired = self.timers.pop_expired(now)
+        for seq in expired:
+            logging.debug(f"Timeout for packet {seq}, retransmitting")
+            # un timer vencido es perdida sin feedback: la ventana vuelve al minimo (on_loss
+            # queda para la retransmision rapida). Se reacciona una vez por episodio salvo que
+            # se pierda tambien la retransmision
+            if seq in self.retransmitted or seq_after_or_equal(seq, self.recovery_seq):
+                self.cc.on_timeout(now)
+                self.recovery_seq = self.next_seq
+            self._retransmit(seq, now)
+
+        # un solo backoff por vuelta aunque expiren varios timers juntos,
+        # los vencidos se reprograman con el RTO ya duplicado
+        if expired:
+            self.rtt.on_timeout()
+            logging.debug(f"RTO backed off to {self.rtt.rto:.3f}s")
+            for seq in expired:
+                self.timers.schedule(seq, now + self.rtt.rto)
+
+    def on_datagram(self, raw_data, now):
+        ack_packet = Package.from_bytes(raw_data)
+        self.metrics.on_receive(len(raw_data))
+        if not ack_packet.intact(self.checksum):
+            self.metrics.corrupted += 1
+            return
+        if self.done or not ack_packet.ack:
+            return
+        self.metrics.acks_received += 1
+
+        if self.eof_sent or (self.early_eof and self.eof_deadline is not None):
+            # un SACK atrasado puede traer seq_num == eof_seq sin confirmar el EOF
+            if not ack_packet.sack and ack_packet.seq_num == self.eof_seq:
+                logging.info("EOF acknowledged")
+                self._check_digest(ack_packet.data)
+                self.done = True
+                return
+            if self.eof_sent:
+                return
+
+        newly_acked = []
+        highest_offset = -1
+        if ack_packet.sack:
+            # ACK acumulativo: todo lo anterior a seq_num llego. Un SACK atrasado (reordenado)
+            # puede traer un acumulativo anterior a la base, que no confirma nada
+            in_flight = (self.next_seq - self.seq_base) % SEQ_MODULO
+            cumulative = (ack_packet.seq_num - self.seq_base) % SEQ_MODULO
+            seq = self.seq_base if cumulative <= in_flight else ack_packet.seq_num
+            while seq != ack_packet.seq_num and seq in self.buffer:
+                if seq not in self.acks_received:
+                    newly_acked.append(seq)
+                seq = (seq + 1) % SEQ_MODULO
+            for offset in ack_packet.sacked_offsets():
+                seq = (ack_packet.seq_num + 1 + offset) % SEQ_MODULO
+                highest_offset = offset
+                if seq in self.buffer and seq not in self.acks_received:
+                    newly_acked.append(seq)
+        else:
+            # ACK individual (receivers sin SACK)
+            seq = ack_packet.seq_num
+            if seq in self.buffer and seq not in self.acks_received:
+                newly_acked.append(seq)
+
+        if not newly_acked:
+            self._on_duplicate_ack(ack_packet, now)
+            return
+        self._acknowledge(newly_acked, ack_packet.seq_num, highest_offset, now)
+
+    def _acknowledge(self, newly_acked, cumulative_ack, highest_offset, now):
+        self.eof_tries = 0  # el receiver sigue ahi: los EOF adelantados sin respuesta no cuentan
+        for seq in newly_acked:
+            self.acks_received.add(seq)
+            self.timers.cancel(seq)
+            self.cc.on_ack(now, self.rtt.srtt)
+            if self.fec is not None:
+                self.fec.observe(False)
+        last = newly_acked[-1]
+        self.metrics.on_rtt_sample(
+            self.rtt.on_ack(self.send_times[last], now, last in self.retransmitted)
+        )
+
+        self._on_new_acks(newly_acked, cumulative_ack, highest_offset, now)
+        self._slide_window()
+
+    def _on_new_acks(self, newly_acked, cumulative_ack, highest_offset, now):
+        # los huecos que deja el SACK se recuperan uno por uno (ver go_back_n y adaptive)
+        self._fast_retransmit(cumulative_ack, highest_offset, now)
+
+    def _on_duplicate_ack(self, ack_packet, now):
+        # un ACK sin nada nuevo: Selective Repeat espera al SACK siguiente o al timer
+        pass
+
+    def _fast_retransmit(self, cumulative_ack, highest_offset, now):
+        # retransmision rapida de los huecos que el SACK deja al descubierto
+        sacked_above = 0
+        for offset in range(highest_offset + 1, -1, -1):
+            seq = (cumulative_ack + offset) % SEQ_MODULO
+            if seq in self.acks_received:
+                sacked_above += 1
+            elif (
+                seq in self.buffer
+                and sacked_above >= self.dup_threshold
+                and seq not in self.fast_retransmitted
+            ):
+                logging.debug(f"Packet {seq} reported missing, fast retransmit")
+                if seq_after_or_equal(seq, self.recovery_seq):
+                    self.cc.on_loss(now)
+                    self.recovery_seq = self.next_seq
+                self._retransmit(seq, now)
+                self.timers.schedule(seq, now + self.rtt.rto)
+                self.fast_retransmitted.add(seq)
+
+    def _slide_window(self):
+        while self.seq_base in self.acks_received:
+            del self.buffer[self.seq_base]
+            del self.send_times[self.seq_base]
+            self.acks_received.remove(self.seq_base)
+            self.retransmitted.discard(self.seq_base)
+            self.fast_retransmitted.discard(self.seq_base)
+            self.seq_base = (self.seq_base + 1) % SEQ_MODULO
+            logging.debug(f"Window base advanced to {self.seq_base}")
+
+    def _check_digest(self, received):
+        # el receiver devuelve el digest de lo que recibio (uno viejo no devuelve nada)
+        if not received:
+            return
+        self.metrics.digest_ok = bytes(received) == self.digest.digest()
+        if not self.metrics.digest_ok:
+            logging.error("Receiver reports a file digest mismatch: the file arrived corrupted")
+
+    def _send_eof(self, now):
+        eof = Package(self.eof_seq, False, self.digest.digest(), FLAG_EOF)
+        self._send(eof.to_bytes(self.checksum))
+        self.eof_deadline = now + self.rtt.rto
+
+    def _poll_early_eof(self, now):
+        # el EOF adelantado se repite cada RTO mientras queden paquetes sin confirmar; si el
+        # receiver ya termino solo contesta ese EOF
+        if self.eof_deadline is None:
+            logging.info(f"EOF reached, sending EOF packet with seq={self.eof_seq} ahead of ACKs")
+            self._send_eof(now)
+            return
+        if now < self.eof_deadline:
+            return
+        if self.eof_tries >= EOF_ACK_TRIES:
+            logging.warning("EOF was never acknowledged, giving up")
+            self.done = True
+            return
+        self.eof_tries += 1
+        self._send_eof(now)
+
+    def _poll_eof(self, now):
+        if now < self.eof_deadline:
+            return
+        if self.eof_tries >= EOF_ACK_TRIES:
+            logging.warning("EOF was never acknowledged, giving up")
+            self.done = True
+            return
+        self.eof_tries += 1
+        logging.warning(f"EOF ACK timeout, retrying ({self.eof_tries}/{EOF_ACK_TRIES})")
+        self.rtt.on_timeout()
+        self._send_eof(now)
+
+    def result(self):
+        metrics = self.metrics.finish(self.rtt.rto)
+        logging.info(
+            f"Transfer complete: {metrics.payload_bytes} bytes sent in {metrics.duration:.2f}s "
+            + f"({metrics.wire_bytes_sent} bytes on the wire)"
+        )
+        logging.info(
+            f"Retransmissions: {metrics.retransmissions}, "
+            + f"Transfer rate: {metrics.goodput / 1024:.2f} KB/s, "
+            + f"RTO: {self.rtt.rto:.3f}s, cwnd: {self.cc.window} ({self.cc.name})"
+        )
+        if self.compressor is not None:
+            logging.info(f"Compressed packets: {metrics.compressed} ({self.compressor.name})")
+        if self.fec is not None:
+            logging.info(f"FEC parity packets: {metrics.parity_sent}")
+        if self.pacer is not None and self.pacer.rate is not None:
+            logging.info(f"Pacing rate: {self.pacer.rate / 1024:.2f} KB/s")
+        if self.mapped is not None:
+            self.buffer.clear()
+            if not self.shared_mapping:
+                unmap_file(self.mapped)
+            self.mapped = None
+        return metrics
+
+
+class LegacySelectiveRepeatSender(SelectiveRepeatSender):
+    # sender para los peers originales (comando sin parametros): header de 2 bytes con
+    # seq_num modulo LEGACY_SEQ_MODULO, ventana de LEGACY_WINDOW_SIZE, chunks de CHUNK_SIZE y un
+    # ACK por paquete. Sin checksum, compresion, FEC ni digest, que el peer no conoce.
+    # Internamente los seq_num siguen siendo de 32 bits: con la ventana en la mitad del modulo
+    # cada ACK corresponde a un solo paquete en vuelo
+    def __init__(
+        self,
+        f,
+        send,
+        congestion=DEFAULT_CONGESTION_CONTROL,
+        pacing=True,
+        max_rate=None,
+        mapped=None,
+    ):
+        super().__init__(
+            f,
+            send,
+            LEGACY_WINDOW_SIZE,
+            congestion,
+            pacing=pacing,
+            max_rate=max_rate,
+            mapped=mapped,
+        )
+
+    def _next_datagram(self):
+        _, payload = super()._next_datagram()
+        return (bytes([self.next_seq % LEGACY_SEQ_MODULO, 0]), payload), payload
+
+    def _send_eof(self, now):
+        # el EOF original es un paquete vacio con ack=1
+        self._send(bytes([self.eof_seq % LEGACY_SEQ_MODULO, 1]))
+        self.eof_deadline = now + self.rtt.rto
+
+    def on_datagram(self, raw_data, now):
+        ack_packet = Package.from_bytes(raw_data)
+        self.metrics.on_receive(len(raw_data))
+        if self.done or ack_packet.version != LEGACY_VERSION or not ack_packet.ack:
+            return
+        self.metrics.acks_received += 1
+        ack = ack_packet.seq_num
+        if self.eof_sent:
+            if ack == self.eof_seq % LEGACY_SEQ_MODULO:
+                logging.info("EOF acknowledged")
+                self.done = True
+            return
+
+        # el receiver original confirma todo lo que recibe, tambien lo que ya estaba escrito
+        offset = (ack - self.seq_base) % LEGACY_SEQ_MODULO
+        seq = (self.seq_base + offset) % SEQ_MODULO
+        if offset >= self.window_size or seq not in self.buffer or seq in self.acks_received:
+            return
+        self._acknowledge([seq], seq, -1, now)
+
+    def _on_new_acks(self, newly_acked, cumulative_ack, highest_offset, now):
+        pass  # sin SACK no hay huecos a la vista: las perdidas se recuperan por timeout
+
+
+class SelectiveRepeatReceiver:
+    def __init__(
+        self,
+        f,
+        send,
+        window_size=WINDOW_SIZE,
+        file_size=None,
+        journal=None,
+        checksum=None,
+        compression=None,
+        fec=False,
+        chunk_size=CHUNK_SIZE,
+    ):
+        # file_size es donde termina lo que escribe este receiver: el tamaño del archivo,
+        # o el fin del rango en una transferencia en paralelo
+        self.f = f
+        self.send = send
+        self.chunk_size = chunk_size
+        self.checksum = checksum
+        self.compressor = ChunkCompressor(compression) if compression is not None else None
+        self.fec = ParityDecoder() if fec else None
+        # digest de lo recibido, en orden, para comparar con el que trae el EOF
+        self.digest = hashlib.new(DIGEST_ALGORITHM)
+        self.expected_digest = None
+        self.window_size = validate_window_size(window_size)
+        self.max_datagram_size = max_data_size(chunk_size)
+        # al retomar una transferencia el archivo ya viene posicionado en el offset acordado
+        self.offset = f.tell()
+        self.journal = journal
+
+        self.expected_base = 0
+        self.expected_index = 0  # numero de chunk sin modulo, para calcular offsets
+        self.seq_modulo = SEQ_MODULO
+        # Con el tamaño anunciado cada chunk se escribe en su offset al llegar y received solo
+        # guarda su largo: al llenarse el hueco el tramo se relee del archivo para el digest,
+        # que se calcula en orden. Sin tamaño received guarda una copia hasta llenar el hueco
+        self.writer = PresizedWriter(f, file_size) if file_size is not None else None
+        self.received = {}
+        self.eof_received = False
+        self.eof_seq = None
+        self.eof_packet = None
+        self.eof_ack = None
+        self.version = None
+        self.done = False
+
+        # ACK diferido
+        self.pending_acks = 0
+        self.ack_deadline = None
+
+        self.metrics = TransferMetrics("receiver")
+        self.last_log_time = time.time()
+
+    def next_deadline(self):
+        return None if self.done else self.ack_deadline
+
+    def poll(self, now):
+        if self.ack_deadline is not None and now >= self.ack_deadline:
+            self._send_sack()
+
+    def _send_sack(self):
+        offsets = (
+            (seq - self.expected_base - 1) % self.seq_modulo for seq in self.received
+        )
+        self._send_ack(Package.sack_ack(self.expected_base, offsets).to_bytes(self.checksum))
+        self.pending_acks = 0
+        self.ack_deadline = None
+        logging.debug(f"Sent SACK, cumulative ACK {self.expected_base}")
+
+    def on_datagram(self, raw_data, now):
+        packet = Package.from_bytes(raw_data)
+        self.metrics.on_receive(len(raw_data))
+        if not packet.intact(self.checksum):
+            # corrupto: no se escribe ni se confirma, el sender lo trata como perdido
+            self.metrics.corrupted += 1
+            logging.debug(f"Dropping corrupted packet {packet.seq_num}")
+            return
+        if packet.compressed:
+            data = None
+            if self.compressor is not None:
+                data = self.compressor.decompress(packet.data, self.chunk_size)
+            if data is None:
+                self.metrics.corrupted += 1
+                logging.debug(f"Dropping undecodable compressed packet {packet.seq_num}")
+                return
+            packet.data = data
+            self.metrics.compressed += 1
+        if self.done:
+            # el ACK del EOF se perdio y el sender lo reintenta
+            if packet.eof:
+                self._send_ack(self.eof_ack)
+            return
+
+        # El formato del primer paquete define el del resto de la transferencia
+        if self.version is None:
+            self.version = packet.version
+            if self.version == LEGACY_VERSION:
+                logging.info("Legacy sender detected, using 2-byte headers")
+                self.window_size = LEGACY_WINDOW_SIZE
+                self.seq_modulo = LEGACY_SEQ_MODULO
+
+        seq = packet.seq_num
+        if packet.parity:
+            self._on_parity(seq, packet.data, now)
+            return
+
+        if packet.eof:  # EOF detectado
+            self.expected_digest = bytes(packet.data) or None
+            logging.info(f"EOF packet received with seq={seq}")
+            self.eof_received = True
+            self.eof_seq = seq
+            self.eof_packet = packet
+            if seq == self.expected_base:
+                logging.info("All data received before EOF, transfer complete")
+                self._finish()
+            else:
+                # un sender con early_eof no espera los ACKs: el EOF se confirma con todo adentro
+                logging.info("Waiting for remaining packets before EOF")
+            return
+
+        self._on_data(seq, packet.data, now)
+
+    def _on_parity(self, block_start, payload, now):
+        if self.fec is None:
+            return
+        offset = (block_start - self.expected_base) % self.seq_modulo
+        if offset < self.window_size:
+            start = self.expected_index + offset
+        else:
+            start = self.expected_index - (self.seq_modulo - offset)
+        recovered = self.fec.recover(start, payload)
+        if recovered is None or recovered[0] < self.expected_index:
+            return
+        index, data = recovered
+        self.metrics.fec_recovered += 1
+        logging.debug(f"Packet {index} rebuilt from FEC parity")
+        seq = (self.expected_base + index - self.expected_index) % self.seq_modulo
+        self._on_data(seq, data, now)
+
+    def _on_data(self, seq, data, now):
+        legacy = self.version == LEGACY_VERSION
+        offset = (seq - self.expected_base) % self.seq_modulo
+        immediate = False
+        if offset == 0:
+            # en orden: se escribe directo desde el buffer de recepcion, sin copiar
+            # (con FEC se guarda una copia para reconstruir otros paquetes del bloque)
+            if self.fec is not None:
+                self.fec.remember(self.expected_index, bytes(data))
+            self._write(self.expected_index, data)
+            self.digest.update(data)
+            self._advance_base()
+            # si llena un hueco el sender tiene que enterarse ya
+            immediate = bool(self.received)
+        elif offset < self.window_size:
+            # Guardo cualquier paquete dentro de la ventana. El buffer de recepcion se
+            # reutiliza, asi que sin el archivo preasignado los paquetes fuera de orden se copian
+            if seq in self.received:
+                self.metrics.duplicates += 1
+            elif self.writer is not None:
+                self.received[seq] = len(data)
+                if self.fec is not None:
+                    self.fec.remember(self.expected_index + offset, bytes(data))
+                self._write(self.expected_index + offset, data)
+            else:
+                self.received[seq] = bytes(data)
+                if self.fec is not None:
+                    self.fec.remember(self.expected_index + offset, self.received[seq])
+            immediate = True
+        elif offset >= self.seq_modulo - self.window_size:
+            # Ya fue escrito: el ACK anterior se perdio, lo reenvio
+            self.metrics.duplicates += 1
+            immediate = True
+        else:
+            # Fuera de la ventana: no lo confirmo para que el sender lo reenvie
+            logging.debug(f"Dropping packet {seq} outside receive window")
+            return
+
+        if legacy:
+            self._send_ack(Package(seq, True, b"", 0, self.version).to_bytes(self.checksum))
+            logging.debug(f"Sent ACK for packet {seq}")
+
+        current_time = time.time()
+        if current_time - self.last_log_time > 2.0:
+            logging.info(
+                f"Received: {len(self.received)} packets, Base: {self.expected_base}, "
+                + f"Bytes: {self.metrics.payload_bytes}"
+            )
+            self.last_log_time = current_time
+
+        # escribe en orden; con el archivo preasignado ya esta escrito y el tramo que se
+        # completo entra al digest leyendolo del archivo
+        start = self.offset + self.expected_index * self.chunk_size
+        length = 0
+        while self.expected_base in self.received:
+            stored = self.received.pop(self.expected_base)
+            if self.writer is None:
+                self._write(self.expected_index, stored)
+                self.digest.update(stored)
+            else:
+                length += stored
+            self._advance_base()
+        if length:
+            self.writer.digest_range(self.digest, start, length)
+
+        if self.eof_received and self.expected_base == self.eof_seq:
+            logging.info("All data received and EOF processed")
+            self._finish()
+            return
+
+        if legacy:
+            return
+
+        self.pending_acks += 1
+        if immediate or self.pending_acks >= ACK_EVERY:
+            self._send_sack()
+        elif self.ack_deadline is None:
+            self.ack_deadline = now + ACK_DELAY
+
+    def _finish(self):
+        # el ACK del EOF sale con todo adentro y lleva el digest de lo recibido
+        received = self.digest.digest() if self.expected_digest is not None else b""
+        self.eof_ack = self.eof_packet.reply_ack(data=received).to_bytes(self.checksum)
+        self._send_ack(self.eof_ack)
+        self.done = True
+
+    def _send_ack(self, datagram):
+        self.metrics.on_send(len(datagram))
+        self.metrics.acks_sent += 1
+        self.send(datagram)
+
+    def _write(self, index, data):
+        self.metrics.payload_bytes += len(data)
+        if self.writer is not None:
+            self.writer.write_at(self.offset + index * self.chunk_size, data)
+        else:
+            self.f.write(data)
+
+    def _advance_base(self):
+        self.expected_base = (self.expected_base + 1) % self.seq_modulo
+        self.expected_index += 1
+        if self.fec is not None:
+            self.fec.forget_before(self.expected_index)
+        if self.journal is not None:
+            self.journal.record(self.f, self.offset + self.expected_index * self.chunk_size)
+        logging.debug(f"Base advanced to {self.expected_base}")
+
+    def result(self):
+        if self.writer is not None:
+            self.writer.finish()
+        metrics = self.metrics.finish()
+        if self.expected_digest is not None:
+            metrics.digest_ok = self.digest.digest() == self.expected_digest
+            if not metrics.digest_ok:
+                logging.error("File digest mismatch: received data differs from the sender's")
+        logging.info(
+            f"Reception complete: {metrics.payload_bytes} bytes received in {metrics.duration:.2f}s, "
+            + f"ACKs sent: {metrics.acks_sent}"
+        )
         logging.info(
-            f"Retransmissions: {retransmissions}, Transfer rate: {transfer_rate:.2f} KB/s"
+            f"Duplicate packets: {metrics.duplicates}, Corrupted packets: {metrics.corrupted}, "
+            + f"Transfer rate: {metrics.goodput / 1024:.2f} KB/s"
         )
-        return total_bytes, duration, retransmissions
-
-
-def selective_repeat_receive(sock, addr, filepath):
-
-    sock.settimeout(None)
-
-    expected_base = 0
-    received = {}
-    eof_received = False
-    eof_seq = None
-
-    total_bytes = 0
-    duplicate_packets = 0
-    start_time = time.time()
-    last_log_time = start_time
-
-    logging.info(f"Receiving file using Selective Repeat protocol: {filepath}")
-
-    with open(filepath, "wb") as f:
-        while True:
-            try:
-                raw_data, sender = sock.recvfrom(CHUNK_SIZE + HEADER_SIZE)
-                packet = Package.from_bytes(raw_data)
-                total_bytes += len(packet.to_bytes())
-
-                seq = packet.seq_num
-
-                # envia ack siempre
-                ack = Package(seq, True, b"")
-                sock.sendto(ack.to_bytes(), addr)
-                logging.debug(f"Sent ACK for packet {seq}")
-
-                if packet.data == b"":  # EOF detectado
-                    logging.info(f"EOF packet received with seq={seq}")
-                    eof_received = True
-                    eof_seq = seq
-                    if seq == expected_base:
-                        sock.sendto(Package(eof_seq, True, b"").to_bytes(), addr)
-                        logging.info("All data received before EOF, transfer complete")
-                        duration = time.time() - start_time
-                        transfer_rate = (
-                            total_bytes / (1024 * duration) if duration > 0 else 0
-                        )
-                        return total_bytes, duration, duplicate_packets
-                        break  # Ya se recibio todo lo anterior en orden
-                    else:
-                        logging.info("Waiting for remaining packets before EOF")
-                        continue
-
-                # Guardo cualquier paquete valido en received
-                if (seq - expected_base + SEQ_MODULO) % SEQ_MODULO < WINDOW_SIZE:
-                    if seq in received:
-                        duplicate_packets += 1
-                    received[seq] = packet.data
-
-                current_time = time.time()
-                if current_time - last_log_time > 2.0:
-                    logging.info(
-                        f"Received: {len(received)} packets, Base: {expected_base}, Bytes: {total_bytes}"
-                    )
-                    last_log_time = current_time
-
-                # escribe en orden
-                while expected_base in received:
-                    f.write(received[expected_base])
-                    del received[expected_base]
-                    expected_base = (expected_base + 1) % SEQ_MODULO
-                    logging.debug(f"Base advanced to {expected_base}")
-
-                    if eof_received and expected_base == eof_seq:
-                        logging.info("All data received and EOF processed")
-                        duration = time.time() - start_time
-                        transfer_rate = (
-                            total_bytes / (1024 * duration) if duration > 0 else 0
-                        )
-
-                        logging.info(
-                            f"Reception complete: {total_bytes} bytes received in {duration:.2f}s"
-                        )
-                        logging.info(
-                            f"Duplicate packets: {duplicate_packets}, Transfer rate: {transfer_rate:.2f} KB/s"
-                        )
-                        return total_bytes, duration, duplicate_packets
-
-            except socket.timeout:
-                continue
+        return metrics
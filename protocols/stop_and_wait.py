@@ -7,122 +7,279 @@
 # -> Cuando el paquete viene vacio significa EOF
 
 # Si ack=True y el seq_num coincide el fragmento llego bien
+# El EOF lleva el digest de lo enviado y su ACK el de lo recibido; con checksum negociado
+# los paquetes corruptos se descartan sin ACK y se retransmiten por timeout
+# Con compresion negociada cada chunk se comprime solo (FLAG_COMPRESSED) si achica
 
-import socket
-from protocols.package import Package
+from protocols.package import (
+    Package,
+    MAX_HEADER_SIZE,
+    FLAG_COMPRESSED,
+    FLAG_EOF,
+    LEGACY_VERSION,
+    pack_header,
+    read_datagram,
+)
+from protocols.rtt import RttEstimator
+from protocols.metrics import TransferMetrics
+from protocols.file_io import DIGEST_ALGORITHM, DIGEST_SIZE
+from protocols.compression import ChunkCompressor
+import hashlib
 import logging
-import time
-
-TIMEOUT = 0.15
-CHUCK_SIZE = 4096
-
-
-def stop_and_wait_send(sock, addr, filepath):
-    sock.settimeout(TIMEOUT)
-    seq_num = 0
-    retransmissions = 0
-    total_bytes = 0
-    start_time = time.time()
-    eof_sent = False
-
-    logging.info(f"Starting file transfer using Stop & Wait protocol: {filepath}")
-
-    with open(filepath, "rb") as f:
-        while True:
-            data = f.read(CHUCK_SIZE)
-            packet = Package(seq_num, False, data)
-
-            if data:
-                total_bytes += len(data)
-                logging.debug(f"Sending packet seq={seq_num}, size={len(data)} bytes")
-            else:
-                eof_sent = True
-                logging.info("Sending EOF packet")
-
-            attempts = 0
-            while True:
-                sock.sendto(packet.to_bytes(), addr)
-                attempts += 1
-
-                try:
-                    raw_ack, _ = sock.recvfrom(2)
-                    ack_packet = Package.from_bytes(raw_ack)
-                    if ack_packet.ack and ack_packet.seq_num == seq_num:
-                        if attempts > 1:
-                            logging.debug(
-                                f"ACK received for packet {seq_num} after {attempts} attempts"
-                            )
-                        seq_num = 1 - seq_num
-                        break
-                except socket.timeout:
-                    retransmissions += 1
-                    if attempts <= 3:
-                        logging.warning(
-                            f"Timeout occurred, retransmitting packet {seq_num} (attempt {attempts})"
-                        )
-                        continue
-                    elif eof_sent:
-                        break
-
-            if not data:
-                break
-
-    duration = time.time() - start_time
-    transfer_rate = total_bytes / (1024 * duration) if duration > 0 else 0
-
-    logging.info(f"Transfer complete: {total_bytes} bytes sent in {duration:.2f}s")
-    logging.info(
-        f"Retransmissions: {retransmissions}, Transfer rate: {transfer_rate:.2f} KB/s"
-    )
-    return total_bytes, duration, retransmissions
-
-
-def stop_and_wait_receive(sock, addr, filepath):
-    sock.settimeout(None)
-    expected_seq = 0
-    total_bytes = 0
-    duplicate_packets = 0
-    start_time = time.time()
-
-    logging.info(f"Receiving file using Stop & Wait protocol: {filepath}")
-
-    with open(filepath, "wb") as f:
-        while True:
-            # try:
-            raw_data, sender = sock.recvfrom(CHUCK_SIZE + 2)
-            packet = Package.from_bytes(raw_data)
-            data_len = len(packet.data) if packet.data else 0
-            logging.debug(f"Received packet seq={expected_seq}, size={data_len} bytes")
-
-            if packet.seq_num == expected_seq:
-                if not packet.data:
-                    logging.info("EOF packet received")
-                    ack = Package(expected_seq, True, b"")
-                    sock.sendto(ack.to_bytes(), addr)
-                    break
-
-                total_bytes += data_len
-
-                f.write(packet.data)
-                ack = Package(expected_seq, True, b"")
-                sock.sendto(ack.to_bytes(), addr)
-                expected_seq = 1 - expected_seq
-            else:
-                duplicate_packets += 1
-                logging.debug(
-                    f"Received duplicate packet seq={packet.seq_num}, expecting {expected_seq}"
+
+CHUNK_SIZE = 4096  # default si no se negocio otro (clientes y servers viejos)
+MAX_EOF_ATTEMPTS = 3
+
+
+class StopAndWaitSender:
+    def __init__(
+        self,
+        f,
+        send,
+        length=None,
+        checksum=None,
+        compression=None,
+        chunk_size=CHUNK_SIZE,
+        mapped=None,
+    ):
+        self.f = f
+        self.send = send
+        self.chunk_size = chunk_size
+        self.checksum = checksum
+        self.compressor = ChunkCompressor(compression) if compression is not None else None
+        self.digest = hashlib.new(DIGEST_ALGORITHM)
+        self.remaining = length  # con length se manda solo ese rango del archivo
+        # mapped: el archivo ya mapeado (compartido con otros senders), se lee de ahi
+        self.mapped = mapped
+        self.file_offset = f.tell()
+        self.max_datagram_size = MAX_HEADER_SIZE + DIGEST_SIZE  # el ACK del EOF trae un digest
+        self.rtt = RttEstimator()
+        self.seq_num = 0
+        self.packet = None
+        self.attempts = 0
+        self.send_time = None
+        self.deadline = None
+        self.eof_sent = False
+        self.done = False
+
+        self.metrics = TransferMetrics("sender")
+
+    def next_deadline(self):
+        return None if self.done else self.deadline
+
+    def poll(self, now):
+        if self.done:
+            return
+        if self.packet is None:
+            self._next_packet(now)
+        elif now >= self.deadline:
+            self.rtt.on_timeout()
+            if self.attempts <= MAX_EOF_ATTEMPTS:
+                logging.warning(
+                    f"Timeout occurred, retransmitting packet {self.seq_num} (attempt {self.attempts})"
                 )
-                expected_seq_alt = 1 - expected_seq
-                ack = Package(expected_seq_alt, True, b"")
-                sock.sendto(ack.to_bytes(), addr)
-        # except socket.timeout:
-        #    continue
-
-    duration = time.time() - start_time
-    transfer_rate = total_bytes / (1024 * duration) if duration > 0 else 0
-
-    logging.info(f"Reception complete: {total_bytes} bytes received in {duration:.2f}s")
-    logging.info(
-        f"Duplicate packets: {duplicate_packets}, Transfer rate: {transfer_rate:.2f} KB/s"
-    )
-    return total_bytes, duration, duplicate_packets
+            elif self.eof_sent:
+                # el receiver ya cerro y el ACK del EOF se perdio
+                self.done = True
+                return
+            self._transmit(now)
+
+    def _next_packet(self, now):
+        chunk_size = self.chunk_size
+        if self.remaining is not None:
+            chunk_size = min(chunk_size, self.remaining)
+        if self.mapped is None:
+            self.packet, size = read_datagram(self.f, self.seq_num, chunk_size, self.checksum)
+        else:
+            payload = self.mapped[self.file_offset : self.file_offset + chunk_size]
+            self.file_offset += len(payload)
+            self.packet = pack_header(self.seq_num, 0, self.checksum, payload) + payload
+            size = len(payload)
+        if self.remaining is not None:
+            self.remaining -= size
+
+        if size:
+            payload = self.packet[len(self.packet) - size :]
+            self.digest.update(payload)
+            compressed = None if self.compressor is None else self.compressor.compress(payload)
+            if compressed is not None:
+                header = pack_header(self.seq_num, FLAG_COMPRESSED, self.checksum, compressed)
+                self.packet = header + compressed
+                self.metrics.compressed += 1
+            self.metrics.payload_bytes += size
+            logging.debug(f"Sending packet seq={self.seq_num}, size={size} bytes")
+        else:
+            eof = Package(self.seq_num, False, self.digest.digest(), FLAG_EOF)
+            self.packet = eof.to_bytes(self.checksum)
+            self.eof_sent = True
+            logging.info("Sending EOF packet")
+
+        self.attempts = 0
+        self._transmit(now)
+
+    def _transmit(self, now):
+        self.metrics.on_send(len(self.packet), retransmission=self.attempts > 0)
+        self.metrics.sample_window(now, 1, 1)
+        self.send(self.packet)
+        self.send_time = now
+        self.deadline = now + self.rtt.rto
+        self.attempts += 1
+
+    def on_datagram(self, raw_data, now):
+        ack_packet = Package.from_bytes(raw_data)
+        self.metrics.on_receive(len(raw_data))
+        if not ack_packet.intact(self.checksum):
+            self.metrics.corrupted += 1
+            return
+        if self.done or not (ack_packet.ack and ack_packet.seq_num == self.seq_num):
+            return
+
+        self.metrics.acks_received += 1
+        self.metrics.on_rtt_sample(self.rtt.on_ack(self.send_time, now, self.attempts > 1))
+        if self.attempts > 1:
+            logging.debug(
+                f"ACK received for packet {self.seq_num} after {self.attempts} attempts"
+            )
+        self.seq_num = 1 - self.seq_num
+        if self.eof_sent:
+            self._check_digest(ack_packet.data)
+            self.done = True
+        else:
+            self._next_packet(now)
+
+    def _check_digest(self, received):
+        # el receiver devuelve el digest de lo que recibio (uno viejo no devuelve nada)
+        if not received:
+            return
+        self.metrics.digest_ok = bytes(received) == self.digest.digest()
+        if not self.metrics.digest_ok:
+            logging.error("Receiver reports a file digest mismatch: the file arrived corrupted")
+
+    def result(self):
+        metrics = self.metrics.finish(self.rtt.rto)
+        logging.info(
+            f"Transfer complete: {metrics.payload_bytes} bytes sent in {metrics.duration:.2f}s "
+            + f"({metrics.wire_bytes_sent} bytes on the wire)"
+        )
+        logging.info(
+            f"Retransmissions: {metrics.retransmissions}, "
+            + f"Transfer rate: {metrics.goodput / 1024:.2f} KB/s, RTO: {self.rtt.rto:.3f}s"
+        )
+        return metrics
+
+
+class LegacyStopAndWaitSender(StopAndWaitSender):
+    # sender para los peers originales (comando sin parametros): header de 2 bytes, chunks de
+    # CHUNK_SIZE y el EOF es un paquete vacio, sin digest
+    def _next_packet(self, now):
+        data = self.f.read(self.chunk_size)
+        self.packet = Package(self.seq_num, False, data, 0, LEGACY_VERSION).to_bytes()
+        if data:
+            self.metrics.payload_bytes += len(data)
+            logging.debug(f"Sending packet seq={self.seq_num}, size={len(data)} bytes")
+        else:
+            self.eof_sent = True
+            logging.info("Sending EOF packet")
+        self.attempts = 0
+        self._transmit(now)
+
+
+class StopAndWaitReceiver:
+    def __init__(
+        self, f, send, journal=None, checksum=None, compression=None, chunk_size=CHUNK_SIZE
+    ):
+        self.f = f
+        self.send = send
+        self.chunk_size = chunk_size
+        self.checksum = checksum
+        self.compressor = ChunkCompressor(compression) if compression is not None else None
+        self.digest = hashlib.new(DIGEST_ALGORITHM)
+        self.expected_digest = None
+        self.max_datagram_size = chunk_size + MAX_HEADER_SIZE
+        self.offset = f.tell()  # distinto de 0 al retomar una transferencia
+        self.journal = journal
+        self.expected_seq = 0
+        self.eof_ack = None
+        self.done = False
+
+        self.metrics = TransferMetrics("receiver")
+
+    def next_deadline(self):
+        return None
+
+    def poll(self, now):
+        pass
+
+    def on_datagram(self, raw_data, now):
+        packet = Package.from_bytes(raw_data)
+        self.metrics.on_receive(len(raw_data))
+        if not packet.intact(self.checksum):
+            self.metrics.corrupted += 1
+            logging.debug(f"Dropping corrupted packet {packet.seq_num}")
+            return
+        if packet.compressed:
+            data = None
+            if self.compressor is not None:
+                data = self.compressor.decompress(packet.data, self.chunk_size)
+            if data is None:
+                self.metrics.corrupted += 1
+                logging.debug(f"Dropping undecodable compressed packet {packet.seq_num}")
+                return
+            packet.data = data
+            self.metrics.compressed += 1
+        if self.done:
+            # el ACK del EOF se perdio y el sender lo reintenta
+            if packet.eof:
+                self._send_ack(self.eof_ack)
+            return
+
+        data_len = len(packet.data) if packet.data else 0
+        logging.debug(f"Received packet seq={self.expected_seq}, size={data_len} bytes")
+
+        if packet.seq_num == self.expected_seq:
+            if packet.eof:
+                logging.info("EOF packet received")
+                self.expected_digest = bytes(packet.data) or None
+                # el ACK lleva el digest de lo recibido para que el sender lo compare
+                received = self.digest.digest() if self.expected_digest is not None else b""
+                self.eof_ack = packet.reply_ack(data=received)
+                self._send_ack(self.eof_ack)
+                self.done = True
+                return
+
+            self.metrics.payload_bytes += data_len
+
+            self.f.write(packet.data)
+            self.digest.update(packet.data)
+            if self.journal is not None:
+                self.journal.record(self.f, self.offset + self.metrics.payload_bytes)
+            self._send_ack(packet.reply_ack())
+            self.expected_seq = 1 - self.expected_seq
+        else:
+            self.metrics.duplicates += 1
+            logging.debug(
+                f"Received duplicate packet seq={packet.seq_num}, expecting {self.expected_seq}"
+            )
+            expected_seq_alt = 1 - self.expected_seq
+            self._send_ack(packet.reply_ack(expected_seq_alt))
+
+    def _send_ack(self, packet):
+        datagram = packet.to_bytes(self.checksum)
+        self.metrics.on_send(len(datagram))
+        self.metrics.acks_sent += 1
+        self.send(datagram)
+
+    def result(self):
+        metrics = self.metrics.finish()
+        if self.expected_digest is not None:
+            metrics.digest_ok = self.digest.digest() == self.expected_digest
+            if not metrics.digest_ok:
+                logging.error("File digest mismatch: received data differs from the sender's")
+        logging.info(
+            f"Reception complete: {metrics.payload_bytes} bytes received in {metrics.duration:.2f}s"
+        )
+        logging.info(
+            f"Duplicate packets: {metrics.duplicates}, Corrupted packets: {metrics.corrupted}, "
+            + f"Transfer rate: {metrics.goodput / 1024:.2f} KB/s"
+        )
+        return metrics
@@ -0,0 +1,60 @@
+import heapq
+
+# Timers de retransmision sobre un min-heap
+# -> schedule/cancel en O(log n), sin recorrer todos los paquetes en vuelo
+# -> cancelar o reprogramar deja entradas viejas en el heap que se descartan al llegar al tope
+# -> los deadlines se expresan con time.monotonic()
+
+COMPACT_FACTOR = 4
+COMPACT_MIN_SIZE = 64
+
+
+class RetransmissionTimers:
+    def __init__(self):
+        self._heap = []
+        self._deadlines = {}
+
+    def __len__(self):
+        return len(self._deadlines)
+
+    def __contains__(self, seq):
+        return seq in self._deadlines
+
+    def schedule(self, seq, deadline):
+        self._deadlines[seq] = deadline
+        heapq.heappush(self._heap, (deadline, seq))
+        self._maybe_compact()
+
+    def cancel(self, seq):
+        self._deadlines.pop(seq, None)
+
+    def clear(self):
+        self._heap.clear()
+        self._deadlines.clear()
+
+    def next_deadline(self):
+        self._discard_stale()
+        return self._heap[0][0] if self._heap else None
+
+    def pop_expired(self, now):
+        expired = []
+        while True:
+            self._discard_stale()
+            if not self._heap or self._heap[0][0] > now:
+                return expired
+            _, seq = heapq.heappop(self._heap)
+            del self._deadlines[seq]
+            expired.append(seq)
+
+    def _discard_stale(self):
+        heap = self._heap
+        while heap and self._deadlines.get(heap[0][1]) != heap[0][0]:
+            heapq.heappop(heap)
+
+    def _maybe_compact(self):
+        # evita que el heap crezca sin limite con entradas canceladas
+        if len(self._heap) > COMPACT_MIN_SIZE and len(self._heap) > COMPACT_FACTOR * len(
+            self._deadlines
+        ):
+            self._heap = [(deadline, seq) for seq, deadline in self._deadlines.items()]
+            heapq.heapify(self._heap)
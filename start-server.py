@@ -1,11 +1,18 @@
 from lib.args_parser import parse_args_server
 from lib.server import run_server
+from lib.async_server import run_async_server
+from lib.workers import run_workers
 
 
 def main():
     args = parse_args_server()
     try:
-        run_server(args)
+        if args.workers > 1:
+            run_workers(args)
+        elif args.mode == "async":
+            run_async_server(args)
+        else:
+            run_server(args)
     except KeyboardInterrupt:
         print("\nServer stopped by user.")
 
@@ -0,0 +1,129 @@
+import io
+import os
+import shutil
+import socket
+import subprocess
+import sys
+import tarfile
+import tempfile
+import unittest
+
+# Interoperabilidad con la version original (el commit baseline del repo):
+# -> cliente original contra los dos servers nuevos: manda los comandos sin parametros y
+#    espera las respuestas y el header de 2 bytes de siempre
+# -> cliente nuevo contra el server original: tiene que darse cuenta por el HI_ACK sin
+#    parametros y no mandarle nada que no conozca
+# Cada caso sube un archivo y lo vuelve a bajar con saw y con sr, en procesos aparte y por
+# loopback. El original sale de git: sin git o sin el commit el test se saltea.
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BASELINE = os.environ.get("INTEROP_BASELINE", "b439ec0")
+HOST = "127.0.0.1"
+FILE_SIZE = 300 * 1024  # varias vueltas del seq_num legacy (modulo 16, chunks de 4096)
+TRANSFER_TIMEOUT = 30
+
+
+def baseline_checkout(destination):
+    # el arbol del commit original, o None si no se puede sacar de git
+    try:
+        archive = subprocess.run(
+            ["git", "archive", "--format=tar", BASELINE],
+            cwd=ROOT,
+            capture_output=True,
+            check=True,
+        ).stdout
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    with tarfile.open(fileobj=io.BytesIO(archive)) as tar:
+        tar.extractall(destination)
+    return destination
+
+
+def free_port():
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+        sock.bind((HOST, 0))
+        return sock.getsockname()[1]
+
+
+class InteropTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.tmp = tempfile.mkdtemp(prefix="interop-")
+        cls.baseline = baseline_checkout(os.path.join(cls.tmp, "baseline"))
+        if cls.baseline is None:
+            shutil.rmtree(cls.tmp)
+            raise unittest.SkipTest(f"Baseline commit {BASELINE} not available")
+        cls.source = os.path.join(cls.tmp, "source.bin")
+        with open(cls.source, "wb") as f:
+            f.write(os.urandom(FILE_SIZE))
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.tmp, ignore_errors=True)
+
+    def start_server(self, root, protocol, storage, *extra):
+        port = free_port()
+        server = subprocess.Popen(
+            [sys.executable, "-u", "start-server.py", "-H", HOST, "-p", str(port)]
+            + ["-s", storage, "-r", protocol, *extra],
+            cwd=root,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+            text=True,
+        )
+        self.addCleanup(self.stop_server, server)
+        # los dos servers avisan cuando ya tienen el socket
+        self.assertIn("Server started", server.stdout.readline())
+        return port
+
+    @staticmethod
+    def stop_server(server):
+        server.kill()
+        server.wait()
+        server.stdout.close()
+
+    def run_client(self, root, script, *args):
+        return subprocess.run(
+            [sys.executable, script, "-H", HOST, *args],
+            cwd=root,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+            timeout=TRANSFER_TIMEOUT,
+        ).returncode
+
+    def assert_round_trip(self, server_root, client_root, protocol, *server_args, client=None):
+        # client: el motor del cliente, si no es el mismo que el del server
+        storage = tempfile.mkdtemp(dir=self.tmp)
+        downloads = tempfile.mkdtemp(dir=self.tmp)
+        port = self.start_server(server_root, protocol, storage, *server_args)
+        common = ["-p", str(port), "-n", "f.bin", "-r", client or protocol]
+
+        self.assertEqual(self.run_client(client_root, "upload.py", *common, "-s", self.source), 0)
+        self.assert_same_file(os.path.join(storage, "f.bin"))
+        self.assertEqual(self.run_client(client_root, "download.py", *common, "-d", downloads), 0)
+        self.assert_same_file(os.path.join(downloads, "f.bin"))
+
+    def assert_same_file(self, path):
+        with open(self.source, "rb") as expected, open(path, "rb") as received:
+            self.assertTrue(expected.read() == received.read(), f"{path} differs from the source")
+
+    def test_baseline_client_threads_server(self):
+        for protocol in ("saw", "sr"):
+            with self.subTest(protocol=protocol):
+                self.assert_round_trip(ROOT, self.baseline, protocol, "--mode", "threads")
+
+    def test_baseline_client_async_server(self):
+        for protocol in ("saw", "sr"):
+            with self.subTest(protocol=protocol):
+                self.assert_round_trip(ROOT, self.baseline, protocol, "--mode", "async")
+
+    def test_client_baseline_server(self):
+        for protocol in ("saw", "sr", "gbn", "adaptive"):
+            with self.subTest(protocol=protocol):
+                # el server original solo tiene saw y sr: los motores con ventana usan sr
+                server_protocol = "saw" if protocol == "saw" else "sr"
+                self.assert_round_trip(self.baseline, ROOT, server_protocol, client=protocol)
+
+
+if __name__ == "__main__":
+    unittest.main()
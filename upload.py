@@ -1,10 +1,23 @@
+import sys
 from lib.args_parser import parse_args_client
+from lib.batch import is_batch, run_batch
 from lib.client import run_client
+from lib.delta import run_delta
+from lib.parallel import run_parallel
 
 
 def main():
     args = parse_args_client("upload")
-    run_client(args, "upload")
+    if is_batch(args):
+        ok = run_batch(args, "upload")
+    elif args.streams > 1:
+        ok = run_parallel(args, "upload")
+    elif args.delta:
+        ok = run_delta(args, "upload")
+    else:
+        ok = run_client(args, "upload")
+    if not ok:
+        sys.exit(1)
 
 
 if __name__ == "__main__":